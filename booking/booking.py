@@ -1,8 +1,20 @@
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, render_template, request, jsonify, make_response, g
 import requests
-import json, time
+import json, time, os, sys, sqlite3, threading, marshal, gzip, zlib, bisect, collections, itertools, heapq, array, datetime
+from contextlib import contextmanager
 from flask_cors import CORS
 
+# module commun aux services (common/), à côté des dossiers des services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import common
+from common import profiling
+from common.metrics import METRICS, Counter, ADMIN_CACHE_TOTAL, STORE_WRITE_SECONDS
+from common.tracing import span
+from common.fragments import encode, json_response, join_fragments, FragmentCache, ChangeLog
+from common.snapshot import write_snapshot, read_snapshot, gc_paused
+from common.client import ServiceClient, IdFollower, breaker_metrics
+from common.server import serve_prefork
+
 app = Flask(__name__)
 
 CORS(app)
@@ -19,14 +31,1358 @@ CACHE_TTL = 60 # secondes de validité du cache pour is_admin
 # format : { "user_id": {"is_admin": True/False, "timestamp": 123456789} }
 user_admin_cache = {}
 
-with open('{}/databases/bookings.json'.format("."), "r") as jsf:
-    bookings = json.load(jsf)["bookings"]
+# infrastructure commune (common/) : métriques, traçage, profilage, contrôle d'admission,
+# compression des réponses et délais de bout en bout
+common.install(app, "booking", rate_limits={"get_user_booking_details": (5, 10)}, deadlines={"get_user_booking_details": 10})
+
+WORKERS = int(os.environ.get("BOOKING_WORKERS", 1)) # > 1 : mode production multi-process (état partagé en SQLite)
+# backend de stockage : "json" (défaut, dev) ou "sqlite" (WAL, indexé, seul accepté avec plusieurs workers)
+STORAGE = os.environ.get("BOOKING_STORAGE", "sqlite" if WORKERS > 1 else "json")
+JSON_PATH = '{}/databases/bookings.json'.format(".")
+PARTITIONS = int(os.environ.get("BOOKING_PARTITIONS", 1)) # > 1 : réservations réparties par hash de userid (tools/rebalance_bookings.py)
+CHANGES_KEPT = 10000 # mutations gardées dans le journal partagé entre workers
+CHANGES_PRUNE_EVERY = 1000
+SQLITE_PATH = os.environ.get("BOOKING_SQLITE_PATH", '{}/databases/bookings.db'.format("."))
+
+# taille du journal en mémoire des dernières mutations, servi par /<user_id>/bookings/changes?since=N
+CHANGELOG_SIZE = int(os.environ.get("BOOKING_CHANGELOG_SIZE", 10000))
+
+# format des snapshots binaires (common.snapshot) écrits à côté du fichier JSON
+SNAPSHOT_MAGIC = b"SNP2" # format 2 : réservations en représentation compacte (UserBookings.pack)
+
+# représentation compacte en mémoire : films internés en petits entiers, dates en ordinaux de jour
+def day_ordinal(date):
+    if len(date) == 8 and date.isascii() and date.isdigit():
+        try:
+            return datetime.date(int(date[:4]), int(date[4:6]), int(date[6:])).toordinal()
+        except ValueError:
+            return None
+    return None
+
+class Codec:
+    """
+    Compact codes of movie ids and dates, decoded back only at the JSON boundary.
+
+    A movie id becomes its rank in self.movies: 4 bytes in an array instead of
+    a 36-character string per booking. A YYYYMMDD date becomes its day ordinal
+    (datetime.date.toordinal); any other date string is interned in
+    self.others and coded -1 - rank, so every value round-trips unchanged.
+
+    Args:
+        movies (list): Movie ids already interned (read from a snapshot).
+        others (list): Dates already interned that are not YYYYMMDD.
+    """
+    def __init__(self, movies=(), others=()):
+        self.lock = threading.Lock()
+        self.movies = list(movies)
+        self.movie_codes = {m: i for i, m in enumerate(self.movies)}
+        self.others = list(others)
+        # dates déjà rencontrées, dans les deux sens : bornées par le nombre de dates distinctes
+        self.date_codes = {d: -1 - i for i, d in enumerate(self.others)}
+        self.date_strs = {code: d for d, code in self.date_codes.items()}
+
+    def movie(self, movie_id):
+        code = self.movie_codes.get(movie_id)
+        if code is None:
+            with self.lock:
+                code = self.movie_codes.get(movie_id)
+                if code is None:
+                    # ajouté à la table avant d'être publié : un code visible est toujours décodable
+                    self.movies.append(movie_id)
+                    code = self.movie_codes[movie_id] = len(self.movies) - 1
+        return code
+
+    # code d'un film sans l'interner (None : jamais vu, donc réservé nulle part)
+    def find_movie(self, movie_id):
+        return self.movie_codes.get(movie_id)
+
+    def movie_id(self, code):
+        return self.movies[code]
+
+    def date(self, date):
+        code = self.date_codes.get(date)
+        if code is None:
+            date = str(date)
+            with self.lock:
+                code = self.date_codes.get(date)
+                if code is None:
+                    code = day_ordinal(date)
+                    if code is None:
+                        self.others.append(date)
+                        code = -len(self.others)
+                    self.date_strs[code] = date
+                    self.date_codes[date] = code
+        return code
+
+    # code d'une date sans l'interner (None : date hors calendrier jamais vue)
+    def find_date(self, date):
+        code = self.date_codes.get(date)
+        return code if code is not None else day_ordinal(str(date))
+
+    def date_str(self, code):
+        date = self.date_strs.get(code)
+        if date is None:
+            day = datetime.date.fromordinal(code)
+            date = self.date_strs[code] = "%04d%02d%02d" % (day.year, day.month, day.day)
+        return date
+
+class UserBookings:
+    """
+    Bookings of one user in compact form (see Codec).
+
+    dates holds the date codes; movies holds, at the same position, the
+    array of the movie codes booked that date.
+    """
+    __slots__ = ("userid", "dates", "movies")
+
+    def __init__(self, userid, dates=None, movies=None):
+        self.userid = userid
+        self.dates = dates if dates is not None else array.array("i")
+        self.movies = movies if movies is not None else []
+
+    @classmethod
+    def from_dicts(cls, records, codec):
+        """
+        Encode every record of bookings.json in a single pass.
+
+        Codes already in the codec tables are read directly; only a movie id
+        or date seen for the first time goes through Codec.movie / Codec.date.
+
+        Args:
+            records (list): Records {"userid", "dates": [{"date", "movies"}]} as parsed.
+            codec (Codec): Codec filled as new values are met.
+
+        Returns:
+            list of UserBookings: The bookings, in the order of the records.
+        """
+        movie_codes, date_codes = codec.movie_codes, codec.date_codes
+        movie, date = codec.movie, codec.date
+        bookings = []
+        for b in records:
+            days = b["dates"]
+            dates = array.array("i", [date_codes[d["date"]] if d["date"] in date_codes else date(d["date"]) for d in days])
+            movies = [array.array("I", [movie_codes[m] if m in movie_codes else movie(m) for m in d["movies"]])
+                      for d in days]
+            bookings.append(cls(b["userid"], dates, movies))
+        return bookings
+
+    def to_dict(self, codec):
+        return {"userid": self.userid,
+                "dates": [{"date": codec.date_str(date), "movies": [codec.movie_id(m) for m in movies]}
+                          for date, movies in zip(self.dates, self.movies)]}
+
+    def count(self):
+        return sum(len(movies) for movies in self.movies)
+
+    # forme du snapshot : (userid, dates, films par date, films à la suite), tableaux en octets
+    def pack(self):
+        return (self.userid, self.dates.tobytes(), array.array("I", map(len, self.movies)).tobytes(),
+                b"".join(map(array.array.tobytes, self.movies)))
+
+    @classmethod
+    def unpack(cls, row):
+        userid, dates, counts, flat = row
+        b = cls(userid)
+        b.dates.frombytes(dates)
+        movies = array.array("I")
+        movies.frombytes(flat)
+        counts_array = array.array("I")
+        counts_array.frombytes(counts)
+        pos = 0
+        for n in counts_array:
+            b.movies.append(movies[pos:pos + n])
+            pos += n
+        return b
+
+# archive froide : réservations des dates passées, hors mémoire, un fichier gzip NDJSON par mois
+ARCHIVE_DAYS = os.environ.get("BOOKING_ARCHIVE_DAYS", "") # dates plus vieilles que N jours archivées ; vide = pas d'archivage
+ARCHIVE_DIR = '{}/databases/archive'.format(".")
+ARCHIVE_BUCKETS = 256 # groupes d'utilisateurs d'un mois, compressés séparément
+
+def archive_horizon():
+    """
+    Returns:
+        int or None: Day ordinal of the oldest date kept hot, None if archiving is disabled.
+    """
+    if not ARCHIVE_DAYS:
+        return None
+    return datetime.date.today().toordinal() - int(ARCHIVE_DAYS)
+
+class BookingArchive:
+    """
+    Append-only archive of the bookings of past dates, one gzip NDJSON file per month.
+
+    Each append adds to bookings.<YYYYMM>.ndjson.gz one gzip member of
+    {"userid", "date", "movies"} lines per bucket of users (crc32(userid) %
+    ARCHIVE_BUCKETS); the last line of a (userid, date) wins, and "movies":
+    null is a tombstone (booking brought back hot, or deleted). bookings.index
+    keeps the (offset, size) of the members of each month and bucket, so the
+    bookings of one user only decompress the few members of its bucket, and
+    bookings.users lists the months of each user, so the users without
+    archived dates never open the archive. The files stay plain multi-member
+    gzip, readable as a whole by scan().
+
+    Args:
+        directory (str): Directory of the archive files.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self._index = None # mois -> {groupe: [(offset, taille)]}, lu au premier accès
+        self._users = None # userid -> mois archivés, lu au premier accès
+        self.generation = 0 # incrémenté à chaque ajout : invalide les encodages de l'archive gardés en cache
+
+    def path(self, month):
+        return os.path.join(self.directory, "bookings.%d.ndjson.gz" % month)
+
+    @staticmethod
+    def bucket(userid):
+        return zlib.crc32(userid.encode()) % ARCHIVE_BUCKETS
+
+    def months(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[9:-10]) for n in names
+                      if n.startswith("bookings.") and n.endswith(".ndjson.gz") and n[9:-10].isdigit())
+
+    @property
+    def index(self):
+        with self.lock:
+            if self._index is None:
+                try:
+                    with open(os.path.join(self.directory, "bookings.index"), "rb") as f:
+                        self._index = marshal.load(f)
+                except (OSError, EOFError, ValueError, TypeError):
+                    # index absent ou illisible : reconstruit en parcourant les membres gzip
+                    self._index = {month: self.members(month) for month in self.months()}
+                    if self._index:
+                        self.write_index()
+            return self._index
+
+    def write_index(self):
+        with open(os.path.join(self.directory, "bookings.index.tmp"), "wb") as f:
+            marshal.dump(self._index, f)
+        os.replace(os.path.join(self.directory, "bookings.index.tmp"), os.path.join(self.directory, "bookings.index"))
+
+    @property
+    def users(self):
+        with self.lock:
+            if self._users is None:
+                try:
+                    with open(os.path.join(self.directory, "bookings.users"), "rb") as f:
+                        self._users = marshal.load(f)
+                except (OSError, EOFError, ValueError, TypeError):
+                    # index absent ou illisible : reconstruit depuis les fichiers du mois
+                    self._users = {}
+                    for month in self.months():
+                        for userid in self.decode(month):
+                            self._users[userid] = self._users.get(userid, ()) + (month,)
+                    if self._users:
+                        self.write_users()
+            return self._users
+
+    def write_users(self):
+        with open(os.path.join(self.directory, "bookings.users.tmp"), "wb") as f:
+            marshal.dump(self._users, f)
+        os.replace(os.path.join(self.directory, "bookings.users.tmp"), os.path.join(self.directory, "bookings.users"))
+
+    # vrai si l'utilisateur a des dates archivées ; un mois vidé par des tombstones peut rester listé
+    def holds(self, userid):
+        return userid in self.users
+
+    def members(self, month):
+        # (offset, taille) des membres gzip d'un mois par groupe, le groupe lu sur la première ligne
+        buckets = {}
+        with open(self.path(month), "rb") as f:
+            data = memoryview(f.read())
+        offset = 0
+        while offset < len(data):
+            d = zlib.decompressobj(31)
+            lines = d.decompress(data[offset:])
+            size = len(data) - offset - len(d.unused_data)
+            if lines:
+                bucket = self.bucket(json.loads(lines[:lines.index(b"\n")])["userid"])
+                buckets.setdefault(bucket, []).append((offset, size))
+            offset += size
+        return buckets
+
+    @staticmethod
+    def apply(records, lines):
+        for r in lines:
+            dates = records.setdefault(r["userid"], {})
+            if r["movies"] is None:
+                dates.pop(r["date"], None)
+                if not dates:
+                    del records[r["userid"]]
+            else:
+                dates[r["date"]] = r["movies"]
+
+    # réservations d'un mois, d'un utilisateur seulement si userid est donné
+    def decode(self, month, userid=None):
+        records = {}
+        try:
+            if userid is None:
+                with gzip.open(self.path(month), "rt") as f:
+                    self.apply(records, map(json.loads, f))
+                return records
+            members = self.index.get(month, {}).get(self.bucket(userid), ())
+            if not members:
+                return records
+            # filtre sur le texte avant le décodage JSON des seules lignes de l'utilisateur
+            key = b'"userid":' + json.dumps(userid).encode() + b"}"
+            with open(self.path(month), "rb") as f:
+                for offset, size in members:
+                    f.seek(offset)
+                    lines = zlib.decompress(f.read(size), 31).splitlines()
+                    self.apply(records, (json.loads(line) for line in lines if key in line))
+        except FileNotFoundError:
+            pass
+        return records
+
+    def append(self, lines):
+        """
+        Append booking lines (tombstones included), one gzip member per month and bucket touched.
+
+        Args:
+            lines (list of dict): {"userid", "date", "movies"} records, "movies" None for a tombstone.
+        """
+        by_month = {}
+        for r in lines:
+            by_month.setdefault(int(r["date"][:6]), {}).setdefault(self.bucket(r["userid"]), []).append(r)
+        with self.lock:
+            index, users = self.index, self.users
+            os.makedirs(self.directory, exist_ok=True)
+            for month, buckets in sorted(by_month.items()):
+                members = index.setdefault(month, {})
+                with open(self.path(month), "ab") as f:
+                    for bucket, records in sorted(buckets.items()):
+                        offset = f.tell()
+                        f.write(gzip.compress(b"".join(encode(r) + b"\n" for r in records), 6, mtime=0))
+                        members.setdefault(bucket, []).append((offset, f.tell() - offset))
+                        # l'index peut garder un mois vidé par des tombstones : une lecture inutile, jamais une perte
+                        for userid in {r["userid"] for r in records if r["movies"] is not None}:
+                            if month not in users.get(userid, ()):
+                                users[userid] = users.get(userid, ()) + (month,)
+            self.generation += 1
+            self.write_index()
+            self.write_users()
+
+    def dates_of(self, userid):
+        """
+        Returns:
+            list of dict: The archived {"date", "movies"} of the user, oldest month first.
+        """
+        with self.lock:
+            return [{"date": date, "movies": movies}
+                    for month in sorted(self.users.get(userid, ()))
+                    for date, movies in self.decode(month, userid).get(userid, {}).items()]
+
+    def movies(self, userid, date):
+        """
+        Returns:
+            list or None: The archived movies of the user at that date, None if none are archived.
+        """
+        date = str(date)
+        if day_ordinal(date) is None:
+            return None # seules les dates du calendrier sont archivées
+        with self.lock:
+            if int(date[:6]) not in self.users.get(userid, ()):
+                return None
+            return self.decode(int(date[:6]), userid).get(userid, {}).get(date)
+
+    def forget(self, userid):
+        with self.lock:
+            dates = self.dates_of(userid)
+            if dates:
+                self.append([{"userid": userid, "date": d["date"], "movies": None} for d in dates])
+            if self.users.pop(userid, None) is not None:
+                self.write_users()
+            return bool(dates)
+
+    def scan(self):
+        """
+        Yield every archived booking as {"userid", "dates"}, one record per user and month.
+        """
+        for month in self.months():
+            for userid, dates in self.decode(month).items():
+                yield {"userid": userid, "dates": [{"date": d, "movies": m} for d, m in dates.items()]}
+
+archive = BookingArchive(ARCHIVE_DIR)
+
+# fragment JSON d'un utilisateur à partir de ses dates déjà encodées (clés triées, comme encode)
+def user_fragment(userid, dates):
+    return b'{"dates":' + join_fragments(dates) + b',"userid":' + encode(userid) + b"}"
+
+def archived_bookings(partition=0, count=1):
+    # réservations archivées d'une partition, une entrée par utilisateur et par mois
+    return (b for b in archive.scan() if count == 1 or partition_of(b["userid"], count) == partition)
+
+class JsonStore:
+    """
+    Bookings kept in memory and dumped to bookings.json on every mutation.
+
+    In memory each user is a UserBookings (movie and date codes in arrays);
+    records are converted to and from dicts only when read or written as JSON.
+    Dates older than the archiving horizon move to the archive; reading a
+    user merges them back, and a mutation of an archived date first brings
+    it back in memory.
+
+    Args:
+        path (str): Path of the JSON file.
+        partition (tuple): (index, count) of this store when the bookings are partitioned.
+    """
+    def __init__(self, path, partition=(0, 1)):
+        self.path = path
+        self.partition = partition
+        self.horizon = None # horizon du dernier archivage
+        self.snapshot_path = os.path.splitext(path)[0] + ".snap"
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock() # une mutation (et sa réécriture du fichier) à la fois
+        self.loaded = threading.Event()
+        self.codec = Codec()
+        self._bookings = None
+        self._index = None
+        self.fragments = FragmentCache()
+        self._archived = None # (génération de l'archive, userid -> dates archivées déjà encodées)
+        self.version = 0 # incrémenté à chaque mutation
+        self.changes = ChangeLog(os.urandom(8).hex(), 0, CHANGELOG_SIZE) # nouvelle époque à chaque démarrage
+        self.listeners = [] # callbacks(key) appelés à chaque mutation (invalidation des caches)
+
+    def load(self):
+        """
+        Load the bookings (from the binary snapshot if up to date, from JSON otherwise).
+
+        Returns:
+            list of UserBookings: The bookings.
+        """
+        with self.lock, gc_paused():
+            if self._bookings is None:
+                data = read_snapshot(self.snapshot_path, self.path, SNAPSHOT_MAGIC)
+                if data is not None:
+                    movies, others, rows = data
+                    self.codec = Codec(movies, others)
+                    bookings = [UserBookings.unpack(row) for row in rows]
+                else:
+                    # charge le fichier JSON contenant les réservations
+                    with open(self.path, "r") as jsf:
+                        bookings = UserBookings.from_dicts(json.load(jsf)["bookings"], self.codec)
+                    # le snapshot du prochain démarrage s'écrit une fois le service prêt
+                    threading.Thread(target=self.snapshot_loaded, daemon=True).start()
+                self._bookings = bookings
+                self.loaded.set()
+        return self._bookings
+
+    # sous write_lock, comme toute réécriture : une mutation concurrente attend la fin du snapshot
+    def snapshot_loaded(self):
+        with self.write_lock, gc_paused():
+            self.write_snapshot(self.bookings)
+
+    @property
+    def bookings(self):
+        return self._bookings if self._bookings is not None else self.load()
+
+    @property
+    def index(self):
+        # index construit paresseusement au premier accès, puis maintenu à chaque mutation
+        if self._index is None:
+            self._index = {b.userid: b for b in self.bookings}
+        return self._index
+
+    # marque un enregistrement comme modifié : nouvelle version des données, fragment invalidé
+    def touch(self, key):
+        self.version += 1
+        self.changes.append(self.version, key, self.record(key))
+        self.fragments.invalidate(key)
+        for listener in self.listeners:
+            listener(key)
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé)
+    def record(self, key):
+        return self.get_user(key)
+
+    # un seul processus : rien à rattraper
+    def sync(self):
+        pass
+
+    def write_snapshot(self, bookings):
+        write_snapshot(self.snapshot_path, self.path,
+                       (self.codec.movies, self.codec.others, [b.pack() for b in bookings]), SNAPSHOT_MAGIC)
+
+    def write(self):
+        self.move_past() # premier passage du jour : les dates passées sortent du fichier avant sa réécriture
+        with span("store.write", backend="json"):
+            start = time.perf_counter()
+            # un enregistrement décodé à la fois : pas de copie complète en dicts le temps de l'écriture
+            with open(self.path, 'w') as f:
+                f.write('{"bookings": [')
+                for i, b in enumerate(self.bookings):
+                    f.write(", " if i else "")
+                    f.write(json.dumps(b.to_dict(self.codec)))
+                f.write("]}")
+            self.write_snapshot(self.bookings)
+            STORE_WRITE_SECONDS.observe(("json",), time.perf_counter() - start)
+
+    # les réservations sous forme JSON (dicts), décodées au fil de l'itération
+    def all(self):
+        return (b.to_dict(self.codec) for b in self.bookings)
+
+    # tailles du jeu de données pour /metrics ; vide tant que le chargement n'est pas fait
+    def sizes(self):
+        if self._bookings is None:
+            return {}
+        return {"users": len(self._bookings), "bookings": sum(b.count() for b in self._bookings)}
+
+    def get_user(self, userid):
+        b = self.index.get(userid)
+        archived = archive.dates_of(userid) if archive.holds(userid) else []
+        if b is None:
+            return {"userid": userid, "dates": archived} if archived else None
+        record = b.to_dict(self.codec)
+        record["dates"] = archived + record["dates"]
+        return record
+
+    def archived(self):
+        return archived_bookings(*self.partition)
+
+    # fragment JSON d'un utilisateur, décodé seulement s'il n'est pas en cache
+    def fragment(self, b):
+        fragment = self.fragments.fragments.get(b.userid)
+        return fragment if fragment is not None else self.fragments.get(b.userid, b.to_dict(self.codec))
+
+    # dates archivées de la partition, encodées une fois par génération de l'archive
+    def archived_fragments(self):
+        generation = archive.generation
+        cached = self._archived
+        if cached is None or cached[0] != generation:
+            archived = {}
+            for b in self.archived():
+                archived.setdefault(b["userid"], []).extend(map(encode, b["dates"]))
+            # génération lue avant le parcours : un ajout concurrent fait seulement recalculer la fois suivante
+            cached = self._archived = (generation, archived)
+        return cached[1]
+
+    def encoded_all(self):
+        """
+        Every user's bookings, archived dates included, as one encoded JSON array.
+
+        Users without archived dates are served from the fragment cache; the
+        others are encoded with their archived dates first, and users whose
+        dates are all archived come last. The archive is decoded once per
+        generation, not on every call.
+        """
+        archived = self.archived_fragments()
+        fragments = []
+        for b in self.bookings:
+            dates = archived.get(b.userid)
+            if dates is None:
+                fragments.append(self.fragment(b))
+            else:
+                fragments.append(user_fragment(b.userid, dates + [encode(d) for d in b.to_dict(self.codec)["dates"]]))
+        hot = self.index
+        fragments += [user_fragment(userid, dates) for userid, dates in archived.items() if userid not in hot]
+        return join_fragments(fragments)
+
+    def encoded(self, b):
+        # avec des dates archivées, l'enregistrement complet diffère du fragment en cache : pas de cache
+        hot = self.index.get(b["userid"])
+        if hot is None or len(hot.dates) != len(b["dates"]):
+            return encode(b)
+        return self.fragments.get(b["userid"], b)
+
+    # sous write_lock, une fois la mutation certaine : une date archivée de l'utilisateur revient en mémoire
+    def promote(self, userid, date, movies):
+        b = self.index.get(userid)
+        if b is None:
+            b = UserBookings(userid)
+            self.bookings.append(b)
+            self.index[userid] = b
+        b.movies.append(array.array("I", map(self.codec.movie, movies)))
+        b.dates.append(self.codec.date(date))
+        archive.append([{"userid": userid, "date": str(date), "movies": None}])
+
+    # sous write_lock : déplace vers l'archive les dates antérieures à l'horizon, une fois par jour
+    def move_past(self):
+        horizon = archive_horizon()
+        if horizon is None or horizon == self.horizon:
+            return 0
+        self.horizon = horizon
+        lines, rest = [], {}
+        for b in self.bookings:
+            old = [i for i, day in enumerate(b.dates) if 0 < day < horizon]
+            if old:
+                lines += [{"userid": b.userid, "date": self.codec.date_str(b.dates[i]),
+                           "movies": [self.codec.movie_id(m) for m in b.movies[i]]} for i in old]
+                keep = [i for i, day in enumerate(b.dates) if not 0 < day < horizon]
+                rest[b.userid] = UserBookings(b.userid, array.array("i", [b.dates[i] for i in keep]),
+                                              [b.movies[i] for i in keep])
+        if not lines:
+            return 0
+        # l'archive d'abord : un lecteur concurrent peut voir une date en double, jamais une date manquante
+        archive.append(lines)
+        # nouveaux objets plutôt que modification en place : un lecteur garde un enregistrement cohérent
+        bookings = []
+        for b in self.bookings:
+            kept = rest.get(b.userid, b)
+            if kept is b or kept.dates:
+                bookings.append(kept)
+        self._bookings = bookings
+        self._index = {b.userid: b for b in bookings}
+        for userid in rest:
+            self.fragments.invalidate(userid)
+        # la liste complète change d'ordre : nouvelle version, et les suiveurs repartent de la liste complète
+        self.version += 1
+        self.changes.reset(self.version)
+        for listener in self.listeners:
+            listener(None)
+        return len(lines)
+
+    def archive_past(self):
+        """
+        Move the bookings of dates before the archiving horizon to the archive.
+
+        Returns:
+            int: Number of (user, date) entries archived.
+        """
+        with self.write_lock:
+            moved = self.move_past()
+            if moved:
+                self.write()
+            return moved
+
+    def add(self, userid, date, movie_id):
+        """
+        Returns:
+            str: "exists", "booked" (existing date), "new_date" or "new_user".
+        """
+        with self.write_lock:
+            archived = archive.movies(userid, date) if archive.holds(userid) else None
+            if archived is not None:
+                if movie_id in archived:
+                    return "exists"
+                self.promote(userid, date, archived)
+            day, movie = self.codec.date(date), self.codec.movie(movie_id)
+            b = self.index.get(userid)
+            # si l’utilisateur n’existe pas encore -> on le crée (sauf s'il n'a plus que des réservations archivées)
+            if b is None:
+                b = UserBookings(userid)
+                b.movies.append(array.array("I", [movie]))
+                b.dates.append(day)
+                self.bookings.append(b)
+                self.index[userid] = b
+                self.touch(userid)
+                self.write()
+                return "new_date" if archive.holds(userid) and archive.dates_of(userid) else "new_user"
+            for d, movies in zip(b.dates, b.movies):
+                if d == day:
+                    if movie in movies:
+                        return "exists"
+                    movies.append(movie)
+                    self.touch(userid)
+                    self.write()
+                    return "booked"
+            # sinon nouvelle date pour l’utilisateur (films d'abord : un lecteur concurrent ne voit pas de date sans films)
+            b.movies.append(array.array("I", [movie]))
+            b.dates.append(day)
+            self.touch(userid)
+            self.write()
+            return "new_date"
+
+    def delete(self, userid, date, movie_id):
+        """
+        Returns:
+            str: "deleted", "movie_not_found" or "booking_not_found".
+        """
+        with self.write_lock:
+            archived = archive.movies(userid, date) if archive.holds(userid) else None
+            if archived is not None:
+                if movie_id not in archived:
+                    return "movie_not_found"
+                self.promote(userid, date, archived)
+            b = self.index.get(userid)
+            day = self.codec.find_date(date)
+            if b is not None and day is not None:
+                for d, movies in zip(b.dates, b.movies):
+                    if d == day:
+                        movie = self.codec.find_movie(movie_id)
+                        if movie is not None and movie in movies:
+                            movies.remove(movie)
+                            self.touch(userid)
+                            self.write()
+                            return "deleted"
+                        return "movie_not_found"
+            return "booking_not_found"
+
+    def delete_user(self, userid):
+        """
+        Returns:
+            dict or None: The removed {"userid", "dates"} record (archived dates included), None if unknown.
+        """
+        with self.write_lock:
+            record = self.get_user(userid)
+            if record is None:
+                return None
+            if archive.holds(userid):
+                archive.forget(userid)
+            if self.index.pop(userid, None) is not None:
+                self._bookings = [b for b in self.bookings if b.userid != userid]
+                self.write()
+            self.touch(userid)
+            return record
+
+class SqliteStore:
+    """
+    Bookings stored in SQLite (WAL mode), one connection per thread.
+
+    Each route uses one of the SQL constants below; sqlite3 keeps them
+    compiled in its per-connection statement cache.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS booking_users (
+            seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS booking_dates (
+            seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT NOT NULL,
+            date   TEXT NOT NULL,
+            UNIQUE (userid, date)
+        );
+        CREATE TABLE IF NOT EXISTS booking (
+            seq    INTEGER PRIMARY KEY AUTOINCREMENT,
+            userid TEXT NOT NULL,
+            date   TEXT NOT NULL,
+            movie  TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS booking_user_date_movie ON booking(userid, date, movie);
+        CREATE INDEX IF NOT EXISTS booking_date_movie ON booking(date, movie);
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL
+        );
+    """
+    SQL_ALL = """SELECT u.userid, d.date, b.movie FROM booking_users u
+                 LEFT JOIN booking_dates d ON d.userid = u.userid
+                 LEFT JOIN booking b ON b.userid = d.userid AND b.date = d.date
+                 ORDER BY u.seq, d.seq, b.seq"""
+    SQL_USER = """SELECT d.date, b.movie FROM booking_dates d
+                  LEFT JOIN booking b ON b.userid = d.userid AND b.date = d.date
+                  WHERE d.userid = ? ORDER BY d.seq, b.seq"""
+    SQL_USER_EXISTS = "SELECT 1 FROM booking_users WHERE userid = ?"
+    SQL_DATE_EXISTS = "SELECT 1 FROM booking_dates WHERE userid = ? AND date = ?"
+    SQL_INSERT_USER = "INSERT OR IGNORE INTO booking_users (userid) VALUES (?)"
+    SQL_INSERT_DATE = "INSERT OR IGNORE INTO booking_dates (userid, date) VALUES (?, ?)"
+    SQL_INSERT_BOOKING = "INSERT OR IGNORE INTO booking (userid, date, movie) VALUES (?, ?, ?)"
+    SQL_DELETE_BOOKING = "DELETE FROM booking WHERE userid = ? AND date = ? AND movie = ?"
+    SQL_DELETE_USER = "DELETE FROM booking_users WHERE userid = ?"
+    SQL_DELETE_USER_DATES = "DELETE FROM booking_dates WHERE userid = ?"
+    SQL_DELETE_USER_BOOKINGS = "DELETE FROM booking WHERE userid = ?"
+    SQL_TOUCH = "INSERT INTO changes (key) VALUES (?)"
+    SQL_CHANGES_SINCE = "SELECT seq, key FROM changes WHERE seq > ? ORDER BY seq"
+    SQL_LAST_CHANGE = "SELECT MAX(seq) FROM changes"
+    SQL_PRUNE_CHANGES = "DELETE FROM changes WHERE seq <= ?"
+    SQL_COUNT = "SELECT (SELECT COUNT(*) FROM booking_users), (SELECT COUNT(*) FROM booking)"
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.sync_lock = threading.Lock()
+        self.conn().executescript(self.SCHEMA)
+        # après un fork, chaque worker ouvre ses propres connexions
+        os.register_at_fork(after_in_child=self.reset_connections)
+        self.loaded = threading.Event()
+        self.loaded.set()
+        self.fragments = FragmentCache()
+        # version = numéro de la dernière mutation du journal partagé déjà prise en compte
+        self.version = self.conn().execute(self.SQL_LAST_CHANGE).fetchone()[0] or 0
+        # la table changes est partagée et ses numéros ne reviennent jamais en arrière : époque fixe
+        self.changes = ChangeLog("sqlite", self.version, CHANGELOG_SIZE)
+        self.listeners = [] # callbacks(key) appelés à chaque mutation, key None = tout invalider
+
+    def load(self):
+        # rien à précharger : les requêtes passent directement par les index SQLite
+        pass
+
+    # marque un enregistrement comme modifié dans le journal partagé par tous les workers
+    def touch(self, key):
+        with self.conn() as conn:
+            seq = conn.execute(self.SQL_TOUCH, (key,)).lastrowid
+            if seq % CHANGES_PRUNE_EVERY == 0:
+                conn.execute(self.SQL_PRUNE_CHANGES, (seq - CHANGES_KEPT,))
+        self.sync()
+
+    def sync(self):
+        """
+        Catch up with the mutations recorded by every worker (this one included).
+
+        Invalidates the local caches for each changed key; if this worker fell
+        behind the pruned part of the journal, everything is invalidated.
+        """
+        # un seul rattrapage à la fois : deux threads appliqueraient les mêmes mutations deux fois
+        with self.sync_lock:
+            rows = self.conn().execute(self.SQL_CHANGES_SINCE, (self.version,)).fetchall()
+            if not rows:
+                return
+            if rows[0][0] != self.version + 1:
+                self.fragments.clear()
+                self.changes.reset(rows[0][0] - 1)
+                for listener in self.listeners:
+                    listener(None)
+            for seq, key in rows:
+                self.fragments.invalidate(key)
+                self.changes.append(seq, key, self.record(key))
+                for listener in self.listeners:
+                    listener(key)
+            self.version = rows[-1][0]
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé)
+    def record(self, key):
+        return self.get_user(key)
+
+    # transaction d'écriture chronométrée pour store_write_duration_seconds
+    @contextmanager
+    def transaction(self):
+        with span("store.write", backend="sqlite"):
+            start = time.perf_counter()
+            try:
+                with self.conn() as conn:
+                    yield conn
+            finally:
+                STORE_WRITE_SECONDS.observe(("sqlite",), time.perf_counter() - start)
+
+    def reset_connections(self):
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def all(self):
+        bookings = []
+        b = d = None
+        for userid, date, movie in self.conn().execute(self.SQL_ALL):
+            if b is None or b["userid"] != userid:
+                b = {"userid": userid, "dates": []}
+                bookings.append(b)
+                d = None
+            if date is not None and (d is None or d["date"] != date):
+                d = {"date": date, "movies": []}
+                b["dates"].append(d)
+            if movie is not None:
+                d["movies"].append(movie)
+        return bookings
+
+    # l'archive froide ne concerne que le backend JSON : une archive existante est importée par migrate
+    def archived(self):
+        return ()
+
+    def archive_past(self):
+        return 0
+
+    def sizes(self):
+        users, bookings = self.conn().execute(self.SQL_COUNT).fetchone()
+        return {"users": users, "bookings": bookings}
+
+    def encoded_all(self):
+        return join_fragments([self.fragments.get(b["userid"], b) for b in self.all()])
+
+    def encoded(self, b):
+        return self.fragments.get(b["userid"], b)
+
+    def get_user(self, userid):
+        conn = self.conn()
+        if conn.execute(self.SQL_USER_EXISTS, (userid,)).fetchone() is None:
+            return None
+        return self.read_user(conn, userid)
+
+    def read_user(self, conn, userid):
+        b = {"userid": userid, "dates": []}
+        d = None
+        for date, movie in conn.execute(self.SQL_USER, (userid,)):
+            if d is None or d["date"] != date:
+                d = {"date": date, "movies": []}
+                b["dates"].append(d)
+            if movie is not None:
+                d["movies"].append(movie)
+        return b
+
+    def add(self, userid, date, movie_id):
+        with self.transaction() as conn:
+            new_user = conn.execute(self.SQL_INSERT_USER, (userid,)).rowcount == 1
+            new_date = conn.execute(self.SQL_INSERT_DATE, (userid, date)).rowcount == 1
+            if conn.execute(self.SQL_INSERT_BOOKING, (userid, date, movie_id)).rowcount == 0:
+                return "exists"
+        self.touch(userid)
+        if new_user:
+            return "new_user"
+        return "new_date" if new_date else "booked"
+
+    def delete(self, userid, date, movie_id):
+        with self.transaction() as conn:
+            if conn.execute(self.SQL_DATE_EXISTS, (userid, date)).fetchone() is None:
+                return "booking_not_found"
+            if conn.execute(self.SQL_DELETE_BOOKING, (userid, date, movie_id)).rowcount == 0:
+                return "movie_not_found"
+        self.touch(userid)
+        return "deleted"
+
+    def delete_user(self, userid):
+        with self.transaction() as conn:
+            # le DELETE ouvre la transaction d'écriture : les réservations relues ensuite sont bien celles supprimées
+            if conn.execute(self.SQL_DELETE_USER, (userid,)).rowcount == 0:
+                return None
+            b = self.read_user(conn, userid)
+            conn.execute(self.SQL_DELETE_USER_DATES, (userid,))
+            conn.execute(self.SQL_DELETE_USER_BOOKINGS, (userid,))
+        self.touch(userid)
+        return b
+
+    def migrate(self, json_path, archived=()):
+        """
+        One-shot import of an existing bookings.json (already present rows are skipped).
+
+        Args:
+            json_path (str): Path of the JSON file to import.
+            archived (iterable): Archived bookings to import too ({"userid", "dates"} records).
+
+        Returns:
+            int: Number of users read from the file.
+        """
+        with open(json_path, "r") as jsf:
+            bookings = json.load(jsf)["bookings"]
+        count = len(bookings)
+        bookings += archived
+        with self.conn() as conn:
+            conn.executemany(self.SQL_INSERT_USER, [(b["userid"],) for b in bookings])
+            conn.executemany(self.SQL_INSERT_DATE, [(b["userid"], d["date"]) for b in bookings for d in b["dates"]])
+            conn.executemany(self.SQL_INSERT_BOOKING, [(b["userid"], d["date"], m)
+                                                       for b in bookings for d in b["dates"] for m in d["movies"]])
+        return count
+
+# partitionnement : une partition par hash stable de userid (crc32, identique d'un processus à l'autre)
+def partition_of(userid, count):
+    return zlib.crc32(userid.encode()) % count
+
+# fichier d'une partition : bookings.json si une seule, bookings.<i>-of-<N>.json sinon
+def partition_path(path, index, count):
+    if count == 1:
+        return path
+    base, ext = os.path.splitext(path)
+    return "%s.%d-of-%d%s" % (base, index, count, ext)
+
+class PartitionedStore:
+    """
+    Bookings spread over several stores (JsonStore or SqliteStore) by a hash of the userid.
+
+    Each partition has its own file or database, hence its own write lock
+    (JsonStore.write_lock, or the SQLite database lock): a per-user route
+    touches a single partition, so writes to different partitions no longer
+    wait on each other, and a JSON write only rewrites its partition. Full listings merge the partitions (partition order, then
+    insertion order within a partition).
+
+    The change feed merges the partitions' mutations into one sequence; it
+    starts at the sum of the partition versions, and each mutation of any
+    partition adds one.
+
+    Args:
+        partitions (list): One store per partition, in partition order.
+    """
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.loaded = threading.Event()
+        if all(p.loaded.is_set() for p in partitions):
+            self.loaded.set()
+        self.feed_lock = threading.Lock()
+        sqlite = all(isinstance(p, SqliteStore) for p in partitions)
+        self.changes = ChangeLog("sqlite" if sqlite else os.urandom(8).hex(),
+                                 sum(p.changes.version for p in partitions), CHANGELOG_SIZE)
+        self.listeners = [] # callbacks(key) appelés à chaque mutation, key None = tout invalider
+        for p in partitions:
+            p.listeners.append(lambda key, p=p: self.changed(p, key))
+
+    # mutation d'une partition (locale ou rattrapée d'un autre worker) : entrée du flux fusionné
+    def changed(self, partition, key):
+        with self.feed_lock:
+            if key is None:
+                # trou dans le journal d'une partition : on repart de la somme, sans jamais reculer
+                self.changes.reset(max(self.changes.version, sum(p.changes.version for p in self.partitions)))
+            else:
+                self.changes.append(self.changes.version + 1, key, partition.record(key))
+        for listener in self.listeners:
+            listener(key)
+
+    @property
+    def version(self):
+        return self.changes.version
+
+    def route(self, userid):
+        return self.partitions[partition_of(userid, len(self.partitions))]
+
+    def load(self):
+        for p in self.partitions:
+            p.load()
+        self.loaded.set()
+
+    def sync(self):
+        for p in self.partitions:
+            p.sync()
+
+    def record(self, key):
+        return self.route(key).record(key)
+
+    def all(self):
+        return [b for p in self.partitions for b in p.all()]
+
+    def sizes(self):
+        sizes = collections.Counter()
+        for p in self.partitions:
+            sizes.update(p.sizes())
+        return dict(sizes)
+
+    def encoded_all(self):
+        # chaque partition renvoie déjà un tableau encodé : on concatène leurs contenus
+        return join_fragments([body[1:-1] for body in (p.encoded_all() for p in self.partitions) if body != b"[]"])
+
+    def encoded(self, b):
+        return self.route(b["userid"]).encoded(b)
 
-def write(bookings_data):
-    with open('{}/databases/bookings.json'.format("."), 'w') as f:
-        full = {}
-        full['bookings'] = bookings_data
-        json.dump(full, f)
+    def get_user(self, userid):
+        return self.route(userid).get_user(userid)
+
+    def add(self, userid, date, movie_id):
+        return self.route(userid).add(userid, date, movie_id)
+
+    def delete(self, userid, date, movie_id):
+        return self.route(userid).delete(userid, date, movie_id)
+
+    def delete_user(self, userid):
+        return self.route(userid).delete_user(userid)
+
+    def archive_past(self):
+        return sum(p.archive_past() for p in self.partitions)
+
+    def archived(self):
+        return archived_bookings()
+
+    def migrate(self, json_path):
+        return sum(p.migrate(partition_path(json_path, i, len(self.partitions)),
+                             archived_bookings(i, len(self.partitions)))
+                   for i, p in enumerate(self.partitions))
+
+def open_partition(index):
+    json_path = partition_path(JSON_PATH, index, PARTITIONS)
+    sqlite_path = partition_path(SQLITE_PATH, index, PARTITIONS)
+    if not os.path.exists(json_path) and not os.path.exists(sqlite_path):
+        sys.exit("%s not found: split the bookings with python ../tools/rebalance_bookings.py --partitions %d"
+                 % (json_path, PARTITIONS))
+    # plusieurs workers : l'état doit être partagé -> SQLite, migré depuis le JSON au premier lancement
+    if WORKERS > 1:
+        if STORAGE != "sqlite":
+            # chaque worker forké réécrirait sa propre copie du JSON : le dernier écrivain gagne
+            sys.exit("BOOKING_WORKERS > 1 requires BOOKING_STORAGE=sqlite")
+        fresh = not os.path.exists(sqlite_path)
+        sqlite_store = SqliteStore(sqlite_path)
+        if fresh:
+            sqlite_store.migrate(json_path, archived_bookings(index, PARTITIONS))
+        return sqlite_store
+    if STORAGE == "sqlite":
+        return SqliteStore(sqlite_path)
+    return JsonStore(json_path, (index, PARTITIONS))
+
+def open_store():
+    if PARTITIONS == 1:
+        return open_partition(0)
+    return PartitionedStore([open_partition(i) for i in range(PARTITIONS)])
+
+store = open_store()
+
+# compteurs de réservations maintenus à chaque mutation, reconstruits depuis le store au démarrage
+class BookingAnalytics:
+    """
+    Booking counters per date and movie, per movie and per user.
+
+    Each add / delete of the current process updates them in O(1) (O(bookings
+    of the user) for a user deletion). If the store moved in another way (a
+    concurrent mutation, or another worker in multi-process mode), the counters
+    are marked stale and rebuilt from the store on the next read.
+
+    Args:
+        source: Store (or partition) whose bookings are counted.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.Lock()
+        self.version = None # version du store reflétée par les compteurs, None = à reconstruire
+        self.by_date = {} # date -> Counter(film -> réservations)
+        self.dates = [] # dates connues, triées (recherche par intervalle)
+        self.by_movie = collections.Counter()
+        self.by_user = collections.Counter()
+        self.total = 0
+
+    def count(self, userid, date, movie, n):
+        movies = self.by_date.get(date)
+        if movies is None:
+            movies = self.by_date[date] = collections.Counter()
+            bisect.insort(self.dates, date)
+        movies[movie] += n
+        self.by_movie[movie] += n
+        self.by_user[userid] += n
+        self.total += n
+        # compteurs à zéro retirés : le top-K et les intervalles ne voient que des réservations réelles
+        if not movies[movie]:
+            del movies[movie]
+            if not movies:
+                del self.by_date[date]
+                del self.dates[bisect.bisect_left(self.dates, date)]
+        if not self.by_movie[movie]:
+            del self.by_movie[movie]
+        if not self.by_user[userid]:
+            del self.by_user[userid]
+
+    def rebuild(self, bookings, version):
+        self.by_date, self.dates = {}, []
+        self.by_movie, self.by_user = collections.Counter(), collections.Counter()
+        self.total = 0
+        for b in bookings:
+            for d in b["dates"]:
+                for movie in d["movies"]:
+                    self.count(b["userid"], d["date"], movie, 1)
+        self.version = version
+
+    def refresh(self):
+        with self.lock:
+            if self.version != self.source.version:
+                version = self.source.version
+                self.rebuild(itertools.chain(self.source.archived(), self.source.all()), version)
+                if self.source.version != version:
+                    self.version = None # mutation pendant la reconstruction : à refaire
+
+    def apply(self, before, after, changes):
+        """
+        Apply the bookings changed by one store mutation.
+
+        Args:
+            before (int): Store version before the mutation.
+            after (int): Store version after it.
+            changes (list of tuple): (userid, date, movie, +1 or -1) for each booking.
+        """
+        with self.lock:
+            if self.version != before or after != before + 1:
+                self.version = None
+                return
+            for userid, date, movie, n in changes:
+                self.count(userid, date, movie, n)
+            self.version = after
+
+    def movie_counts(self, start=None, end=None):
+        if start is None and end is None:
+            return self.by_movie
+        counts = collections.Counter()
+        for date in self.dates_between(start, end):
+            counts.update(self.by_date[date])
+        return counts
+
+    def dates_between(self, start, end):
+        lo = bisect.bisect_left(self.dates, start) if start else 0
+        hi = bisect.bisect_right(self.dates, end) if end else len(self.dates)
+        return self.dates[lo:hi]
+
+# un jeu de compteurs par partition : une mutation ne touche que ceux de sa partition, les lectures fusionnent
+partitions = store.partitions if PARTITIONS > 1 else [store]
+analytics = [BookingAnalytics(p) for p in partitions]
+
+def analytics_of(userid):
+    return analytics[partition_of(userid, len(analytics))]
+
+# chargement des données en arrière-plan : le port s'ouvre tout de suite, /ready passe à 200 une fois chargé
+def warm_up():
+    store.load()
+    store.archive_past()
+    for counters in analytics:
+        counters.refresh()
+
+threading.Thread(target=warm_up, daemon=True).start()
+
+# en mode multi-process : rattrape les mutations des autres workers avant de servir la requête
+@app.before_request
+def sync_store():
+    store.sync()
+
+# réponses de liste complète : version et époque des données, point de départ du flux de changements
+@app.after_request
+def data_version_headers(response):
+    if "data_version" in g:
+        response.headers["X-Data-Version"] = str(g.data_version)
+        response.headers["X-Data-Epoch"] = store.changes.epoch
+    return response
+
+schedule_client = ServiceClient("schedule", SCHEDULE_URL)
+movie_client = ServiceClient("movie", MOVIE_URL)
+user_client = ServiceClient("user", USER_URL)
+clients = [schedule_client, movie_client, user_client]
+
+# réconciliation des références : films et utilisateurs supprimés ailleurs mais encore réservés ici
+RECONCILE_AS = os.environ.get("BOOKING_RECONCILE_AS", "") # admin au nom duquel les listes sont lues ; vide = désactivée
+RECONCILE_REPAIR = os.environ.get("BOOKING_RECONCILE_REPAIR", "0") == "1" # 1 : supprime les réservations orphelines
+RECONCILE_SECONDS = float(os.environ.get("BOOKING_RECONCILE_SECONDS", 30)) # intervalle entre deux passes
+RECONCILE_TIMEOUT = 60 # secondes pour relire une liste complète
+RECONCILE_REPAIRED_TOTAL = Counter("reconcile_repaired_total", "Dangling bookings deleted by the reconciler, per reference.",
+                                   ("kind",))
+
+class Reconciler:
+    """
+    Background check of the movie and user ids referenced by the bookings.
+
+    Each pass follows three change feeds: Movie's, User's, and the local
+    store's. It only looks at the users whose bookings changed, the users
+    deleted upstream, and the bookers of the movies deleted upstream. Those
+    bookers come from a reverse index (movie -> userids), so a pass costs
+    O(changes) instead of joining every booking with both catalogues. The
+    first pass, or a pass after the local feed was missed, scans everything
+    once to rebuild that index.
+
+    With RECONCILE_REPAIR, the dangling bookings are deleted. Otherwise they
+    are only reported, by GET /<user_id>/bookings/reconcile and /metrics.
+
+    Args:
+        source: Store whose bookings are checked.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.movies = IdFollower(movie_client, "movies", RECONCILE_AS, RECONCILE_TIMEOUT)
+        self.users = IdFollower(user_client, "users", RECONCILE_AS, RECONCILE_TIMEOUT)
+        self.lock = threading.Lock()
+        self.booked = None # film -> userids qui l'ont réservé ; peut garder des entrées périmées, revérifiées
+        self.version = None # version du store déjà vérifiée
+        self.epoch = None
+        self.dangling = {} # userid -> films inconnus de Movie ; None : utilisateur inconnu de User
+        self.last_pass = None
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        self.source.loaded.wait()
+        while True:
+            try:
+                self.reconcile()
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                self.last_pass = {"at": time.time(), "error": str(e)}
+            time.sleep(RECONCILE_SECONDS)
+
+    # références d'un utilisateur : index inverse complété, références orphelines notées
+    def check(self, b, merge=False):
+        userid = b["userid"]
+        movies = {m for d in b["dates"] for m in d["movies"]}
+        for movie in movies:
+            self.booked.setdefault(movie, set()).add(userid)
+        if userid not in self.users.ids:
+            self.dangling[userid] = None
+            return
+        missing = movies - self.movies.ids
+        if merge and self.dangling.get(userid):
+            missing |= self.dangling[userid]
+        if missing:
+            self.dangling[userid] = missing
+        else:
+            self.dangling.pop(userid, None)
+
+    def reconcile(self):
+        with self.lock:
+            start = time.perf_counter()
+            self.source.sync()
+            new_movies, gone_movies = self.movies.poll()
+            new_users, gone_users = self.users.poll()
+            changes = None
+            if self.booked is not None and self.epoch == self.source.changes.epoch:
+                version, changes = self.source.changes.since(self.version)
+            if changes is None:
+                # premier passage ou journal local dépassé : un parcours complet reconstruit l'index inverse
+                version = self.source.version
+                self.booked, self.dangling = {}, {}
+                checked = 0
+                # l'archive donne une entrée par utilisateur et par mois : les films orphelins se cumulent
+                for b in itertools.chain(self.source.archived(), self.source.all()):
+                    self.check(b, merge=True)
+                    checked += 1
+            else:
+                users = {json.loads(change)["key"] for change in changes} | (gone_users or set())
+                for movie in gone_movies or ():
+                    users |= self.booked.get(movie, set())
+                # un film ou un utilisateur revenu : ses réservations signalées sont revues
+                for movie in new_movies or ():
+                    users |= self.booked.get(movie, set()) & self.dangling.keys()
+                users |= (new_users or set()) & self.dangling.keys()
+                checked = len(users)
+                for userid in users:
+                    b = self.source.get_user(userid)
+                    if b is None:
+                        self.dangling.pop(userid, None)
+                    else:
+                        self.check(b)
+            self.version, self.epoch = version, self.source.changes.epoch
+            repaired = self.repair() if RECONCILE_REPAIR else 0
+            self.last_pass = {"at": time.time(), "full": changes is None, "checked": checked, "repaired": repaired,
+                              "seconds": round(time.perf_counter() - start, 6)}
+
+    def repair(self):
+        """
+        Delete the dangling bookings, keeping the analytics counters in step.
+
+        Returns:
+            int: Number of bookings deleted.
+        """
+        repaired = 0
+        for userid, movies in list(self.dangling.items()):
+            del self.dangling[userid]
+            b = self.source.get_user(userid)
+            if b is None:
+                continue
+            counters = analytics_of(userid)
+            if movies is None:
+                before = counters.source.version
+                b = self.source.delete_user(userid)
+                if b is not None:
+                    counters.apply(before, counters.source.version, [(userid, d["date"], movie, -1)
+                                                                     for d in b["dates"] for movie in d["movies"]])
+                    RECONCILE_REPAIRED_TOTAL.inc(("user",), sum(len(d["movies"]) for d in b["dates"]))
+                    repaired += sum(len(d["movies"]) for d in b["dates"])
+                continue
+            for d in b["dates"]:
+                for movie in d["movies"]:
+                    if movie in movies:
+                        before = counters.source.version
+                        if self.source.delete(userid, d["date"], movie) == "deleted":
+                            counters.apply(before, counters.source.version, [(userid, d["date"], movie, -1)])
+                            RECONCILE_REPAIRED_TOTAL.inc(("movie",))
+                            repaired += 1
+        # ces suppressions sont revues au passage suivant, comme toute mutation du store
+        return repaired
+
+    def report(self):
+        """
+        Returns:
+            dict: {"users", "movies", "last_pass"}: users unknown to User, movie -> bookers for movies unknown to Movie.
+        """
+        dangling = list(self.dangling.items()) # copie : une passe peut être en cours
+        movies = {}
+        for userid, missing in dangling:
+            for movie in missing or ():
+                movies.setdefault(movie, []).append(userid)
+        return {"users": sorted(userid for userid, missing in dangling if missing is None),
+                "movies": {movie: sorted(users) for movie, users in movies.items()},
+                "last_pass": self.last_pass}
+
+reconciler = Reconciler(store)
 
 # fonction utilitaire pour vérifier admin
 def verify_admin(user_id):
@@ -47,11 +1403,15 @@ def verify_admin(user_id):
     if user_id in user_admin_cache:
         cached = user_admin_cache[user_id]
         if now - cached["timestamp"] < CACHE_TTL:
+            ADMIN_CACHE_TOTAL.inc(("hit",))
             return cached["is_admin"], None
+        ADMIN_CACHE_TOTAL.inc(("expired",))
+    else:
+        ADMIN_CACHE_TOTAL.inc(("miss",))
 
     # sinon appelle le microservice User
     try:
-        r = requests.get(f"{USER_URL}/users/{user_id}/is_admin")
+        r = user_client.get(f"/users/{user_id}/is_admin", call="is_admin")
         if r.status_code == 200:
             data = r.json()
             is_admin = data.get("is_admin", False)
@@ -59,6 +1419,8 @@ def verify_admin(user_id):
             return is_admin, None
         else:
             return False, make_response(jsonify({"error": "Unable to verify user"}), 401)
+    except requests.exceptions.Timeout:
+        return False, make_response(jsonify({"error": "User service timed out"}), 504)
     except requests.exceptions.RequestException:
         return False, make_response(jsonify({"error": "User service unreachable"}), 503)
 
@@ -75,6 +1437,49 @@ def home():
     """
    return "<h1 style='color:blue'>Welcome to the Booking service!</h1>"
 
+# sonde de disponibilité : 200 seulement une fois les données chargées et interrogeables
+@app.route("/ready", methods=['GET'])
+def ready():
+    """
+    Readiness probe for the Booking service.
+
+    Returns:
+        Response: 200 once the data is loaded and queryable, 503 while it is still loading.
+    """
+    if not store.loaded.is_set():
+        return make_response(jsonify({"ready": False}), 503)
+    return make_response(jsonify({"ready": True}), 200)
+
+
+# métriques au format texte Prometheus
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics of the service: request latencies per route, outbound
+    call latencies, user_admin_cache lookups, store write times, dataset sizes
+    and circuit breaker states (per worker in multi-process mode).
+
+    Returns:
+        Response: Metrics in Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += ["# HELP dataset_records Records currently held by the store.", "# TYPE dataset_records gauge"]
+    for kind, count in store.sizes().items():
+        lines.append('dataset_records{kind="%s"} %d' % (kind, count))
+    if RECONCILE_AS:
+        dangling = list(reconciler.dangling.values())
+        lines += ["# HELP reconcile_dangling References to deleted users and movies found by the last pass.",
+                  "# TYPE reconcile_dangling gauge",
+                  'reconcile_dangling{kind="user"} %d' % sum(1 for missing in dangling if missing is None),
+                  'reconcile_dangling{kind="movie"} %d' % sum(len(missing) for missing in dangling if missing)]
+    lines += breaker_metrics(clients)
+    return app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# routes admin de profilage (common.profiling)
+profiling.install_routes(app, verify_admin)
+
 # récupère toutes les réservations
 @app.route("/<user_id>/bookings", methods=['GET'])
 def get_all_bookings(user_id):
@@ -96,7 +1501,41 @@ def get_all_bookings(user_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    return make_response(jsonify(bookings), 200)
+    g.data_version = store.version # réponse versionnée : compressée une seule fois par version
+    return json_response(store.encoded_all())
+
+# flux de changements : mutations depuis la version ?since=N, ou 410 s'il faut tout recharger
+@app.route("/<user_id>/bookings/changes", methods=['GET'])
+def get_bookings_changes(user_id):
+    """
+    Get the bookings changed since a version, from the in-memory change log.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Query Parameters:
+        since (int): Last version the caller has applied (X-Data-Version of the full list, then
+                     "version" of the previous answer).
+
+    Returns:
+        Response: JSON {"changes", "epoch", "version"} in version order, or 410
+                  "resync required" if the changes fell out of the log (reload
+                  the full list, then follow from its version).
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return make_response(jsonify({"error": "'since' must be a non-negative integer"}), 400)
+    version, changes = store.changes.since(int(since))
+    if changes is None:
+        return make_response(jsonify({"error": "resync required", "epoch": store.changes.epoch,
+                                      "version": version}), 410)
+    return json_response(b'{"changes":' + join_fragments(changes) + b',"epoch":' + encode(store.changes.epoch) +
+                         b',"version":' + str(version).encode() + b"}")
 
 # récupère les réservations d’un utilisateur
 @app.route("/<user_id>/bookings/<user_id_wanted>", methods=['GET'])
@@ -120,9 +1559,9 @@ def get_user_bookings(user_id, user_id_wanted):
     if not is_admin and user_id_wanted != user_id:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for b in bookings:
-        if b["userid"] == user_id_wanted:
-            return make_response(jsonify(b), 200)
+    b = store.get_user(user_id_wanted)
+    if b is not None:
+        return json_response(store.encoded(b))
     return make_response(jsonify({"error": "user not found"}), 404)
 
 # ajoute une réservation pour un utilisateur
@@ -161,7 +1600,12 @@ def add_booking(user_id, user_id_wanted):
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
     # vérifie auprès de Schedule que le film est dispo à cette date
-    r = requests.get(f"{SCHEDULE_URL}/{user_id}/schedule/{date}") # appele microservice de Schedule
+    try:
+        r = schedule_client.get(f"/{user_id}/schedule/{date}", call="schedule_by_date") # appele microservice de Schedule
+    except requests.exceptions.Timeout:
+        return make_response(jsonify({"error": "Schedule service timed out"}), 504)
+    except requests.exceptions.RequestException:
+        return make_response(jsonify({"error": "Schedule service unreachable"}), 503)
     if r.status_code != 200:
         return make_response(jsonify({"error": "date not found in schedule"}), 404)
 
@@ -169,30 +1613,16 @@ def add_booking(user_id, user_id_wanted):
     if movie_id not in movies_for_date:
         return make_response(jsonify({"error": "movie not available at this date"}), 400)
 
-    # si l’utilisateur existe déjà
-    for b in bookings:
-        if b["userid"] == user_id_wanted:
-            for d in b["dates"]:
-                if d["date"] == date:
-                    if movie_id in d["movies"]:
-                        return make_response(jsonify({"error": "booking already exists"}), 400)
-                    d["movies"].append(movie_id)
-                    write(bookings)
-                    return make_response(jsonify({"message": "movie booked"}), 200)
-            # sinon nouvelle date pour l’utilisateur
-            b["dates"].append({"date": date, "movies": [movie_id]})
-            write(bookings)
-            return make_response(jsonify({"message": "movie booked with new date"}), 200)
-
-    # si l’utilisateur n’existe pas encore -> on le crée
-    new_booking = {
-        "userid": user_id_wanted,
-        "dates": [
-            {"date": date, "movies": [movie_id]}
-        ]
-    }
-    bookings.append(new_booking)
-    write(bookings)
+    counters = analytics_of(user_id_wanted)
+    before = counters.source.version
+    status = store.add(user_id_wanted, date, movie_id)
+    if status == "exists":
+        return make_response(jsonify({"error": "booking already exists"}), 400)
+    counters.apply(before, counters.source.version, [(user_id_wanted, date, movie_id, 1)])
+    if status == "booked":
+        return make_response(jsonify({"message": "movie booked"}), 200)
+    if status == "new_date":
+        return make_response(jsonify({"message": "movie booked with new date"}), 200)
     return make_response(jsonify({"message": "new user created and booking added"}), 200)
 
 # supprime une réservation (film spécifique pour une date d’un user)
@@ -219,15 +1649,14 @@ def delete_booking(user_id, user_id_wanted, date, movie_id):
     if not is_admin and user_id_wanted != user_id:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for b in bookings:
-        if b["userid"] == user_id_wanted:
-            for d in b["dates"]:
-                if d["date"] == date:
-                    if movie_id in d["movies"]:
-                        d["movies"].remove(movie_id)
-                        write(bookings)
-                        return make_response(jsonify({"message": "booking deleted"}), 200)
-                    return make_response(jsonify({"error": "movie not found in this booking"}), 404)
+    counters = analytics_of(user_id_wanted)
+    before = counters.source.version
+    status = store.delete(user_id_wanted, date, movie_id)
+    if status == "deleted":
+        counters.apply(before, counters.source.version, [(user_id_wanted, date, movie_id, -1)])
+        return make_response(jsonify({"message": "booking deleted"}), 200)
+    if status == "movie_not_found":
+        return make_response(jsonify({"error": "movie not found in this booking"}), 404)
     return make_response(jsonify({"error": "booking not found"}), 404)
 
 # supprime toutes les réservations d’un utilisateur
@@ -252,13 +1681,14 @@ def delete_user_bookings(user_id, user_id_wanted):
     if not is_admin and user_id_wanted != user_id:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    global bookings # variable en dehors de fonction
-    new_bookings = [b for b in bookings if b["userid"] != user_id_wanted]
-    if len(new_bookings) == len(bookings):
+    counters = analytics_of(user_id_wanted)
+    before = counters.source.version
+    booking = store.delete_user(user_id_wanted)
+    if booking is None:
         return make_response(jsonify({"error": "user not found"}), 404)
+    counters.apply(before, counters.source.version, [(user_id_wanted, d["date"], movie, -1)
+                                                     for d in booking["dates"] for movie in d["movies"]])
 
-    bookings = new_bookings
-    write(bookings)
     return make_response(jsonify({"message": f"all bookings deleted for {user_id_wanted}"}), 200)
 
 # récupère les réservations d’un utilisateur avec détail des films
@@ -283,24 +1713,190 @@ def get_user_booking_details(user_id, user_id_wanted):
     if not is_admin and user_id_wanted != user_id:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for b in bookings:
-        if b["userid"] == user_id_wanted:
-            detailed = {"userid": user_id_wanted, "dates": []}
-            for d in b["dates"]:
-                movies_detail = []
-                for m in d["movies"]:
-                    r = requests.get(f"{MOVIE_URL}/{user_id}/movies/{m}") # appele microservice de Movie
-                    if r.status_code == 200:
-                        movies_detail.append(r.json())
-                    else:
-                        movies_detail.append({"id": m, "error": "movie not found"})
-                detailed["dates"].append({
-                    "date": d["date"],
-                    "movies": movies_detail
-                })
-            return make_response(jsonify(detailed), 200)
+    b = store.get_user(user_id_wanted)
+    if b is not None:
+        # on garde tels quels les octets JSON renvoyés par Movie, sans les décoder ni les réencoder
+        dates_detail = []
+        for d in b["dates"]:
+            movies_detail = []
+            for m in d["movies"]:
+                try:
+                    r = movie_client.get(f"/{user_id}/movies/{m}", call="movie_by_id") # appele microservice de Movie
+                except requests.exceptions.RequestException:
+                    movies_detail.append(encode({"id": m, "error": "movie service unreachable"}))
+                    continue
+                if r.status_code == 200:
+                    movies_detail.append(r.content.strip())
+                else:
+                    movies_detail.append(encode({"id": m, "error": "movie not found"}))
+            dates_detail.append(b'{"date":' + encode(d["date"]) + b',"movies":' + join_fragments(movies_detail) + b'}')
+        return json_response(b'{"dates":' + join_fragments(dates_detail) + b',"userid":' + encode(user_id_wanted) + b'}')
     return make_response(jsonify({"error": "user not found"}), 404)
 
+# références orphelines trouvées par la réconciliation (films ou utilisateurs supprimés)
+@app.route("/<user_id>/bookings/reconcile", methods=['GET'])
+def get_reconcile_report(user_id):
+    """
+    Report of the last reconciliation passes.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Returns:
+        Response: JSON {"enabled", "repair", "users", "movies", "last_pass"}: the
+                  booking users unknown to User and, per movie unknown to Movie,
+                  the users still booking it; or an unauthorized error.
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    return make_response(jsonify(dict(reconciler.report(), enabled=bool(RECONCILE_AS), repair=RECONCILE_REPAIR)), 200)
+
+# statistiques de réservation (admin) : lues dans les compteurs maintenus à chaque mutation
+def analytics_request(user_id):
+    """
+    Check admin rights and parse the common analytics parameters.
+
+    Returns:
+        tuple: (params, None) or (None, error response); params holds "top", "from" and "to".
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return None, error
+    if not is_admin:
+        return None, make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    top = request.args.get("top", "10")
+    if not top.isdigit() or int(top) == 0:
+        return None, make_response(jsonify({"error": "'top' must be a positive integer"}), 400)
+    params = {"top": int(top), "from": request.args.get("from"), "to": request.args.get("to")}
+    for counters in analytics:
+        counters.refresh()
+    return params, None
+
+@app.route("/<user_id>/bookings/analytics/movies", methods=['GET'])
+def get_top_movies(user_id):
+    """
+    Most booked movies, optionally over a date range (e.g. this week).
+
+    Args:
+        user_id (str): ID of the requesting user (must be admin).
+
+    Query Parameters:
+        top (int): Number of movies returned (default 10).
+        from (str): First date included (YYYYMMDD), optional.
+        to (str): Last date included (YYYYMMDD), optional.
+
+    Returns:
+        Response: JSON list of {"movie", "bookings"}, most booked first.
+    """
+    params, error = analytics_request(user_id)
+    if error:
+        return error
+    counts = collections.Counter()
+    for counters in analytics:
+        with counters.lock:
+            counts.update(counters.movie_counts(params["from"], params["to"]))
+    top = heapq.nlargest(params["top"], counts.items(), key=lambda item: item[1])
+    return make_response(jsonify([{"movie": movie, "bookings": n} for movie, n in top]), 200)
+
+@app.route("/<user_id>/bookings/analytics/dates", methods=['GET'])
+def get_bookings_per_date(user_id):
+    """
+    Bookings per date, with the count of each movie, over a date range.
+
+    Args:
+        user_id (str): ID of the requesting user (must be admin).
+
+    Query Parameters:
+        from (str): First date included (YYYYMMDD), optional.
+        to (str): Last date included (YYYYMMDD), optional.
+
+    Returns:
+        Response: JSON list of {"date", "bookings", "movies": {movie: bookings}} in date order.
+    """
+    params, error = analytics_request(user_id)
+    if error:
+        return error
+    by_date = {}
+    for counters in analytics:
+        with counters.lock:
+            for date in counters.dates_between(params["from"], params["to"]):
+                by_date.setdefault(date, collections.Counter()).update(counters.by_date[date])
+    dates = [{"date": date, "bookings": sum(by_date[date].values()), "movies": dict(by_date[date])}
+             for date in sorted(by_date)]
+    return make_response(jsonify(dates), 200)
+
+@app.route("/<user_id>/bookings/analytics/users", methods=['GET'])
+def get_top_bookers(user_id):
+    """
+    Users with the most bookings.
+
+    Args:
+        user_id (str): ID of the requesting user (must be admin).
+
+    Query Parameters:
+        top (int): Number of users returned (default 10).
+
+    Returns:
+        Response: JSON {"total", "users": [{"userid", "bookings"}]}, biggest bookers first.
+    """
+    params, error = analytics_request(user_id)
+    if error:
+        return error
+    # un utilisateur n'est que dans une partition : le top global est dans l'union des tops par partition
+    top, total = [], 0
+    for counters in analytics:
+        with counters.lock:
+            top += heapq.nlargest(params["top"], counters.by_user.items(), key=lambda item: item[1])
+            total += counters.total
+    top = heapq.nlargest(params["top"], top, key=lambda item: item[1])
+    return make_response(jsonify({"total": total, "users": [{"userid": u, "bookings": n} for u, n in top]}), 200)
+
+@app.route("/<user_id>/bookings/analytics/verify", methods=['GET'])
+def verify_analytics(user_id):
+    """
+    Compare the maintained counters with a full recount of the store.
+
+    Args:
+        user_id (str): ID of the requesting user (must be admin).
+
+    Returns:
+        Response: JSON {"consistent": bool, "total", "recounted"}.
+    """
+    _, error = analytics_request(user_id)
+    if error:
+        return error
+    consistent, total, recounted = True, 0, 0
+    for counters in analytics:
+        recount = BookingAnalytics(counters.source)
+        with counters.lock:
+            recount.rebuild(itertools.chain(counters.source.archived(), counters.source.all()), counters.source.version)
+            consistent = consistent and (counters.by_date == recount.by_date and counters.by_movie == recount.by_movie
+                                         and counters.by_user == recount.by_user and counters.total == recount.total)
+            total += counters.total
+        recounted += recount.total
+    return make_response(jsonify({"consistent": consistent, "total": total, "recounted": recounted}), 200)
+
 if __name__ == "__main__":
+   # migration unique bookings.json -> SQLite : python booking.py migrate
+   if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+      count = sum(SqliteStore(partition_path(SQLITE_PATH, i, PARTITIONS)).migrate(partition_path(JSON_PATH, i, PARTITIONS),
+                                                                                  archived_bookings(i, PARTITIONS))
+                  for i in range(PARTITIONS))
+      print("%d users migrated to %s" % (count, ", ".join(partition_path(SQLITE_PATH, i, PARTITIONS)
+                                                          for i in range(PARTITIONS))))
+      sys.exit(0)
    print("Server running in port %s"%(PORT))
-   app.run(host=HOST, port=PORT)
+   if RECONCILE_AS:
+      if WORKERS > 1:
+         # chaque worker suit les flux et répare de son côté : les suppressions déjà faites sont sans effet
+         os.register_at_fork(after_in_child=reconciler.start)
+      else:
+         reconciler.start()
+   if WORKERS > 1:
+      print("Serving with %d workers" % WORKERS)
+      serve_prefork(app, HOST, PORT, WORKERS)
+   else:
+      app.run(host=HOST, port=PORT)
@@ -0,0 +1,87 @@
+"""
+Booking analytics: the counters maintained by add / delete / delete_user
+must equal a full recount of the store (/bookings/analytics/verify).
+
+Each test loads booking.py from a temporary copy of the databases, with
+the User and Schedule services answered by stubs.
+
+Usage: python -m pytest booking/test_analytics.py
+"""
+import importlib.util, os, shutil
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADMIN = "admin"
+MOVIE = "267eedb8-0f5d-42d5-8f43-72426b9fb3e6"
+OTHER = "7daf7208-be4d-4944-a3ae-c1c2f516f3e6"
+
+class StubResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, "booking.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(params=["json", "sqlite"])
+def booking(request, tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(HERE, "databases"), tmp_path / "databases")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("BOOKING_STORAGE", request.param)
+    if request.param == "sqlite":
+        # migration avant le démarrage testé, comme python booking.py migrate
+        load("booking_migrate").store.migrate("databases/bookings.json")
+    module = load("booking_test_%s" % request.param)
+    module.store.load()
+    # User : seul ADMIN est admin ; Schedule : les deux films sont programmés à toutes les dates
+    module.user_client.get = lambda path, **kwargs: StubResponse(200, {"is_admin": path.split("/")[2] == ADMIN})
+    module.schedule_client.get = lambda path, **kwargs: StubResponse(200, [MOVIE, OTHER])
+    return module
+
+def verify(client):
+    r = client.get("/%s/bookings/analytics/verify" % ADMIN)
+    assert r.status_code == 200
+    result = r.get_json()
+    assert result["consistent"], result
+    assert result["total"] == result["recounted"]
+    return result["total"]
+
+def book(client, userid, date, movie):
+    return client.post("/%s/bookings/%s" % (ADMIN, userid), json={"date": date, "movie_id": movie}).status_code
+
+def test_counters_match_recount(booking, monkeypatch):
+    client = booking.app.test_client()
+    total = verify(client)
+    assert total == 7
+    # à partir d'ici les compteurs doivent suivre chaque mutation, sans reconstruction depuis le store
+    for counters in booking.analytics:
+        monkeypatch.setattr(counters, "rebuild", lambda *args: pytest.fail("counters rebuilt from the store"))
+
+    assert book(client, "new_user", "20151203", MOVIE) == 200 # nouvel utilisateur
+    assert book(client, "chris_rivers", "20151201", OTHER) == 200 # date existante
+    assert book(client, "chris_rivers", "20151209", OTHER) == 200 # nouvelle date
+    assert book(client, "chris_rivers", "20151209", OTHER) == 400 # déjà réservé : compteurs inchangés
+    assert verify(client) == total + 3
+
+    assert client.delete("/%s/bookings/chris_rivers/20151201/%s" % (ADMIN, MOVIE)).status_code == 200
+    assert client.delete("/%s/bookings/chris_rivers/20151201/%s" % (ADMIN, MOVIE)).status_code == 404
+    assert client.delete("/%s/bookings/garret_heaton/20151231/%s" % (ADMIN, MOVIE)).status_code == 404
+    assert verify(client) == total + 2
+
+    assert client.delete("/%s/bookings/dwight_schrute" % ADMIN).status_code == 200
+    assert client.delete("/%s/bookings/dwight_schrute" % ADMIN).status_code == 404
+    assert verify(client) == total - 2
+
+    top = client.get("/%s/bookings/analytics/users?top=1" % ADMIN).get_json()
+    assert top["total"] == total - 2
+    assert top["users"][0]["bookings"] == 2
+
+def test_rejects_non_admin(booking):
+    client = booking.app.test_client()
+    assert client.get("/chris_rivers/bookings/analytics/verify").status_code == 403
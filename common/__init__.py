@@ -0,0 +1,38 @@
+"""
+Infrastructure shared by the Movie, User, Schedule and Booking services.
+
+Each service keeps its data, routes and per-service settings; what they all
+need lives here, one module per concern:
+
+    metrics      Prometheus counters and histograms (/metrics)
+    tracing      X-Request-ID propagation and span log
+    profiling    on-demand cProfile and slow request stack sampler
+    admission    rate limiting and load shedding
+    compression  Accept-Encoding negotiation and compressed response cache
+    client       deadlines, pooled clients with circuit breakers, change feed followers
+    fragments    canonical JSON, fragment cache, NDJSON and change log
+    snapshot     marshal snapshots of the JSON files
+    events       Server-Sent Events hub
+    server       pre-forked multi-process server
+"""
+from common import metrics, tracing, profiling, admission, compression, client
+
+def install(app, service, rate_limits=None, deadlines=None):
+    """
+    Install the request hooks of the shared infrastructure on a service.
+
+    Settings prefixed by the service name (BOOKING_SPAN_LOG, MOVIE_RATE_LIMIT...)
+    are read from the environment here.
+
+    Args:
+        app (Flask): Application of the service.
+        service (str): Service name ("movie", "user", "schedule" or "booking").
+        rate_limits (dict): endpoint -> (requests/s, burst), for the routes with their own rate limit.
+        deadlines (dict): endpoint -> seconds, for the routes that chain several outbound calls.
+    """
+    metrics.install(app)
+    tracing.install(app, service)
+    profiling.install(app, service)
+    admission.install(app, service, rate_limits)
+    compression.install(app)
+    client.install(app, deadlines)
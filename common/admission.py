@@ -0,0 +1,112 @@
+"""
+Admission control: token bucket per (user_id, route) and a global limit
+of in-flight requests, with a short bounded queue.
+"""
+from flask import request, jsonify, make_response, g
+import time, os, threading, math
+from collections import OrderedDict
+
+from common.metrics import Counter
+
+# contrôle d'admission : seau à jetons par (user_id, route) et limite globale de requêtes en cours
+RATE_LIMIT = 50 # requêtes/s par utilisateur et par route
+RATE_BURST = 100
+ROUTE_RATE_LIMITS = {} # endpoint -> (requêtes/s, rafale)
+MAX_CONCURRENCY = 64 # requêtes traitées en parallèle
+MAX_QUEUE = 64 # requêtes en attente au-delà : rejet immédiat (503)
+QUEUE_TIMEOUT = 1.0 # secondes d'attente maximale d'une place
+MAX_BUCKETS = 100000 # au-delà, les seaux les moins récemment utilisés sont oubliés (un seau plein équivaut à un seau absent)
+ADMISSION_EXEMPT = {"ready", "metrics"}
+rate_buckets = OrderedDict() # (user_id, endpoint) -> [jetons, date de la dernière mise à jour], du moins au plus récent
+buckets_lock = threading.Lock()
+slots = threading.BoundedSemaphore(MAX_CONCURRENCY) # une place par requête en cours de traitement
+queued = 0 # requêtes en attente d'une place
+queue_lock = threading.Lock()
+ADMISSION_REJECTED_TOTAL = Counter("admission_rejected_total", "Requests rejected by admission control.",
+                                   ("route", "reason"))
+
+def take_token(key, rate, burst):
+    """
+    Take one token from the bucket of key.
+
+    Returns:
+        float: 0 if a token was taken, otherwise the seconds until the next one.
+    """
+    now = time.monotonic()
+    with buckets_lock:
+        bucket = rate_buckets.get(key)
+        if bucket is None:
+            if len(rate_buckets) >= MAX_BUCKETS:
+                rate_buckets.popitem(last=False)
+            bucket = rate_buckets[key] = [burst, now]
+        else:
+            rate_buckets.move_to_end(key)
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+        bucket[0] = tokens - 1
+        return 0
+
+def reject(status, reason, retry_after):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    ADMISSION_REJECTED_TOTAL.inc((route, reason))
+    response = make_response(jsonify({"error": reason}), status)
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def admit_request():
+    """
+    Rate-limit per user and route (429), then shed load beyond MAX_CONCURRENCY
+    in-flight requests plus MAX_QUEUE waiting ones (503).
+    """
+    global queued
+    if request.endpoint in ADMISSION_EXEMPT:
+        return None
+    rate, burst = ROUTE_RATE_LIMITS.get(request.endpoint, (RATE_LIMIT, RATE_BURST))
+    user_id = (request.view_args or {}).get("user_id") or request.remote_addr
+    wait = take_token((user_id, request.endpoint), rate, burst)
+    if wait:
+        return reject(429, "rate limit exceeded", wait)
+    if not slots.acquire(blocking=False):
+        with queue_lock:
+            if queued >= MAX_QUEUE:
+                return reject(503, "server overloaded", QUEUE_TIMEOUT)
+            queued += 1
+        # file d'attente : réveillé par le release d'une requête terminée, au plus QUEUE_TIMEOUT secondes
+        try:
+            admitted = slots.acquire(timeout=QUEUE_TIMEOUT)
+        finally:
+            with queue_lock:
+                queued -= 1
+        if not admitted:
+            return reject(503, "server overloaded", QUEUE_TIMEOUT)
+    g.admitted = True
+    return None
+
+def release_request(exc):
+    # seules les requêtes admises ont pris une place (pas les exemptées ni les rejetées)
+    if g.pop("admitted", False):
+        slots.release()
+
+def install(app, service, route_limits=None):
+    """
+    Put a service behind admission control, tuned by the <SERVICE>_RATE_LIMIT,
+    _RATE_BURST, _MAX_CONCURRENCY and _MAX_QUEUE environment variables.
+
+    Args:
+        app (Flask): Application of the service.
+        service (str): Service name.
+        route_limits (dict): endpoint -> (requests/s, burst), for the routes with their own limit.
+    """
+    global RATE_LIMIT, RATE_BURST, MAX_CONCURRENCY, MAX_QUEUE, slots
+    prefix = service.upper()
+    RATE_LIMIT = float(os.environ.get(prefix + "_RATE_LIMIT", 50))
+    RATE_BURST = float(os.environ.get(prefix + "_RATE_BURST", 100))
+    ROUTE_RATE_LIMITS.update(route_limits or {})
+    MAX_CONCURRENCY = int(os.environ.get(prefix + "_MAX_CONCURRENCY", 64))
+    slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+    MAX_QUEUE = int(os.environ.get(prefix + "_MAX_QUEUE", 64))
+    app.before_request(admit_request)
+    app.teardown_request(release_request)
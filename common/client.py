@@ -0,0 +1,271 @@
+"""
+Outbound calls between services: end-to-end deadlines, pooled keep-alive
+clients with a circuit breaker per target, and followers of a remote
+change feed.
+"""
+from flask import request, jsonify, make_response, g, has_request_context
+import time, os, threading
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.metrics import OUTBOUND_SECONDS
+from common.tracing import span, REQUEST_ID_HEADER, PARENT_SPAN_HEADER
+
+# délai de bout en bout : budget restant reçu en en-tête (ms) ou défaut par route, propagé à chaque appel sortant
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+DEFAULT_DEADLINE = float(os.environ.get("DEFAULT_DEADLINE", 5)) # secondes
+ROUTE_DEADLINES = {} # endpoint -> secondes, pour les routes qui enchaînent plusieurs appels
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised instead of an outbound call when the request has no time budget left."""
+
+def start_deadline():
+    """
+    Attach the deadline of the incoming request, refusing already expired work.
+
+    Returns:
+        Response or None: 504 if the caller's budget is already spent, None otherwise.
+    """
+    seconds = ROUTE_DEADLINES.get(request.endpoint, DEFAULT_DEADLINE)
+    budget = request.headers.get(DEADLINE_HEADER)
+    if budget is not None:
+        try:
+            seconds = float(budget) / 1000
+        except ValueError:
+            pass
+        if seconds <= 0:
+            return make_response(jsonify({"error": "deadline exceeded"}), 504)
+    g.deadline = time.monotonic() + seconds
+
+def remaining_budget():
+    """
+    Seconds left before the deadline of the current request.
+
+    Returns:
+        float: Remaining budget (DEFAULT_DEADLINE outside of a request).
+    """
+    deadline = g.get("deadline") if has_request_context() else None
+    if deadline is None:
+        return DEFAULT_DEADLINE
+    return deadline - time.monotonic()
+
+# client HTTP partagé : session keep-alive poolée + disjoncteur par service cible
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10)) # connexions gardées ouvertes par service cible
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5)) # échecs consécutifs avant d'ouvrir le circuit
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", 10)) # secondes avant de retenter (half-open)
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without touching the network while the circuit of a target is open."""
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker.
+
+    Only transport errors (connection refused, timeout...) count as failures:
+    the services answer 500 for "not found", so status codes are not used.
+    """
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.max_failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+        self.opened_total = 0
+        self.rejected_total = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time.time() - self.opened_at >= self.reset:
+                self.state = "half_open" # une seule requête d'essai passe
+                return True
+            if self.state != "closed":
+                self.rejected_total += 1
+                return False
+            return True
+
+    def success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def abandon(self):
+        # appel interrompu par une erreur qui n'est pas réseau : ni succès ni échec, l'essai half-open est rendu
+        with self.lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.max_failures:
+                if self.state != "open":
+                    self.opened_total += 1
+                self.state = "open"
+                self.opened_at = time.time()
+
+class ServiceClient:
+    """
+    Pooled keep-alive HTTP client for one downstream service.
+
+    Args:
+        name (str): Name of the target service (used in metrics).
+        base_url (str): Base URL of the target service.
+        pool_size (int): Maximum number of pooled connections to the target.
+    """
+    def __init__(self, name, base_url, pool_size=HTTP_POOL_SIZE):
+        self.name = name
+        self.base_url = base_url
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, path, call="get", **kwargs):
+        """
+        GET a path of the target service.
+
+        The remaining budget of the current request is used as timeout and
+        forwarded downstream in the X-Request-Timeout-Ms header, along with the
+        X-Request-ID of the current request and the id of the outbound span.
+
+        Args:
+            path (str): Path on the target service.
+            call (str): Name of the call, used as label in the outbound metrics.
+
+        Raises:
+            DeadlineExceeded: If the request has no budget left (no network call).
+            CircuitOpenError: If the circuit is open (fails fast, no network call).
+            requests.exceptions.RequestException: On transport errors.
+        """
+        remaining = remaining_budget()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline exceeded before calling {self.name} service")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"circuit open for {self.name} service")
+        outcome = None
+        try:
+            kwargs.setdefault("timeout", remaining)
+            with span(f"{self.name}.{call}") as span_id:
+                headers = {DEADLINE_HEADER: str(int(remaining * 1000))}
+                if has_request_context() and "request_id" in g:
+                    headers[REQUEST_ID_HEADER] = g.request_id
+                    headers[PARENT_SPAN_HEADER] = span_id
+                kwargs["headers"] = dict(kwargs.get("headers") or {}, **headers)
+                start = time.perf_counter()
+                try:
+                    r = self.session.get(self.base_url + path, **kwargs)
+                except requests.exceptions.RequestException:
+                    outcome = "error"
+                    OUTBOUND_SECONDS.observe((self.name, call, "error"), time.perf_counter() - start)
+                    raise
+                outcome = "ok"
+                OUTBOUND_SECONDS.observe((self.name, call, "ok"), time.perf_counter() - start)
+        finally:
+            # toute issue est rapportée au disjoncteur : un essai half-open ne reste jamais sans réponse
+            if outcome == "ok":
+                self.breaker.success()
+            elif outcome == "error":
+                self.breaker.failure()
+            else:
+                self.breaker.abandon()
+        return r
+
+def breaker_metrics(clients):
+    """
+    Render the circuit breaker state of each client in Prometheus text format.
+
+    Args:
+        clients (list of ServiceClient): Clients to report.
+
+    Returns:
+        list of str: Metric lines.
+    """
+    lines = [
+        "# HELP http_client_circuit_state Circuit breaker state (0 closed, 1 half-open, 2 open).",
+        "# TYPE http_client_circuit_state gauge",
+    ]
+    lines += ['http_client_circuit_state{target="%s"} %d' % (c.name, CircuitBreaker.STATES[c.breaker.state]) for c in clients]
+    lines += ["# HELP http_client_circuit_failures Consecutive transport failures.",
+              "# TYPE http_client_circuit_failures gauge"]
+    lines += ['http_client_circuit_failures{target="%s"} %d' % (c.name, c.breaker.failures) for c in clients]
+    lines += ["# HELP http_client_circuit_opened_total Times the circuit opened.",
+              "# TYPE http_client_circuit_opened_total counter"]
+    lines += ['http_client_circuit_opened_total{target="%s"} %d' % (c.name, c.breaker.opened_total) for c in clients]
+    lines += ["# HELP http_client_circuit_rejected_total Calls failed fast while the circuit was open.",
+              "# TYPE http_client_circuit_rejected_total counter"]
+    lines += ['http_client_circuit_rejected_total{target="%s"} %d' % (c.name, c.breaker.rejected_total) for c in clients]
+    return lines
+
+class IdFollower:
+    """
+    Ids of a remote collection, kept up to date through its change feed.
+
+    The full list is read once (then again on a 410 or a new epoch); after
+    that each poll only fetches the changes since the last version.
+
+    Args:
+        client (ServiceClient): Client of the service holding the collection.
+        resource (str): Collection, as in /<user_id>/<resource>/json and /changes.
+        user_id (str): Admin on whose behalf the collection is read.
+        timeout (float): Seconds allowed to read the full list.
+    """
+    def __init__(self, client, resource, user_id, timeout=60):
+        self.client = client
+        self.resource = resource
+        self.user_id = user_id
+        self.timeout = timeout
+        self.ids = None
+        self.version = None
+        self.epoch = None
+
+    def poll(self):
+        """
+        Catch up with the remote collection.
+
+        Returns:
+            tuple: (added ids, removed ids) since the previous poll, (None, None) on the first load.
+        """
+        if self.ids is not None:
+            r = self.client.get(f"/{self.user_id}/{self.resource}/changes?since={self.version}", call=self.resource + "_changes")
+            if r.status_code != 410:
+                r.raise_for_status()
+                data = r.json()
+                if data["epoch"] == self.epoch:
+                    added, removed = set(), set()
+                    for change in data["changes"]:
+                        key = str(change["key"])
+                        if change["kind"] == "delete":
+                            self.ids.discard(key)
+                            added.discard(key)
+                            removed.add(key)
+                        else:
+                            self.ids.add(key)
+                            removed.discard(key)
+                            added.add(key)
+                    self.version = data["version"]
+                    return added, removed
+        # première lecture, ou flux perdu : liste complète, différence avec l'état connu
+        r = self.client.get(f"/{self.user_id}/{self.resource}/json", call=self.resource + "_all", timeout=self.timeout)
+        r.raise_for_status()
+        previous = self.ids
+        self.ids = {str(record["id"]) for record in r.json()}
+        self.version = int(r.headers["X-Data-Version"])
+        self.epoch = r.headers["X-Data-Epoch"]
+        if previous is None:
+            return None, None
+        return self.ids - previous, previous - self.ids
+
+def install(app, route_deadlines=None):
+    """
+    Attach a deadline to each request of a service.
+
+    Args:
+        app (Flask): Application of the service.
+        route_deadlines (dict): endpoint -> seconds, for the routes that chain several calls.
+    """
+    ROUTE_DEADLINES.update(route_deadlines or {})
+    app.before_request(start_deadline)
@@ -0,0 +1,97 @@
+"""
+Response compression according to Accept-Encoding, with the compressed
+bytes of versioned responses cached per data version.
+"""
+from flask import request, g
+import os, gzip, threading
+from collections import OrderedDict
+
+# compression des réponses selon Accept-Encoding (zstd / brotli seulement si installés)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024)) # octets : en dessous, pas de compression
+COMPRESSED_CACHE_SIZE = 64 # nombre de réponses compressées gardées en cache
+
+# encodages disponibles, par ordre de préférence à qualité égale
+COMPRESSORS = {}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+if brotli is not None:
+    COMPRESSORS["br"] = lambda data: brotli.compress(data, quality=5)
+COMPRESSORS["gzip"] = lambda data: gzip.compress(data, compresslevel=6)
+
+# cache des réponses versionnées : clé -> (version des données [, génération], octets compressés)
+compressed_cache = OrderedDict()
+compressed_cache_lock = threading.Lock()
+
+def negotiate_encoding():
+    """
+    Pick the best encoding accepted by the client among the available ones.
+
+    Returns:
+        str or None: "zstd", "br", "gzip", or None to send the body as is.
+    """
+    accepted = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in COMPRESSORS:
+        quality = accepted.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress_response(response):
+    """
+    Compress large responses; versioned ones are compressed once per data version.
+
+    A handler marks its response as versioned by setting g.data_version to the
+    store version read before building the body. A body that also shows changes
+    kept out of the data versions (user activity) sets g.cache_generation to a
+    counter of those changes: the cached bytes are reused only while both match.
+
+    Args:
+        response (Response): Outgoing response.
+
+    Returns:
+        Response: The response, compressed when worth it.
+    """
+    if response.status_code != 200 or response.is_streamed or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_SIZE:
+        return response
+
+    version = g.get("data_version")
+    if version is not None and "cache_generation" in g:
+        version = (version, g.cache_generation)
+    key = (request.endpoint, tuple(sorted((k, v) for k, v in (request.view_args or {}).items() if k != "user_id")),
+           request.query_string, encoding)
+    cached = None
+    if version is not None:
+        with compressed_cache_lock:
+            cached = compressed_cache.get(key)
+            if cached is not None:
+                compressed_cache.move_to_end(key)
+    if cached is not None and cached[0] == version:
+        compressed = cached[1]
+    else:
+        compressed = COMPRESSORS[encoding](response.get_data())
+        if version is not None:
+            with compressed_cache_lock:
+                compressed_cache[key] = (version, compressed)
+                if len(compressed_cache) > COMPRESSED_CACHE_SIZE:
+                    compressed_cache.popitem(last=False)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+def install(app):
+    app.after_request(compress_response)
@@ -0,0 +1,285 @@
+"""
+Server-Sent Events: one thread (selectors) serves every subscriber of a
+service's change log, on a dedicated port.
+"""
+import time, json, socket, collections, re, selectors, threading, urllib.parse, concurrent.futures
+from http import HTTPStatus
+
+from common.fragments import encode
+
+# Server-Sent Events : un seul thread (selectors) sert tous les abonnés, sur un port dédié
+EVENTS_KEEPALIVE = 15 # secondes sans écriture avant un commentaire ": keep-alive" (détecte les abonnés partis)
+EVENTS_POLL = 0.5 # secondes : rattrapage des mutations des autres workers (mode multi-process)
+EVENTS_MAX_PENDING = 1 << 20 # octets en attente pour un abonné : au-delà, abonné trop lent, déconnecté
+EVENTS_MAX_HEADER = 8192
+EVENTS_HEADER_TIMEOUT = 10 # secondes pour recevoir la requête complète : au-delà, connexion fermée
+EVENTS_MAX_SUBSCRIBERS = 1000 # connexions ouvertes (abonnés et requêtes en cours) : au-delà, 503
+EVENTS_AUTH_THREADS = 4 # appels verify_admin des nouvelles connexions, hors du thread des abonnés
+
+class Subscriber:
+    """
+    One connection to the events port, from its request to the end of its stream.
+
+    Args:
+        sock (socket.socket): Non-blocking connection.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = b""
+        self.outbox = bytearray()
+        self.state = "request" # request -> auth -> streaming, ou closing (réponse d'erreur)
+        self.writing = False # inscrit en écriture dans le selector
+        self.accepted = self.last_write = time.monotonic()
+
+class EventHub:
+    """
+    Server-Sent Events stream of the change log, for every subscriber, from one thread.
+
+    Subscribers connect to the events port with GET /<user_id>/<resource>/events.
+    The thread multiplexes all their sockets with selectors: an idle subscriber
+    costs a socket and a buffer, not a thread. Only the verify_admin call of
+    a new connection runs in a small thread pool. Beyond EVENTS_MAX_SUBSCRIBERS
+    open connections a new one is answered 503, and a connection that has not
+    sent its whole request within EVENTS_HEADER_TIMEOUT is closed.
+
+    Each event is a change of the change log (data {"key", "kind", "value",
+    "version"}, with "event" and "delta" when the mutation named what it
+    changed), with id "<epoch>-<version>". It is named after that event, or
+    after the kind of the change otherwise. A client
+    that reconnects with Last-Event-ID (or ?last_event_id=) gets the changes it
+    missed, or a "resync" event if they fell out of the log (reload the full
+    list, then follow the stream).
+
+    Args:
+        app (Flask): Application of the service, for the app context of verify_admin.
+        store: Store of the service (changes, listeners, sync).
+        verify_admin (callable): user_id -> (is_admin, error response).
+        path (str): Regular expression of the request path, capturing the user_id and the query string.
+        names (dict): Change kind ("upsert" or "delete") -> event name, for the changes without a named event.
+    """
+    def __init__(self, app, store, verify_admin, path, names):
+        self.app = app
+        self.store = store
+        self.verify_admin = verify_admin
+        self.path = re.compile(path)
+        self.names = {kind: name.encode() for kind, name in names.items()}
+        self.listener = None
+        self.selector = None
+        self.wake_w = None
+        self.auth = None
+        self.subscribers = {}
+        self.version = 0 # dernière version du journal diffusée
+        self.pending = collections.deque() # (abonné, réponse d'erreur ou None, Last-Event-ID) venant de l'authentification
+        store.listeners.append(self.notify)
+
+    def listen(self, host, port):
+        # socket ouverte avant un éventuel fork : partagée par les workers, comme le port HTTP
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(1024)
+        self.listener.setblocking(False)
+
+    def start(self):
+        self.selector = selectors.DefaultSelector()
+        wake_r, self.wake_w = socket.socketpair()
+        wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.subscribers = {}
+        self.auth = concurrent.futures.ThreadPoolExecutor(EVENTS_AUTH_THREADS)
+        self.selector.register(self.listener, selectors.EVENT_READ, "accept")
+        self.selector.register(wake_r, selectors.EVENT_READ, "wake")
+        self.version = self.store.changes.version
+        threading.Thread(target=self.run, daemon=True).start()
+
+    # appelé à chaque mutation (listener du store) : réveille le thread des abonnés
+    def notify(self, key=None):
+        if self.wake_w is not None:
+            try:
+                self.wake_w.send(b"\0")
+            except OSError:
+                pass # tampon plein : un réveil est déjà en attente
+
+    def run(self):
+        next_sweep = time.monotonic() + EVENTS_HEADER_TIMEOUT
+        while True:
+            for key, mask in self.selector.select(EVENTS_POLL if self.subscribers else None):
+                if key.data == "accept":
+                    self.accept()
+                elif key.data == "wake":
+                    try:
+                        key.fileobj.recv(4096)
+                    except OSError:
+                        pass
+                else:
+                    sub = key.data
+                    if mask & selectors.EVENT_READ and sub.state != "closing":
+                        self.read(sub)
+                    if mask & selectors.EVENT_WRITE and sub.sock in self.subscribers:
+                        self.write(sub)
+            while self.pending:
+                self.subscribe(*self.pending.popleft())
+            if self.subscribers:
+                self.store.sync() # mutations des autres workers
+                self.broadcast()
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self.sweep(now)
+                    next_sweep = now + EVENTS_HEADER_TIMEOUT
+
+    # keep-alive des abonnés inactifs, fermeture des connexions dont la requête n'arrive pas
+    def sweep(self, now):
+        for sub in list(self.subscribers.values()):
+            if sub.state == "streaming" and now - sub.last_write >= EVENTS_KEEPALIVE:
+                sub.outbox += b": keep-alive\n\n"
+                self.write(sub)
+            elif sub.state == "request" and now - sub.accepted >= EVENTS_HEADER_TIMEOUT:
+                self.close(sub)
+
+    def accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except OSError:
+            return # connexion déjà prise par un autre worker
+        sock.setblocking(False)
+        sub = Subscriber(sock)
+        full = len(self.subscribers) >= EVENTS_MAX_SUBSCRIBERS
+        self.subscribers[sock] = sub
+        self.selector.register(sock, selectors.EVENT_READ, sub)
+        if full:
+            self.reply(sub, 503, {"error": "too many subscribers"})
+
+    def read(self, sub):
+        try:
+            data = sub.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.close(sub)
+            return
+        if sub.state != "request":
+            return # rien n'est attendu du client une fois la requête reçue
+        sub.inbox += data
+        head, found, _ = sub.inbox.partition(b"\r\n\r\n")
+        if not found:
+            if len(sub.inbox) > EVENTS_MAX_HEADER:
+                self.reply(sub, 431, {"error": "request header too large"})
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        match = self.path.match(parts[1]) if len(parts) == 3 else None
+        if match is None:
+            self.reply(sub, 404, {"error": "not found"})
+            return
+        if parts[0] != "GET":
+            self.reply(sub, 405, {"error": "method not allowed"})
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        query = urllib.parse.parse_qs(match.group(2) or "")
+        last_id = headers.get("last-event-id") or query.get("last_event_id", [None])[0]
+        sub.state = "auth"
+        self.auth.submit(self.authenticate, sub, match.group(1), last_id)
+
+    def authenticate(self, sub, user_id, last_id):
+        with self.app.app_context():
+            try:
+                is_admin, error = self.verify_admin(user_id)
+                if error is not None:
+                    error = (error.status_code, error.get_json())
+                elif not is_admin:
+                    error = (403, {"error": "Unauthorized: admin access required"})
+            except Exception:
+                error = (500, {"error": "unable to verify user"})
+        self.pending.append((sub, error, last_id))
+        self.notify()
+
+    def subscribe(self, sub, error, last_id):
+        if sub.sock not in self.subscribers:
+            return # parti pendant l'authentification
+        if error is not None:
+            self.reply(sub, *error)
+            return
+        self.broadcast() # journal diffusé jusqu'à self.version avant de rejouer
+        epoch = self.store.changes.epoch
+        sub.outbox += (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                       b"Access-Control-Allow-Origin: *\r\nX-Data-Epoch: " + epoch.encode() +
+                       b"\r\nX-Data-Version: " + str(self.version).encode() + b"\r\n\r\nretry: 1000\n\n")
+        sub.state = "streaming"
+        if last_id is not None:
+            last_epoch, _, version = last_id.rpartition("-")
+            changes = None
+            if last_epoch == epoch and version.isdigit():
+                _, changes = self.store.changes.since(int(version))
+            if changes is None:
+                sub.outbox += self.resync_event(self.version)
+            else:
+                for entry in changes:
+                    event, version = self.event(entry)
+                    if version <= self.version: # les suivantes partiront avec le prochain broadcast
+                        sub.outbox += event
+        self.write(sub)
+
+    def event(self, entry):
+        change = json.loads(entry)
+        name = change["event"].encode() if "event" in change else self.names[change["kind"]]
+        return (b"id: %s-%d\nevent: %s\ndata: %s\n\n" % (self.store.changes.epoch.encode(), change["version"],
+                                                             name, entry), change["version"])
+
+    def resync_event(self, version):
+        epoch = self.store.changes.epoch
+        return (b"id: %s-%d\nevent: resync\ndata: %s\n\n" % (epoch.encode(), version,
+                                                            encode({"epoch": epoch, "version": version})))
+
+    def broadcast(self):
+        version, changes = self.store.changes.since(self.version)
+        if changes is None:
+            events = self.resync_event(version)
+        elif changes:
+            events = b"".join(self.event(entry)[0] for entry in changes)
+        else:
+            return
+        self.version = version
+        for sub in list(self.subscribers.values()):
+            if sub.state == "streaming":
+                sub.outbox += events
+                self.write(sub)
+
+    def reply(self, sub, status, body):
+        data = encode(body) + b"\n"
+        sub.outbox += (b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                       b"Connection: close\r\n\r\n" % (status, HTTPStatus(status).phrase.encode(), len(data)) + data)
+        sub.state = "closing"
+        self.write(sub)
+
+    def write(self, sub):
+        try:
+            sent = sub.sock.send(sub.outbox)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self.close(sub)
+            return
+        if sent:
+            del sub.outbox[:sent]
+            sub.last_write = time.monotonic()
+        if not sub.outbox and sub.state == "closing":
+            self.close(sub)
+        elif len(sub.outbox) > EVENTS_MAX_PENDING:
+            self.close(sub)
+        elif bool(sub.outbox) != sub.writing:
+            # en attente d'écriture seulement s'il reste des octets : sinon le selector se réveillerait sans cesse
+            sub.writing = bool(sub.outbox)
+            self.selector.modify(sub.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if sub.writing else 0), sub)
+
+    def close(self, sub):
+        if self.subscribers.pop(sub.sock, None) is not None:
+            self.selector.unregister(sub.sock)
+            sub.sock.close()
+
+    def subscribed(self):
+        return sum(1 for sub in list(self.subscribers.values()) if sub.state == "streaming")
@@ -0,0 +1,133 @@
+"""
+Pre-encoded JSON: canonical encoding, responses built from bytes, cache of
+per-record fragments, NDJSON streams and the in-memory change log.
+"""
+from flask import current_app
+import json, threading, collections, itertools
+
+# encodage JSON canonique, identique à la sortie de jsonify (clés triées, séparateurs compacts)
+def encode(obj):
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(",", ":")).encode()
+
+# construit une réponse JSON à partir d'octets déjà encodés (sans repasser par jsonify)
+def json_response(body, status=200):
+    return current_app.response_class(body + b"\n", status=status, mimetype="application/json")
+
+def join_fragments(fragments):
+    return b"[" + b",".join(fragments) + b"]"
+
+# import/export en masse (NDJSON : un objet JSON par ligne)
+def read_ndjson(stream):
+    """
+    Parse an NDJSON body line by line, without reading it whole.
+
+    Args:
+        stream: Binary file-like object (request.stream).
+
+    Yields:
+        tuple: (line number, parsed object), or (line number, ValueError) for an invalid line.
+    """
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, e
+
+def ndjson_response(records):
+    return current_app.response_class((record + b"\n" for record in records), mimetype="application/x-ndjson")
+
+class FragmentCache:
+    """
+    Encoded JSON bytes of each record, keyed by record id.
+
+    A fragment is encoded on first use and dropped as soon as its record is
+    mutated; the generation counter keeps a fragment encoded concurrently with
+    a mutation from being cached.
+
+    Args:
+        serialize (callable): record -> encoded bytes, the canonical encoding by default.
+    """
+    def __init__(self, serialize=encode):
+        self.serialize = serialize
+        self.fragments = {}
+        self.generation = 0
+
+    def get(self, key, record):
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            generation = self.generation
+            fragment = self.serialize(record)
+            if generation == self.generation:
+                self.fragments[key] = fragment
+        return fragment
+
+    def invalidate(self, key):
+        self.generation += 1
+        self.fragments.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self.fragments.clear()
+
+# journal en mémoire des dernières mutations, servi par /<user_id>/<ressource>/changes?since=N
+CHANGELOG_SIZE = 10000
+
+class ChangeLog:
+    """
+    Bounded, ordered log of the last mutations, each entry pre-encoded as a
+    JSON fragment {"version", "kind" ("upsert" or "delete"), "key", "value"},
+    plus {"event", "delta"} when the mutation named what it changed.
+
+    A follower that keeps up asks for the changes after its last version;
+    one that fell out of the window (or saw another epoch) must resync from
+    the full list.
+
+    Args:
+        epoch (str): Identifies the version sequence (a restart of the JSON backend starts a new one).
+        version (int): Version of the data when the log starts.
+        size (int): Number of changes kept.
+    """
+    def __init__(self, epoch, version, size=CHANGELOG_SIZE):
+        self.epoch = epoch
+        self.version = version
+        self.first = version + 1 # plus ancienne version encore présente dans le journal
+        self.entries = collections.deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def append(self, version, key, record, event=None):
+        change = {"version": version, "kind": "delete" if record is None else "upsert", "key": key, "value": record}
+        if event is not None:
+            change["event"], change["delta"] = event # (nom, ce que la mutation a changé)
+        entry = encode(change)
+        with self.lock:
+            if len(self.entries) == self.entries.maxlen:
+                self.first = self.entries[0][0] + 1
+            self.entries.append((version, entry))
+            self.version = version
+
+    def reset(self, version):
+        # trou dans la suite des versions : rien de ce qui précède n'est plus servable
+        with self.lock:
+            self.entries.clear()
+            self.first = version + 1
+            self.version = version
+
+    def since(self, version):
+        """
+        Changes after a version, newest last, in O(number of changes returned).
+
+        Args:
+            version (int): Last version the caller has applied.
+
+        Returns:
+            tuple: (current version, list of encoded changes), the list is None
+            if the caller must resync.
+        """
+        with self.lock:
+            if version < self.first - 1 or version > self.version:
+                return self.version, None
+            newer = list(itertools.takewhile(lambda e: e[0] > version, reversed(self.entries)))
+            return self.version, [entry for _, entry in reversed(newer)]
@@ -0,0 +1,115 @@
+"""
+In-memory Prometheus metrics (counters and histograms), rendered by /metrics.
+"""
+from flask import request, g
+import time, threading, bisect
+
+# métriques Prometheus en mémoire (compteurs et histogrammes), exposées sur /metrics
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS = [] # toutes les métriques déclarées, dans l'ordre d'affichage
+
+def label_pairs(labels, values):
+    return ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in zip(labels, values))
+
+class Counter:
+    """
+    Monotonic counter, one series per tuple of label values.
+
+    Args:
+        name (str): Metric name.
+        help (str): Metric description.
+        labels (tuple of str): Label names.
+    """
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def inc(self, values, amount=1):
+        with self.lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        for values, value in sorted(self.series.items()):
+            lines.append("%s{%s} %s" % (self.name, label_pairs(self.labels, values), value))
+        return lines
+
+class Histogram:
+    """
+    Fixed-bucket histogram, one series per tuple of label values.
+
+    An observation is one bisect and a few additions under a lock (a couple of
+    microseconds); buckets are only accumulated when rendered.
+
+    Args:
+        name (str): Metric name.
+        help (str): Metric description.
+        labels (tuple of str): Label names.
+        buckets (tuple of float): Upper bounds of the buckets, in seconds.
+    """
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {} # valeurs des labels -> [compte par bucket..., +Inf, somme, total]
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def observe(self, values, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(values)
+            if series is None:
+                series = self.series[values] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        for values, series in sorted(self.series.items()):
+            labels = label_pairs(self.labels, values)
+            cumulated = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulated += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (self.name, labels, bound, cumulated))
+            lines.append("%s_sum{%s} %.6f" % (self.name, labels, series[-2]))
+            lines.append("%s_count{%s} %d" % (self.name, labels, series[-1]))
+        return lines
+
+REQUESTS_TOTAL = Counter("http_requests_total", "Requests handled, per route, method and status.",
+                         ("route", "method", "status"))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Request handling time, per route.", ("route", "method"))
+OUTBOUND_SECONDS = Histogram("http_client_request_duration_seconds", "Outbound call time, per target service and call.",
+                             ("target", "call", "outcome"))
+ADMIN_CACHE_TOTAL = Counter("user_admin_cache_total", "user_admin_cache lookups (hit, miss, expired).", ("result",))
+STORE_WRITE_SECONDS = Histogram("store_write_duration_seconds", "Persistence write time, per backend.", ("backend",))
+
+def start_timer():
+    g.start = time.perf_counter()
+
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUEST_SECONDS.observe((route, request.method), time.perf_counter() - g.get("start", time.perf_counter()))
+    REQUESTS_TOTAL.inc((route, request.method, response.status_code))
+    return response
+
+def render():
+    """
+    Returns:
+        list of str: Every declared metric, in Prometheus text format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    return lines
+
+def install(app):
+    app.before_request(start_timer)
+    app.after_request(record_request)
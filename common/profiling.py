@@ -0,0 +1,200 @@
+"""
+On-demand profiling (admin, opt-in): cProfile over the next N requests of
+a route, and a stack sampler for the requests slower than SLOW_THRESHOLD.
+"""
+from flask import request, jsonify, make_response, g, current_app
+import time, os, sys, threading, collections, cProfile, pstats, marshal
+
+# profilage à la demande (admin, opt-in) : cProfile sur les N prochaines requêtes d'une route,
+# et échantillonneur de piles pour les requêtes plus lentes que SLOW_THRESHOLD
+SERVICE = None # préfixe des piles lentes, fixé par install
+PROFILING = False
+SLOW_THRESHOLD = 0.5 # secondes
+SAMPLE_INTERVAL = 0.01 # secondes entre deux relevés de piles
+MAX_SAMPLES = 1000 # relevés gardés par requête
+MAX_SLOW_STACKS = 10000 # piles distinctes gardées pour le flame graph
+profile_targets = {} # endpoint -> nombre de requêtes encore à profiler
+profile_stats = {} # endpoint -> pstats.Stats cumulées
+active_requests = {} # thread ident -> (route, piles relevées)
+slow_stacks = collections.Counter() # "service;route;frame;frame..." -> nombre de relevés
+profiling_lock = threading.Lock()
+verify_admin = None # verify_admin du service, fixé par install_routes
+
+def fold_stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+def sample_stacks():
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        frames = sys._current_frames()
+        for ident, (route, samples) in list(active_requests.items()):
+            frame = frames.get(ident)
+            if frame is not None and len(samples) < MAX_SAMPLES:
+                samples.append(fold_stack(frame))
+
+def start_sampler():
+    threading.Thread(target=sample_stacks, daemon=True).start()
+
+def start_profiling():
+    if not PROFILING:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    active_requests[threading.get_ident()] = (route, [])
+    if request.endpoint in profile_targets:
+        with profiling_lock:
+            if profile_targets.get(request.endpoint, 0) <= 0:
+                return
+            profile_targets[request.endpoint] -= 1
+        g.profiler = cProfile.Profile()
+        try:
+            g.profiler.enable()
+        except ValueError:
+            # un autre profileur tourne déjà (un seul actif à la fois) : la requête est rendue au quota
+            g.pop("profiler")
+            with profiling_lock:
+                profile_targets[request.endpoint] += 1
+
+def stop_profiling(response):
+    if not PROFILING:
+        return response
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        with profiling_lock:
+            if request.endpoint in profile_stats:
+                profile_stats[request.endpoint].add(profiler)
+            else:
+                profile_stats[request.endpoint] = pstats.Stats(profiler)
+            if profile_targets.get(request.endpoint) == 0:
+                del profile_targets[request.endpoint]
+    entry = active_requests.pop(threading.get_ident(), None)
+    if entry is not None and time.perf_counter() - g.start >= SLOW_THRESHOLD:
+        route, samples = entry
+        with profiling_lock:
+            for stack in samples:
+                key = "%s;%s %s;%s" % (SERVICE, request.method, route, stack)
+                if key in slow_stacks or len(slow_stacks) < MAX_SLOW_STACKS:
+                    slow_stacks[key] += 1
+    return response
+
+def install(app, service):
+    """
+    Set up profiling for a service: on only if <SERVICE>_PROFILING=1, slow
+    requests above <SERVICE>_SLOW_MS milliseconds (500 by default).
+
+    Args:
+        app (Flask): Application of the service.
+        service (str): Service name, first frame of the slow stacks.
+    """
+    global SERVICE, PROFILING, SLOW_THRESHOLD
+    SERVICE = service
+    PROFILING = os.environ.get(service.upper() + "_PROFILING", "0") == "1"
+    SLOW_THRESHOLD = float(os.environ.get(service.upper() + "_SLOW_MS", "500")) / 1000
+    if PROFILING:
+        start_sampler()
+        # les threads ne survivent pas au fork : chaque worker relance son échantillonneur
+        os.register_at_fork(after_in_child=start_sampler)
+    app.before_request(start_profiling)
+    app.after_request(stop_profiling)
+
+def get_slow_stacks(user_id):
+    """
+    Stack samples of the requests slower than SLOW_THRESHOLD (admin only).
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Returns:
+        Response: Folded stacks ("frame;frame;frame count" per line), the input
+                  format of flamegraph.pl and speedscope, or 404 if profiling is off.
+    """
+    if not PROFILING:
+        return make_response(jsonify({"error": "profiling disabled"}), 404)
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    with profiling_lock:
+        lines = ["%s %d" % item for item in slow_stacks.items()]
+    return current_app.response_class("\n".join(lines) + "\n" if lines else "", mimetype="text/plain")
+
+def start_route_profiling(user_id, endpoint):
+    """
+    Profile the next requests to a route with cProfile (admin only).
+
+    Args:
+        user_id (str): ID of the requesting user.
+        endpoint (str): Name of the view function to profile (e.g. get_movie_byid).
+
+    Query Parameters:
+        count (int): Number of requests to profile (default 10).
+
+    Returns:
+        Response: JSON with the endpoint and the number of requests left to profile.
+    """
+    if not PROFILING:
+        return make_response(jsonify({"error": "profiling disabled"}), 404)
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    if endpoint not in current_app.view_functions:
+        return make_response(jsonify({"error": "unknown endpoint"}), 404)
+    count = request.args.get("count", "10")
+    if not count.isdigit() or int(count) == 0:
+        return make_response(jsonify({"error": "'count' must be a positive integer"}), 400)
+    with profiling_lock:
+        profile_targets[endpoint] = int(count)
+        profile_stats.pop(endpoint, None) # nouvelle campagne : les stats précédentes sont jetées
+    return make_response(jsonify({"endpoint": endpoint, "remaining": int(count)}), 200)
+
+def get_route_profile(user_id, endpoint):
+    """
+    Download the cProfile statistics gathered for a route (admin only).
+
+    Args:
+        user_id (str): ID of the requesting user.
+        endpoint (str): Name of the profiled view function.
+
+    Returns:
+        Response: pstats file (load with pstats.Stats(path) or snakeviz),
+                  or 404 if nothing was profiled for this route.
+    """
+    if not PROFILING:
+        return make_response(jsonify({"error": "profiling disabled"}), 404)
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    with profiling_lock:
+        stats = profile_stats.get(endpoint)
+        data = marshal.dumps(stats.stats) if stats is not None else None # format de pstats.Stats.dump_stats
+        remaining = profile_targets.get(endpoint, 0)
+    if data is None:
+        return make_response(jsonify({"error": "no profile for this endpoint", "remaining": remaining}), 404)
+    response = current_app.response_class(data, mimetype="application/octet-stream")
+    response.headers["Content-Disposition"] = 'attachment; filename="%s.pstats"' % endpoint
+    response.headers["X-Profile-Remaining"] = str(remaining)
+    return response
+
+def install_routes(app, check_admin):
+    """
+    Register the admin profiling routes of a service.
+
+    Args:
+        app (Flask): Application of the service.
+        check_admin (callable): verify_admin of the service, user_id -> (is_admin, error response).
+    """
+    global verify_admin
+    verify_admin = check_admin
+    app.add_url_rule("/<user_id>/profiling/slow", view_func=get_slow_stacks, methods=["GET"])
+    app.add_url_rule("/<user_id>/profiling/<endpoint>", view_func=start_route_profiling, methods=["POST"])
+    app.add_url_rule("/<user_id>/profiling/<endpoint>", view_func=get_route_profile, methods=["GET"])
@@ -0,0 +1,57 @@
+"""
+Production mode: pre-forked worker processes sharing one listening socket.
+"""
+import os, socket, signal
+from werkzeug.serving import make_server
+
+# mode production : N workers pré-forkés qui se partagent la même socket d'écoute
+def serve_prefork(app, host, port, workers):
+    """
+    Serve the app with pre-forked worker processes, respawning any that dies.
+
+    The store is SQLite in this mode, so every worker sees the same data and
+    catches up with the others' mutations through the shared change journal.
+
+    Args:
+        app (Flask): Application to serve.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        workers (int): Number of worker processes.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            spawn() # relance le worker mort
@@ -0,0 +1,58 @@
+"""
+Binary snapshots (marshal) written next to the JSON files, read back through
+mmap at startup, and bulk loading with the cyclic garbage collector paused.
+"""
+import os, mmap, marshal, struct, gc
+from contextlib import contextmanager
+
+# snapshot binaire (marshal) écrit à côté du fichier JSON, relu via mmap au démarrage
+SNAPSHOT_HEADER = struct.Struct("<4sHqq") # magic, version marshal, taille et mtime du JSON source
+
+def write_snapshot(path, json_path, data, magic):
+    """
+    Write a binary snapshot of the data, tagged with the JSON file it mirrors.
+
+    Args:
+        path (str): Path of the snapshot file.
+        json_path (str): Path of the JSON file the data comes from.
+        data: Records to snapshot (any value marshal can dump).
+        magic (bytes): Format tag of the service (4 bytes), checked when reading.
+    """
+    st = os.stat(json_path)
+    with open(path + ".tmp", "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(magic, marshal.version, st.st_size, st.st_mtime_ns))
+        marshal.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+# chargement en masse : des millions d'objets sans cycle, que le ramasse-miettes cyclique reparcourrait sans cesse
+@contextmanager
+def gc_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def read_snapshot(path, json_path, magic):
+    """
+    Load a snapshot through mmap if it still matches the JSON file.
+
+    Args:
+        path (str): Path of the snapshot file.
+        json_path (str): Path of the JSON file the snapshot must mirror.
+        magic (bytes): Format tag the snapshot must carry.
+
+    Returns:
+        The records, or None if the snapshot is missing or stale.
+    """
+    try:
+        st = os.stat(json_path)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if SNAPSHOT_HEADER.unpack_from(mm) != (magic, marshal.version, st.st_size, st.st_mtime_ns):
+                return None
+            with memoryview(mm) as view:
+                return marshal.loads(view[SNAPSHOT_HEADER.size:])
+    except (OSError, ValueError, EOFError, TypeError, struct.error):
+        return None
@@ -0,0 +1,84 @@
+"""
+Tracing: X-Request-ID forwarded to every outbound call, spans (handler,
+calls, store writes) appended to a JSON lines log, one per service.
+"""
+from flask import request, g, has_request_context
+import json, time, os, threading
+from contextlib import contextmanager
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PARENT_SPAN_HEADER = "X-Parent-Span-ID"
+SERVICE = None # nom du service qui émet les spans, fixé par install
+SPAN_LOG = "" # ex. ./spans.log ; vide (défaut) = traçage désactivé
+span_lock = threading.Lock()
+span_file = None
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+def write_span(name, span_id, parent, start, duration, **fields):
+    """
+    Append one span of the current request to the span log.
+
+    Args:
+        name (str): Span name (route pattern, outbound call or store operation).
+        span_id (str): Id of the span.
+        parent (str): Id of the parent span, None for the root of the trace.
+        start (float): Wall clock start time (epoch seconds), used to align services.
+        duration (float): Duration in seconds.
+        **fields: Extra attributes (status, outcome...).
+    """
+    global span_file
+    if not SPAN_LOG or not has_request_context() or "request_id" not in g:
+        return
+    record = {"trace": g.request_id, "service": SERVICE, "span": name, "id": span_id, "parent": parent,
+              "start": round(start, 6), "duration": round(duration, 6)}
+    record.update(fields)
+    line = json.dumps(record) + "\n"
+    with span_lock:
+        if span_file is None:
+            # mode append + une écriture par ligne : les workers pré-forkés peuvent partager le fichier
+            span_file = open(SPAN_LOG, "a", buffering=1)
+        span_file.write(line)
+
+@contextmanager
+def span(name, **fields):
+    """
+    Time a block as a child span of the current request handler.
+
+    Yields:
+        str: Id of the span, to forward as parent to a downstream service.
+    """
+    span_id = new_span_id()
+    start, t0 = time.time(), time.perf_counter()
+    try:
+        yield span_id
+    finally:
+        if has_request_context() and "span_id" in g:
+            write_span(name, span_id, g.span_id, start, time.perf_counter() - t0, **fields)
+
+def start_trace():
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or os.urandom(16).hex()
+    g.span_id = new_span_id()
+    g.span_start = time.time()
+
+def finish_trace(response):
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    write_span(f"{request.method} {route}", g.span_id, request.headers.get(PARENT_SPAN_HEADER),
+               g.span_start, time.perf_counter() - g.start, status=response.status_code)
+    return response
+
+def install(app, service):
+    """
+    Trace the requests of a service, into the file named by <SERVICE>_SPAN_LOG.
+
+    Args:
+        app (Flask): Application of the service.
+        service (str): Service name ("movie", "user", "schedule" or "booking").
+    """
+    global SERVICE, SPAN_LOG
+    SERVICE = service
+    SPAN_LOG = os.environ.get(service.upper() + "_SPAN_LOG", "")
+    app.before_request(start_trace)
+    app.after_request(finish_trace)
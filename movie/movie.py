@@ -1,8 +1,21 @@
-from flask import Flask, request, jsonify, make_response
-import time, json, requests
+from flask import Flask, request, jsonify, make_response, g
+import time, json, requests, os, sys, sqlite3, threading
 from werkzeug.exceptions import NotFound
+from contextlib import contextmanager
 from flask_cors import CORS
 
+# module commun aux services (common/), à côté des dossiers des services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import common
+from common import profiling
+from common.metrics import METRICS, ADMIN_CACHE_TOTAL, STORE_WRITE_SECONDS
+from common.tracing import span
+from common.fragments import encode, json_response, join_fragments, FragmentCache, ChangeLog, read_ndjson, ndjson_response
+from common.snapshot import write_snapshot, read_snapshot
+from common.client import ServiceClient, breaker_metrics
+from common.events import EventHub
+from common.server import serve_prefork
+
 app = Flask(__name__)
 
 CORS(app)
@@ -17,17 +30,602 @@ CACHE_TTL = 60 # secondes de validité du cache pour is_admin
 # format : { "user_id": {"is_admin": True/False, "timestamp": 123456789} }
 user_admin_cache = {}
 
-# charge le fichier JSON contenant les films
-with open('{}/databases/movies.json'.format("."), 'r') as jsf:
-    movies = json.load(jsf)["movies"]
-    print(movies)
+# infrastructure commune (common/) : métriques, traçage, profilage, contrôle d'admission,
+# compression des réponses et délais de bout en bout
+common.install(app, "movie")
+
+WORKERS = int(os.environ.get("MOVIE_WORKERS", 1)) # > 1 : mode production multi-process (état partagé en SQLite)
+# backend de stockage : "json" (défaut, dev) ou "sqlite" (WAL, indexé, seul accepté avec plusieurs workers)
+STORAGE = os.environ.get("MOVIE_STORAGE", "sqlite" if WORKERS > 1 else "json")
+JSON_PATH = '{}/databases/movies.json'.format(".")
+CHANGES_KEPT = 10000 # mutations gardées dans le journal partagé entre workers
+CHANGES_PRUNE_EVERY = 1000
+SQLITE_PATH = os.environ.get("MOVIE_SQLITE_PATH", '{}/databases/movies.db'.format("."))
+
+# import/export en masse (NDJSON : un objet JSON par ligne)
+BULK_CHUNK = 1000 # lignes appliquées (et persistées) ensemble
+BULK_MAX_ERRORS = 100 # erreurs détaillées dans la réponse, les suivantes sont seulement comptées
+
+# taille du journal en mémoire des dernières mutations, servi par /<user_id>/movies/changes?since=N
+CHANGELOG_SIZE = int(os.environ.get("MOVIE_CHANGELOG_SIZE", 10000))
+
+# format des snapshots binaires (common.snapshot) écrits à côté du fichier JSON
+SNAPSHOT_MAGIC = b"SNAP"
+
+# notes par utilisateur : gardées en dixièmes (entiers) pour que les sommes restent exactes
+RATING_MAX = 10
+
+# agrégat des notes d'un film (sans note d'utilisateur)
+def ratings_aggregate(count, total):
+    return {"count": count, "mean": round(total / count / 10, 2) if count else None}
+
+def rating_summary(count, total, tenths=None):
+    """
+    Returns:
+        dict: {"count", "mean", "user_rating"} of a movie, mean and user_rating None when absent.
+    """
+    return dict(ratings_aggregate(count, total), user_rating=tenths / 10 if tenths is not None else None)
+
+def movie_ratings(store, movie_id):
+    summary = store.rating_summary(movie_id)
+    return {"count": summary["count"], "mean": summary["mean"]}
+
+# événement d'une note : le nouvel agrégat du film (la note d'un utilisateur reste privée)
+def rating_changed(summary):
+    return ("rating_changed", {"ratings": {"count": summary["count"], "mean": summary["mean"]}})
+
+def movie_record(movie, ratings=None):
+    """
+    Representation of a movie served by every route and by the change feed.
+
+    Args:
+        movie (dict): Catalogue document of the movie.
+        ratings (dict): Rating aggregate (or summary) of the movie; None for the
+                        catalogue document alone, the format of the bulk import.
+
+    Returns:
+        dict: The movie, with its "ratings" when given.
+    """
+    return dict(movie, ratings=ratings) if ratings is not None else movie
+
+class RatingLog:
+    """
+    Per-user ratings of the JSON backend, with a running count and sum per movie.
+
+    Ratings live in memory and are persisted to ratings.ndjson, an append-only
+    log of [movie, user, tenths] lines: tenths null removes one rating, user
+    null every rating of a movie. A rating costs one appended line and an
+    O(1) update of its movie's aggregate, never a rewrite of movies.json; the
+    log is compacted (one line per live rating) once dead lines outnumber
+    live ones.
+
+    Args:
+        path (str): Path of the log file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.by_movie = {} # film -> {userid: dixièmes}
+        self.totals = {} # film -> [nombre de notes, somme en dixièmes]
+        self.lines = 0 # lignes du journal, mortes comprises
+        self.live = 0 # notes en vigueur
+
+    def load(self):
+        with self.lock:
+            try:
+                with open(self.path) as f:
+                    for line in f:
+                        self.apply(*json.loads(line))
+                        self.lines += 1
+            except FileNotFoundError:
+                pass
+
+    def apply(self, movie, user, tenths):
+        ratings = self.by_movie.get(movie)
+        if user is None:
+            if ratings is not None:
+                self.live -= len(ratings)
+                del self.by_movie[movie], self.totals[movie]
+            return
+        if ratings is None:
+            if tenths is None:
+                return
+            ratings = self.by_movie[movie] = {}
+            self.totals[movie] = [0, 0]
+        total = self.totals[movie]
+        old = ratings.pop(user, None)
+        if old is not None:
+            total[0] -= 1
+            total[1] -= old
+            self.live -= 1
+        if tenths is not None:
+            ratings[sys.intern(user)] = tenths # un userid partagé par tous les films qu'il note
+            total[0] += 1
+            total[1] += tenths
+            self.live += 1
+        if not ratings:
+            del self.by_movie[movie], self.totals[movie]
+
+    # sous self.lock
+    def append(self, movie, user, tenths):
+        with open(self.path, "ab") as f:
+            f.write(encode([movie, user, tenths]) + b"\n")
+        self.lines += 1
+        if self.lines > 2 * self.live + 1000:
+            self.compact()
+
+    def compact(self):
+        with open(self.path + ".tmp", "wb") as f:
+            for movie, ratings in self.by_movie.items():
+                f.write(b"".join(encode([movie, user, tenths]) + b"\n" for user, tenths in ratings.items()))
+        os.replace(self.path + ".tmp", self.path)
+        self.lines = self.live
+
+    def rate(self, movie, user, tenths):
+        with self.lock:
+            self.apply(movie, user, tenths)
+            self.append(movie, user, tenths)
+            return self.summary(movie, user)
+
+    def forget_movie(self, movie):
+        with self.lock:
+            if movie in self.by_movie:
+                self.apply(movie, None, None)
+                self.append(movie, None, None)
+
+    def summary(self, movie, user=None):
+        count, total = self.totals.get(movie, (0, 0))
+        return rating_summary(count, total, self.by_movie.get(movie, {}).get(user))
+
+    # toutes les notes en vigueur, pour la migration vers SQLite
+    def items(self):
+        return [(movie, user, tenths) for movie, ratings in self.by_movie.items() for user, tenths in ratings.items()]
+
+class JsonStore:
+    """
+    Movies kept in memory and dumped to movies.json on every mutation.
+
+    The per-user ratings are kept apart, in a RatingLog next to the JSON file.
+
+    Args:
+        path (str): Path of the JSON file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.snapshot_path = os.path.splitext(path)[0] + ".snap"
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock() # une mutation (et sa réécriture du fichier) à la fois
+        self.loaded = threading.Event()
+        self._movies = None
+        self._index = None
+        self.ratings = RatingLog(os.path.join(os.path.dirname(path), "ratings.ndjson"))
+        self.fragments = FragmentCache(self.serialize) # films avec l'agrégat de leurs notes
+        self.version = 0 # incrémenté à chaque mutation
+        self.changes = ChangeLog(os.urandom(8).hex(), 0, CHANGELOG_SIZE) # nouvelle époque à chaque démarrage
+        self.listeners = [] # callbacks(key) appelés à chaque mutation (invalidation des caches)
+
+    def load(self):
+        """
+        Load the movies (from the binary snapshot if up to date, from JSON otherwise).
+
+        Returns:
+            list: The movies.
+        """
+        with self.lock:
+            if self._movies is None:
+                data = read_snapshot(self.snapshot_path, self.path, SNAPSHOT_MAGIC)
+                if data is None:
+                    # charge le fichier JSON contenant les films
+                    with open(self.path, "r") as jsf:
+                        data = json.load(jsf)["movies"]
+                    write_snapshot(self.snapshot_path, self.path, data, SNAPSHOT_MAGIC)
+                self.ratings.load()
+                self._movies = data
+                self.loaded.set()
+        return self._movies
+
+    @property
+    def movies(self):
+        return self._movies if self._movies is not None else self.load()
+
+    @property
+    def index(self):
+        # index construit paresseusement au premier accès, puis maintenu à chaque mutation
+        if self._index is None:
+            self._index = {str(movie["id"]): movie for movie in self.movies}
+        return self._index
+
+    # marque un enregistrement comme modifié : nouvelle version des données, fragment invalidé
+    # event : (nom, delta) de la mutation, publié dans le journal et le flux d'événements
+    def touch(self, key, event=None):
+        self.version += 1
+        self.changes.append(self.version, key, self.record(key), event)
+        self.fragments.invalidate(key)
+        for listener in self.listeners:
+            listener(key)
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé), avec l'agrégat de ses notes
+    def record(self, key):
+        movie = self.get(key)
+        return movie_record(movie, movie_ratings(self, key)) if movie is not None else None
+
+    def serialize(self, movie):
+        return encode(movie_record(movie, movie_ratings(self, str(movie["id"]))))
+
+    # un seul processus : rien à rattraper
+    def sync(self):
+        pass
+
+    # sauvegarde les films dans le fichier
+    def write(self):
+        with span("store.write", backend="json"):
+            start = time.perf_counter()
+            with open(self.path, 'w') as f:
+                full = {}
+                full['movies']=self.movies
+                json.dump(full, f)
+            write_snapshot(self.snapshot_path, self.path, self.movies, SNAPSHOT_MAGIC)
+            STORE_WRITE_SECONDS.observe(("json",), time.perf_counter() - start)
+
+    def all(self):
+        return self.movies
+
+    # tailles du jeu de données pour /metrics ; vide tant que le chargement n'est pas fait
+    def sizes(self):
+        if self._movies is None:
+            return {}
+        return {"movies": len(self._movies)}
+
+    def get(self, movie_id):
+        return self.index.get(str(movie_id))
+
+    def encoded_all(self):
+        return join_fragments([self.fragments.get(str(m["id"]), m) for m in self.movies])
+
+    def encoded(self, movie):
+        return self.fragments.get(str(movie["id"]), movie)
+
+    def find_by_title(self, title):
+        return next((m for m in reversed(self.movies) if str(m["title"]) == str(title)), None)
+
+    def add(self, movie):
+        with self.write_lock:
+            self.movies.append(movie)
+            self.index[str(movie["id"])] = movie
+            self.touch(str(movie["id"]))
+            self.write()
+
+    # import en masse : un seul enregistrement du fichier pour tout le lot
+    def add_many(self, movies):
+        with self.write_lock:
+            for movie in movies:
+                self.movies.append(movie)
+                self.index[str(movie["id"])] = movie
+                self.touch(str(movie["id"]))
+            self.write()
+
+    # export : le document du catalogue seul, format de l'import
+    def iter_encoded(self):
+        for movie in list(self.movies):
+            yield encode(movie_record(movie))
+
+    def rate(self, movie_id, user_id, tenths):
+        """
+        Record a user's rating of an existing movie (replacing their previous one).
+
+        Returns:
+            dict: The movie with its rating summary (see rating_summary), None if the movie does not exist.
+        """
+        with self.write_lock:
+            # vérifiée sous le verrou d'écriture : une suppression concurrente ne laisse pas de note orpheline
+            movie = self.get(movie_id)
+            if movie is None:
+                return None
+            summary = self.ratings.rate(str(movie_id), str(user_id), tenths)
+            # nouvel agrégat dans le flux de changements, sans réécrire movies.json
+            self.touch(str(movie_id), rating_changed(summary))
+            return movie_record(movie, summary)
+
+    def rating_summary(self, movie_id, user_id=None):
+        return self.ratings.summary(str(movie_id), user_id)
+
+    def delete(self, movie_id):
+        with self.write_lock:
+            movie = self.index.pop(str(movie_id), None)
+            if movie is not None:
+                self.movies.remove(movie)
+                self.ratings.forget_movie(str(movie_id))
+                self.touch(str(movie_id))
+                self.write()
+            return movie
+
+class SqliteStore:
+    """
+    Movies stored in SQLite (WAL mode), one connection per thread.
+
+    Each route uses one of the SQL constants below; sqlite3 keeps them
+    compiled in its per-connection statement cache.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS movies (
+            seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+            id    TEXT NOT NULL UNIQUE,
+            title TEXT,
+            doc   TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS movies_title ON movies(title);
+        CREATE TABLE IF NOT EXISTS ratings (
+            movie  TEXT NOT NULL,
+            userid TEXT NOT NULL,
+            tenths INTEGER NOT NULL,
+            PRIMARY KEY (movie, userid)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS rating_totals (
+            movie TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            total INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS changes (
+            seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+            key   TEXT NOT NULL,
+            event TEXT
+        );
+    """
+    SQL_ALL = "SELECT doc FROM movies ORDER BY seq"
+    SQL_ALL_RATED = """SELECT doc, count, total FROM movies LEFT JOIN rating_totals ON rating_totals.movie = movies.id
+                       ORDER BY seq"""
+    SQL_GET = "SELECT doc FROM movies WHERE id = ?"
+    SQL_BY_TITLE = "SELECT doc FROM movies WHERE title = ? ORDER BY seq DESC LIMIT 1"
+    SQL_INSERT = "INSERT OR IGNORE INTO movies (id, title, doc) VALUES (?, ?, ?)"
+    SQL_DELETE = "DELETE FROM movies WHERE id = ?"
+    SQL_TOUCH = "INSERT INTO changes (key, event) VALUES (?, ?)"
+    SQL_CHANGES_SINCE = "SELECT seq, key, event FROM changes WHERE seq > ? ORDER BY seq"
+    SQL_CHANGES_COLUMNS = "PRAGMA table_info(changes)"
+    SQL_ADD_EVENT_COLUMN = "ALTER TABLE changes ADD COLUMN event TEXT"
+    SQL_LAST_CHANGE = "SELECT MAX(seq) FROM changes"
+    SQL_PRUNE_CHANGES = "DELETE FROM changes WHERE seq <= ?"
+    SQL_COUNT = "SELECT COUNT(*) FROM movies"
+    SQL_RATING = "SELECT tenths FROM ratings WHERE movie = ? AND userid = ?"
+    SQL_RATE = "INSERT OR REPLACE INTO ratings (movie, userid, tenths) VALUES (?, ?, ?)"
+    # agrégat mis à jour par différence : O(1), sans relire les notes du film
+    SQL_ADD_TOTAL = """INSERT INTO rating_totals (movie, count, total) VALUES (?, ?, ?)
+                       ON CONFLICT(movie) DO UPDATE SET count = count + excluded.count, total = total + excluded.total"""
+    SQL_TOTAL = "SELECT count, total FROM rating_totals WHERE movie = ?"
+    SQL_DELETE_RATINGS = "DELETE FROM ratings WHERE movie = ?"
+    SQL_DELETE_TOTAL = "DELETE FROM rating_totals WHERE movie = ?"
+    SQL_ANY_RATING = "SELECT 1 FROM ratings LIMIT 1"
+    # verrou d'écriture pris dès le début : les lectures qui suivent ne peuvent plus être périmées
+    SQL_BEGIN_WRITE = "BEGIN IMMEDIATE"
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.sync_lock = threading.Lock()
+        self.conn().executescript(self.SCHEMA)
+        # journal créé avant les événements nommés : la colonne est ajoutée sur place
+        if "event" not in {row[1] for row in self.conn().execute(self.SQL_CHANGES_COLUMNS)}:
+            self.conn().execute(self.SQL_ADD_EVENT_COLUMN)
+        # après un fork, chaque worker ouvre ses propres connexions
+        os.register_at_fork(after_in_child=self.reset_connections)
+        self.loaded = threading.Event()
+        self.loaded.set()
+        # version = numéro de la dernière mutation du journal partagé déjà prise en compte
+        self.version = self.conn().execute(self.SQL_LAST_CHANGE).fetchone()[0] or 0
+        # la table changes est partagée et ses numéros ne reviennent jamais en arrière : époque fixe
+        self.changes = ChangeLog("sqlite", self.version, CHANGELOG_SIZE)
+        self.listeners = [] # callbacks(key) appelés à chaque mutation, key None = tout invalider
+
+    def load(self):
+        # rien à précharger : les requêtes passent directement par les index SQLite
+        pass
+
+    # marque un enregistrement comme modifié dans le journal partagé par tous les workers,
+    # avec l'événement (nom, delta) de la mutation : les autres workers le diffusent aussi
+    def touch(self, key, event=None):
+        self.touch_many([(key, event)])
+
+    # une seule transaction pour tout un lot (import en masse) de (clé, événement)
+    def touch_many(self, changes):
+        with self.conn() as conn:
+            for key, event in changes:
+                seq = conn.execute(self.SQL_TOUCH, (key, encode(event).decode() if event else None)).lastrowid
+                if seq % CHANGES_PRUNE_EVERY == 0:
+                    conn.execute(self.SQL_PRUNE_CHANGES, (seq - CHANGES_KEPT,))
+        self.sync()
+
+    def sync(self):
+        """
+        Catch up with the mutations recorded by every worker (this one included).
+
+        Invalidates the local caches for each changed key; if this worker fell
+        behind the pruned part of the journal, everything is invalidated.
+        """
+        # un seul rattrapage à la fois : deux threads appliqueraient les mêmes mutations deux fois
+        with self.sync_lock:
+            rows = self.conn().execute(self.SQL_CHANGES_SINCE, (self.version,)).fetchall()
+            if not rows:
+                return
+            if rows[0][0] != self.version + 1:
+                self.changes.reset(rows[0][0] - 1)
+                for listener in self.listeners:
+                    listener(None)
+            for seq, key, event in rows:
+                for listener in self.listeners:
+                    listener(key)
+                self.changes.append(seq, key, self.record(key), json.loads(event) if event else None)
+            self.version = rows[-1][0]
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé), avec l'agrégat de ses notes
+    def record(self, key):
+        movie = self.get(key)
+        return movie_record(movie, movie_ratings(self, key)) if movie is not None else None
+
+    # transaction d'écriture chronométrée pour store_write_duration_seconds
+    @contextmanager
+    def transaction(self):
+        with span("store.write", backend="sqlite"):
+            start = time.perf_counter()
+            try:
+                with self.conn() as conn:
+                    yield conn
+            finally:
+                STORE_WRITE_SECONDS.observe(("sqlite",), time.perf_counter() - start)
+
+    def reset_connections(self):
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def all(self):
+        return [json.loads(doc) for (doc,) in self.conn().execute(self.SQL_ALL)]
+
+    def sizes(self):
+        return {"movies": self.conn().execute(self.SQL_COUNT).fetchone()[0]}
+
+    def get(self, movie_id):
+        row = self.conn().execute(self.SQL_GET, (str(movie_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # agrégat des notes lu dans la même requête que les films
+    def encoded_all(self):
+        return join_fragments([encode(movie_record(json.loads(doc), ratings_aggregate(count or 0, total or 0)))
+                               for doc, count, total in self.conn().execute(self.SQL_ALL_RATED)])
+
+    def encoded(self, movie):
+        return encode(movie_record(movie, movie_ratings(self, movie["id"])))
+
+    def find_by_title(self, title):
+        row = self.conn().execute(self.SQL_BY_TITLE, (str(title),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, movie):
+        with self.transaction() as conn:
+            conn.execute(self.SQL_INSERT, (str(movie["id"]), movie.get("title"), encode(movie).decode()))
+        self.touch(str(movie["id"]))
+
+    def add_many(self, movies):
+        with self.transaction() as conn:
+            conn.executemany(self.SQL_INSERT, [(str(m["id"]), m.get("title"), encode(m).decode()) for m in movies])
+        self.touch_many([(str(m["id"]), None) for m in movies])
+
+    # export : la colonne doc est déjà l'encodage canonique du document du catalogue
+    def iter_encoded(self):
+        for (doc,) in self.conn().execute(self.SQL_ALL):
+            yield doc.encode()
+
+    def rate(self, movie_id, user_id, tenths):
+        """
+        Record a user's rating of an existing movie (replacing their previous one).
+
+        Returns:
+            dict: The movie with its rating summary (see rating_summary), None if the movie does not exist.
+        """
+        key = (str(movie_id), str(user_id))
+        with self.transaction() as conn:
+            # existence vérifiée sous le verrou d'écriture : une suppression ne laisse pas de note orpheline
+            conn.execute(self.SQL_BEGIN_WRITE)
+            doc = conn.execute(self.SQL_GET, (key[0],)).fetchone()
+            if doc is None:
+                return None
+            row = conn.execute(self.SQL_RATING, key).fetchone()
+            conn.execute(self.SQL_RATE, key + (tenths,))
+            if row is None:
+                conn.execute(self.SQL_ADD_TOTAL, (key[0], 1, tenths))
+            else:
+                conn.execute(self.SQL_ADD_TOTAL, (key[0], 0, tenths - row[0]))
+            count, total = conn.execute(self.SQL_TOTAL, (key[0],)).fetchone()
+        summary = rating_summary(count, total, tenths)
+        self.touch(key[0], rating_changed(summary))
+        return movie_record(json.loads(doc[0]), summary)
 
-# sauvegarde les films dans le fichier
-def write(movies):
-    with open('{}/databases/movies.json'.format("."), 'w') as f:
-        full = {}
-        full['movies']=movies
-        json.dump(full, f)
+    def rating_summary(self, movie_id, user_id=None):
+        conn = self.conn()
+        row = conn.execute(self.SQL_TOTAL, (str(movie_id),)).fetchone()
+        if row is None:
+            return rating_summary(0, 0)
+        mine = conn.execute(self.SQL_RATING, (str(movie_id), str(user_id))).fetchone() if user_id is not None else None
+        return rating_summary(row[0], row[1], mine[0] if mine else None)
+
+    def delete(self, movie_id):
+        with self.transaction() as conn:
+            conn.execute(self.SQL_BEGIN_WRITE)
+            row = conn.execute(self.SQL_GET, (str(movie_id),)).fetchone()
+            if row is None:
+                return None
+            conn.execute(self.SQL_DELETE, (str(movie_id),))
+            conn.execute(self.SQL_DELETE_RATINGS, (str(movie_id),))
+            conn.execute(self.SQL_DELETE_TOTAL, (str(movie_id),))
+        self.touch(str(movie_id))
+        return json.loads(row[0])
+
+    def migrate(self, json_path):
+        """
+        One-shot import of an existing movies.json, and of the ratings log next to it
+        (already present ids are skipped, already imported ratings are left untouched).
+
+        Args:
+            json_path (str): Path of the JSON file to import.
+
+        Returns:
+            int: Number of movies read from the file.
+        """
+        with open(json_path, "r") as jsf:
+            movies = json.load(jsf)["movies"]
+        ratings = RatingLog(os.path.join(os.path.dirname(json_path), "ratings.ndjson"))
+        ratings.load()
+        with self.conn() as conn:
+            conn.executemany(self.SQL_INSERT, [(str(m["id"]), m.get("title"), encode(m).decode()) for m in movies])
+            if not conn.execute(self.SQL_ANY_RATING).fetchone():
+                conn.executemany(self.SQL_RATE, ratings.items())
+                conn.executemany(self.SQL_ADD_TOTAL, [(movie, count, total)
+                                                      for movie, (count, total) in ratings.totals.items()])
+        return len(movies)
+
+def open_store():
+    # plusieurs workers : l'état doit être partagé -> SQLite, migré depuis le JSON au premier lancement
+    if WORKERS > 1:
+        if STORAGE != "sqlite":
+            # chaque worker forké réécrirait sa propre copie du JSON : le dernier écrivain gagne
+            sys.exit("MOVIE_WORKERS > 1 requires MOVIE_STORAGE=sqlite")
+        fresh = not os.path.exists(SQLITE_PATH)
+        sqlite_store = SqliteStore(SQLITE_PATH)
+        if fresh:
+            sqlite_store.migrate(JSON_PATH)
+        return sqlite_store
+    if STORAGE == "sqlite":
+        return SqliteStore(SQLITE_PATH)
+    return JsonStore(JSON_PATH)
+
+store = open_store()
+
+# chargement des données en arrière-plan : le port s'ouvre tout de suite, /ready passe à 200 une fois chargé
+threading.Thread(target=store.load, daemon=True).start()
+
+# en mode multi-process : rattrape les mutations des autres workers avant de servir la requête
+@app.before_request
+def sync_store():
+    store.sync()
+
+# réponses de liste complète : version et époque des données, point de départ du flux de changements
+@app.after_request
+def data_version_headers(response):
+    if "data_version" in g:
+        response.headers["X-Data-Version"] = str(g.data_version)
+        response.headers["X-Data-Epoch"] = store.changes.epoch
+    return response
+
+user_client = ServiceClient("user", USER_URL)
+clients = [user_client]
 
 # fonction utilitaire pour vérifier admin
 def verify_admin(user_id):
@@ -48,11 +646,15 @@ def verify_admin(user_id):
     if user_id in user_admin_cache:
         cached = user_admin_cache[user_id]
         if now - cached["timestamp"] < CACHE_TTL:
+            ADMIN_CACHE_TOTAL.inc(("hit",))
             return cached["is_admin"], None
+        ADMIN_CACHE_TOTAL.inc(("expired",))
+    else:
+        ADMIN_CACHE_TOTAL.inc(("miss",))
 
     # sinon appelle le microservice User
     try:
-        r = requests.get(f"{USER_URL}/users/{user_id}/is_admin")
+        r = user_client.get(f"/users/{user_id}/is_admin", call="is_admin")
         if r.status_code == 200:
             data = r.json()
             is_admin = data.get("is_admin", False)
@@ -60,10 +662,18 @@ def verify_admin(user_id):
             return is_admin, None
         else:
             return False, make_response(jsonify({"error": "Unable to verify user"}), 401)
+    except requests.exceptions.Timeout:
+        return False, make_response(jsonify({"error": "User service timed out"}), 504)
     except requests.exceptions.RequestException:
         return False, make_response(jsonify({"error": "User service unreachable"}), 503)
 
 
+# Server-Sent Events du journal des changements (common.events), sur un port dédié
+EVENTS_PORT = int(os.environ.get("MOVIE_EVENTS_PORT", 3210)) # 0 = pas de flux d'événements
+EVENTS_NAMES = {"upsert": "movie", "delete": "movie_deleted"} # nom des changements sans événement nommé par la mutation
+
+events = EventHub(app, store, verify_admin, r"^/([^/?]+)/movies/events(?:\?(.*))?$", EVENTS_NAMES)
+
 # page d’accueil du service
 @app.route("/", methods=['GET'])
 def home():
@@ -75,6 +685,45 @@ def home():
     """
     return make_response("<h1 style='color:blue'>Welcome to the Movie service!</h1>",200)
 
+# sonde de disponibilité : 200 seulement une fois les données chargées et interrogeables
+@app.route("/ready", methods=['GET'])
+def ready():
+    """
+    Readiness probe for the Movie service.
+
+    Returns:
+        Response: 200 once the data is loaded and queryable, 503 while it is still loading.
+    """
+    if not store.loaded.is_set():
+        return make_response(jsonify({"ready": False}), 503)
+    return make_response(jsonify({"ready": True}), 200)
+
+
+# métriques au format texte Prometheus
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics of the service: request latencies per route, outbound
+    call latencies, user_admin_cache lookups, store write times, dataset sizes
+    and circuit breaker states (per worker in multi-process mode).
+
+    Returns:
+        Response: Metrics in Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += ["# HELP dataset_records Records currently held by the store.", "# TYPE dataset_records gauge"]
+    for kind, count in store.sizes().items():
+        lines.append('dataset_records{kind="%s"} %d' % (kind, count))
+    lines += ["# HELP events_subscribers Server-Sent Events subscribers streaming from this process.",
+              "# TYPE events_subscribers gauge", "events_subscribers %d" % events.subscribed()]
+    lines += breaker_metrics(clients)
+    return app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# routes admin de profilage (common.profiling)
+profiling.install_routes(app, verify_admin)
+
 # retourne tous les films en JSON brut
 @app.route("/<user_id>/movies/json", methods=['GET'])
 def get_json(user_id):
@@ -92,9 +741,134 @@ def get_json(user_id):
     if error:
         return error
 
-    res = make_response(jsonify(movies), 200)
+    g.data_version = store.version # réponse versionnée : compressée une seule fois par version
+    res = json_response(store.encoded_all())
     return res
 
+# flux de changements : mutations depuis la version ?since=N, ou 410 s'il faut tout recharger
+@app.route("/<user_id>/movies/changes", methods=['GET'])
+def get_movies_changes(user_id):
+    """
+    Get the movies changed since a version, from the in-memory change log.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Query Parameters:
+        since (int): Last version the caller has applied (X-Data-Version of the full list, then
+                     "version" of the previous answer).
+
+    Returns:
+        Response: JSON {"changes", "epoch", "version"} in version order, or 410
+                  "resync required" if the changes fell out of the log (reload
+                  the full list, then follow from its version).
+    """
+    _, error = verify_admin(user_id)
+    if error:
+        return error
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return make_response(jsonify({"error": "'since' must be a non-negative integer"}), 400)
+    version, changes = store.changes.since(int(since))
+    if changes is None:
+        return make_response(jsonify({"error": "resync required", "epoch": store.changes.epoch,
+                                      "version": version}), 410)
+    return json_response(b'{"changes":' + join_fragments(changes) + b',"epoch":' + encode(store.changes.epoch) +
+                         b',"version":' + str(version).encode() + b"}")
+
+# vérifie qu'une ligne d'import décrit un film complet
+def movie_error(movie):
+    if not isinstance(movie, dict):
+        return "expected a JSON object"
+    for field, types in (("id", str), ("title", str), ("director", str), ("rating", (int, float))):
+        if not isinstance(movie.get(field), types) or isinstance(movie.get(field), bool) or movie.get(field) == "":
+            return "missing or invalid '%s'" % field
+    return None
+
+# import en masse : corps NDJSON lu au fil de l'eau, appliqué et persisté par paquets de BULK_CHUNK films
+@app.route("/<user_id>/movies/bulk", methods=['POST'])
+def import_movies(user_id):
+    """
+    Import movies from an NDJSON body (one movie object per line).
+
+    Lines are validated and deduplicated against the stored movies and the
+    previous lines, then added BULK_CHUNK at a time, with one write of the
+    storage per chunk. Invalid and duplicate lines are skipped, the others
+    are still imported.
+
+    Args:
+        user_id (str): ID of the requesting user (must be an admin).
+
+    Request Body:
+        NDJSON, one movie per line (id, title, director, rating), as produced by
+        GET /<user_id>/movies/export.
+
+    Returns:
+        Response: JSON {"imported", "duplicates", "invalid", "errors"} where errors lists
+                  the first BULK_MAX_ERRORS rejected lines ({"line", "error"}),
+                  or an error if user is not admin.
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+
+    # si pas admin -> accès interdit
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+
+    result = {"imported": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    chunk, seen = [], set()
+
+    def skip(number, kind, message):
+        result[kind] += 1
+        if len(result["errors"]) < BULK_MAX_ERRORS:
+            result["errors"].append({"line": number, "error": message})
+
+    def flush():
+        if chunk:
+            with span("movies.bulk_chunk", size=len(chunk)):
+                store.add_many(chunk)
+            result["imported"] += len(chunk)
+            chunk.clear()
+
+    for number, movie in read_ndjson(request.stream):
+        if isinstance(movie, ValueError):
+            skip(number, "invalid", "invalid JSON: %s" % movie)
+            continue
+        message = movie_error(movie)
+        if message:
+            skip(number, "invalid", message)
+            continue
+        if movie["id"] in seen or store.get(movie["id"]) is not None:
+            skip(number, "duplicates", "movie ID already exists")
+            continue
+        seen.add(movie["id"])
+        chunk.append(movie)
+        if len(chunk) >= BULK_CHUNK:
+            flush()
+    flush()
+    return make_response(jsonify(result), 200)
+
+# export en masse : un film par ligne, dans le format accepté par l'import
+@app.route("/<user_id>/movies/export", methods=['GET'])
+def export_movies(user_id):
+    """
+    Export all movies as NDJSON, streamed record by record.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Returns:
+        Response: application/x-ndjson body, one movie per line (the input format of
+                  POST /<user_id>/movies/bulk), or an error if user is not authorized.
+    """
+    _, error = verify_admin(user_id)
+    if error:
+        return error
+
+    g.data_version = store.version
+    return ndjson_response(store.iter_encoded())
+
 # retourne un film à partir de son ID
 @app.route("/<user_id>/movies/<movie_id>", methods=['GET'])
 def get_movie_by_id(user_id, movie_id):
@@ -113,10 +887,10 @@ def get_movie_by_id(user_id, movie_id):
     if error:
         return error
 
-    for movie in movies:
-        if str(movie["id"]) == str(movie_id):
-            res = make_response(jsonify(movie),200)
-            return res
+    movie = store.get(movie_id)
+    if movie is not None:
+        res = json_response(store.encoded(movie))
+        return res
     return make_response(jsonify({"error":"Movie ID not found"}),500)
 
 # retourne un film à partir de son titre
@@ -141,15 +915,12 @@ def get_movie_by_title(user_id):
     
     json = ""
     if request.args:
-        req = request.args
-        for movie in movies:
-            if str(movie["title"]) == str(req["title"]):
-                json = movie
+        json = store.find_by_title(request.args["title"])
 
     if not json:
         res = make_response(jsonify({"error":"movie title not found"}),500)
     else:
-        res = make_response(jsonify(json),200)
+        res = json_response(store.encoded(json))
     return res
 
 # ajoute un nouveau film
@@ -179,46 +950,75 @@ def add_movie(user_id, movie_id):
 
     req = request.get_json()
 
-    for movie in movies:
-        if str(movie["id"]) == str(movie_id):
-            print(movie["id"])
-            print(movie_id)
-            return make_response(jsonify({"error":"movie ID already exists"}),500)
+    if store.get(movie_id) is not None:
+        return make_response(jsonify({"error":"movie ID already exists"}),500)
 
-    movies.append(req)
-    write(movies)
+    store.add(req)
     res = make_response(jsonify({"message":"movie added"}),200)
     return res
 
-#modifie le score d'un film existant
+# note d'un film par l'utilisateur : une note par utilisateur et par film, moyenne tenue à jour en O(1)
 @app.route("/<user_id>/movies/<movie_id>/<rate>", methods=['PUT'])
 def update_movie_rating(user_id, movie_id, rate):
     """
-    Update the rating of an existing movie.
+    Record the requesting user's rating of an existing movie.
+
+    Each user has one rating per movie (a new one replaces theirs); the
+    movie's count and mean of ratings are updated incrementally and
+    published in the change feed. The catalogue "rating" of the movie is
+    left unchanged.
 
     Args:
         user_id (str): ID of the requesting user.
-        movie_id (str): ID of the movie to update.
-        rate (str or float): New rating for the movie.
+        movie_id (str): ID of the movie to rate.
+        rate (str or float): The user's rating, from 0 to RATING_MAX (rounded to one decimal).
 
     Returns:
-        Response: JSON response with updated movie data,
-                  or error if movie ID is not found.
+        Response: JSON response with the movie data and its "ratings" summary
+                  ({"count", "mean", "user_rating"}), or error if the rating is
+                  invalid or the movie ID is not found.
     """
     _, error = verify_admin(user_id)
     if error:
         return error
 
-    for movie in movies:
-        if str(movie["id"]) == str(movie_id):
-            movie["rating"] = rate
-            res = make_response(jsonify(movie),200)
-            write(movies)
-            return res
+    try:
+        tenths = round(float(rate) * 10)
+    except (ValueError, OverflowError):
+        tenths = -1
+    if not 0 <= tenths <= RATING_MAX * 10:
+        return make_response(jsonify({"error": "rate must be a number from 0 to %d" % RATING_MAX}), 400)
+
+    movie = store.rate(movie_id, user_id, tenths)
+    if movie is not None:
+        res = make_response(jsonify(movie),200)
+        return res
 
     res = make_response(jsonify({"error":"movie ID not found"}),500)
     return res
 
+# résumé des notes d'un film : nombre, moyenne et note de l'utilisateur
+@app.route("/<user_id>/movies/<movie_id>/ratings", methods=['GET'])
+def get_movie_ratings(user_id, movie_id):
+    """
+    Get the rating summary of a movie.
+
+    Args:
+        user_id (str): ID of the requesting user.
+        movie_id (str): ID of the movie.
+
+    Returns:
+        Response: JSON {"count", "mean", "user_rating"} (user_rating: the requesting
+                  user's rating, null if none), or error if movie ID is not found.
+    """
+    _, error = verify_admin(user_id)
+    if error:
+        return error
+
+    if store.get(movie_id) is None:
+        return make_response(jsonify({"error":"movie ID not found"}),500)
+    return make_response(jsonify(store.rating_summary(movie_id, user_id)),200)
+
 # supprime un film à partir de son ID
 @app.route("/<user_id>/movies/<movie_id>", methods=['DELETE'])
 def delete_movie(user_id, movie_id):
@@ -241,16 +1041,31 @@ def delete_movie(user_id, movie_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for movie in movies:
-        if str(movie["id"]) == str(movie_id):
-            movies.remove(movie)
-            write(movies)
-            return make_response(jsonify(movie),200)
+    movie = store.delete(movie_id)
+    if movie is not None:
+        return make_response(jsonify(movie),200)
 
     res = make_response(jsonify({"error":"movie ID not found"}),500)
     return res
 
 if __name__ == "__main__":
+    # migration unique movies.json -> SQLite : python movie.py migrate
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        count = SqliteStore(SQLITE_PATH).migrate(JSON_PATH)
+        print("%d movies migrated to %s" % (count, SQLITE_PATH))
+        sys.exit(0)
     #p = sys.argv[1]
     print("Server running in port %s"%(PORT))
-    app.run(host=HOST, port=PORT)
+    if EVENTS_PORT:
+        events.listen(HOST, EVENTS_PORT)
+        print("Server-Sent Events on port %s" % EVENTS_PORT)
+        if WORKERS > 1:
+            # les threads ne survivent pas au fork : chaque worker lance son propre thread d'abonnés
+            os.register_at_fork(after_in_child=events.start)
+        else:
+            events.start()
+    if WORKERS > 1:
+        print("Serving with %d workers" % WORKERS)
+        serve_prefork(app, HOST, PORT, WORKERS)
+    else:
+        app.run(host=HOST, port=PORT)
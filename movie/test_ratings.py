@@ -0,0 +1,76 @@
+"""
+Movie ratings: a rating needs an existing movie, every route serves the
+movie with its rating aggregate, and deleting a movie drops its ratings.
+
+Each test loads movie.py from a temporary copy of the databases, with the
+User service answered by a stub.
+
+Usage: python -m pytest movie/test_ratings.py
+"""
+import importlib.util, os, shutil
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ADMIN = "admin"
+MOVIE = "720d006c-3a57-4b6a-b18f-9b713b073f3c"
+UNKNOWN = "00000000-0000-0000-0000-000000000000"
+
+class StubResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+def load(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, "movie.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(params=["json", "sqlite"])
+def movie(request, tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(HERE, "databases"), tmp_path / "databases")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MOVIE_STORAGE", request.param)
+    module = load("movie_test_%s" % request.param)
+    if request.param == "sqlite":
+        # migration avant le démarrage testé, comme python movie.py migrate
+        module.store.migrate(module.JSON_PATH)
+    module.store.load()
+    module.user_client.get = lambda path, **kwargs: StubResponse(200, {"is_admin": path.split("/")[2] == ADMIN})
+    return module
+
+def rate(client, userid, movie_id, note):
+    return client.put("/%s/movies/%s/%s" % (userid, movie_id, note))
+
+def test_rating_unknown_movie(movie):
+    client = movie.app.test_client()
+    assert rate(client, ADMIN, UNKNOWN, 5).status_code == 500
+    assert movie.store.rating_summary(UNKNOWN)["count"] == 0
+
+def test_movie_served_with_aggregate(movie):
+    client = movie.app.test_client()
+    r = rate(client, ADMIN, MOVIE, 8)
+    assert r.status_code == 200
+    assert r.get_json()["ratings"] == {"count": 1, "mean": 8.0, "user_rating": 8.0}
+    assert rate(client, "chris_rivers", MOVIE, 6).status_code == 200
+
+    aggregate = {"count": 2, "mean": 7.0}
+    listed = next(m for m in client.get("/%s/movies/json" % ADMIN).get_json() if m["id"] == MOVIE)
+    assert listed["ratings"] == aggregate
+    assert client.get("/%s/movies/%s" % (ADMIN, MOVIE)).get_json() == listed
+    changes = client.get("/%s/movies/changes?since=0" % ADMIN).get_json()["changes"]
+    assert changes[-1]["value"] == listed
+    assert (changes[-1]["event"], changes[-1]["delta"]) == ("rating_changed", {"ratings": aggregate})
+    # l'export garde le format de l'import
+    exported = client.get("/%s/movies/export" % ADMIN).get_data().splitlines()
+    assert all(b'"ratings"' not in line for line in exported)
+
+def test_delete_drops_ratings(movie):
+    client = movie.app.test_client()
+    assert rate(client, ADMIN, MOVIE, 8).status_code == 200
+    assert client.delete("/%s/movies/%s" % (ADMIN, MOVIE)).status_code == 200
+    assert movie.store.rating_summary(MOVIE, ADMIN) == {"count": 0, "mean": None, "user_rating": None}
+    assert rate(client, ADMIN, MOVIE, 8).status_code == 500
@@ -1,9 +1,23 @@
 import time
-from flask import Flask, render_template, request, jsonify, make_response
-import json, requests
+from flask import Flask, render_template, request, jsonify, make_response, g
+import json, requests, os, sys, sqlite3, threading, marshal, gzip, itertools, array, datetime
 from werkzeug.exceptions import NotFound
+from collections import OrderedDict
+from contextlib import contextmanager
 from flask_cors import CORS
 
+# module commun aux services (common/), à côté des dossiers des services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import common
+from common import profiling
+from common.metrics import METRICS, Counter, ADMIN_CACHE_TOTAL, STORE_WRITE_SECONDS
+from common.tracing import span
+from common.fragments import encode, json_response, join_fragments, FragmentCache, ChangeLog, read_ndjson, ndjson_response
+from common.snapshot import write_snapshot, read_snapshot, gc_paused
+from common.client import ServiceClient, IdFollower, breaker_metrics
+from common.events import EventHub
+from common.server import serve_prefork
+
 app = Flask(__name__)
 
 CORS(app)
@@ -19,16 +33,1050 @@ CACHE_TTL = 60 # secondes de validité du cache pour is_admin
 # format : { "user_id": {"is_admin": True/False, "timestamp": 123456789} }
 user_admin_cache = {}
 
-# charge le fichier JSON contenant le planning
-with open('{}/databases/times.json'.format("."), "r") as jsf:
-    schedule = json.load(jsf)["schedule"]
+# infrastructure commune (common/) : métriques, traçage, profilage, contrôle d'admission,
+# compression des réponses et délais de bout en bout
+common.install(app, "schedule", rate_limits={"get_movies_by_date_details": (5, 10)}, deadlines={"get_movies_by_date_details": 10})
+
+WORKERS = int(os.environ.get("SCHEDULE_WORKERS", 1)) # > 1 : mode production multi-process (état partagé en SQLite)
+# backend de stockage : "json" (défaut, dev) ou "sqlite" (WAL, indexé, seul accepté avec plusieurs workers)
+STORAGE = os.environ.get("SCHEDULE_STORAGE", "sqlite" if WORKERS > 1 else "json")
+JSON_PATH = '{}/databases/times.json'.format(".")
+CHANGES_KEPT = 10000 # mutations gardées dans le journal partagé entre workers
+CHANGES_PRUNE_EVERY = 1000
+SQLITE_PATH = os.environ.get("SCHEDULE_SQLITE_PATH", '{}/databases/times.db'.format("."))
+
+# import/export en masse (NDJSON : un objet JSON par ligne)
+BULK_CHUNK = 1000 # lignes appliquées (et persistées) ensemble
+BULK_MAX_ERRORS = 100 # erreurs détaillées dans la réponse, les suivantes sont seulement comptées
+
+# taille du journal en mémoire des dernières mutations, servi par /<user_id>/schedule/changes?since=N
+CHANGELOG_SIZE = int(os.environ.get("SCHEDULE_CHANGELOG_SIZE", 10000))
+
+# format des snapshots binaires (common.snapshot) écrits à côté du fichier JSON
+SNAPSHOT_MAGIC = b"SNP2" # format 2 : planning en représentation compacte (ScheduleEntry.pack)
+
+# représentation compacte en mémoire : films internés en petits entiers, dates en ordinaux de jour
+def day_ordinal(date):
+    if len(date) == 8 and date.isascii() and date.isdigit():
+        try:
+            return datetime.date(int(date[:4]), int(date[4:6]), int(date[6:])).toordinal()
+        except ValueError:
+            return None
+    return None
+
+class Codec:
+    """
+    Compact codes of movie ids and dates, decoded back only at the JSON boundary.
+
+    A movie id becomes its rank in self.movies: 4 bytes in an array instead of
+    a 36-character string per scheduled movie. A YYYYMMDD date becomes its day ordinal
+    (datetime.date.toordinal); any other date string is interned in
+    self.others and coded -1 - rank, so every value round-trips unchanged.
 
-# sauvegarde le planning dans le fichier
-def write(times):
-    with open('{}/databases/times.json'.format("."), 'w') as f:
-        full = {}
-        full['schedule']=times
-        json.dump(full, f)
+    Args:
+        movies (list): Movie ids already interned (read from a snapshot).
+        others (list): Dates already interned that are not YYYYMMDD.
+    """
+    def __init__(self, movies=(), others=()):
+        self.lock = threading.Lock()
+        self.movies = list(movies)
+        self.movie_codes = {m: i for i, m in enumerate(self.movies)}
+        self.others = list(others)
+        # dates déjà rencontrées, dans les deux sens : bornées par le nombre de dates distinctes
+        self.date_codes = {d: -1 - i for i, d in enumerate(self.others)}
+        self.date_strs = {code: d for d, code in self.date_codes.items()}
+
+    def movie(self, movie_id):
+        code = self.movie_codes.get(movie_id)
+        if code is None:
+            with self.lock:
+                code = self.movie_codes.get(movie_id)
+                if code is None:
+                    # ajouté à la table avant d'être publié : un code visible est toujours décodable
+                    self.movies.append(movie_id)
+                    code = self.movie_codes[movie_id] = len(self.movies) - 1
+        return code
+
+    # code d'un film sans l'interner (None : jamais vu, donc programmé nulle part)
+    def find_movie(self, movie_id):
+        return self.movie_codes.get(movie_id)
+
+    def movie_id(self, code):
+        return self.movies[code]
+
+    def date(self, date):
+        code = self.date_codes.get(date)
+        if code is None:
+            date = str(date)
+            with self.lock:
+                code = self.date_codes.get(date)
+                if code is None:
+                    code = day_ordinal(date)
+                    if code is None:
+                        self.others.append(date)
+                        code = -len(self.others)
+                    self.date_strs[code] = date
+                    self.date_codes[date] = code
+        return code
+
+    # code d'une date sans l'interner (None : date hors calendrier jamais vue)
+    def find_date(self, date):
+        code = self.date_codes.get(date)
+        return code if code is not None else day_ordinal(str(date))
+
+    def date_str(self, code):
+        date = self.date_strs.get(code)
+        if date is None:
+            day = datetime.date.fromordinal(code)
+            date = self.date_strs[code] = "%04d%02d%02d" % (day.year, day.month, day.day)
+        return date
+
+class ScheduleEntry:
+    """
+    One schedule date in compact form (see Codec): date code and array of movie codes.
+    """
+    __slots__ = ("date", "movies")
+
+    def __init__(self, date, movies=None):
+        self.date = date
+        self.movies = movies if movies is not None else array.array("I")
+
+    @classmethod
+    def from_dicts(cls, records, codec):
+        """
+        Encode every record of times.json in a single pass.
+
+        Codes already in the codec tables are read directly; only a movie id
+        or date seen for the first time goes through Codec.movie / Codec.date.
+
+        Args:
+            records (list): Records {"date", "movies"} as parsed.
+            codec (Codec): Codec filled as new values are met.
+
+        Returns:
+            list of ScheduleEntry: The schedule, in the order of the records.
+        """
+        movie_codes, date_codes = codec.movie_codes, codec.date_codes
+        movie, date = codec.movie, codec.date
+        return [cls(date_codes[s["date"]] if s["date"] in date_codes else date(s["date"]),
+                    array.array("I", [movie_codes[m] if m in movie_codes else movie(m) for m in s["movies"]]))
+                for s in records]
+
+    def to_dict(self, codec):
+        return {"date": codec.date_str(self.date), "movies": [codec.movie_id(m) for m in self.movies]}
+
+    # forme du snapshot : (code de la date, films en octets)
+    def pack(self):
+        return (self.date, self.movies.tobytes())
+
+    @classmethod
+    def unpack(cls, row):
+        entry = cls(row[0])
+        entry.movies.frombytes(row[1])
+        return entry
+
+# archive froide : planning des dates passées, hors mémoire, un fichier gzip NDJSON par mois
+ARCHIVE_DAYS = os.environ.get("SCHEDULE_ARCHIVE_DAYS", "") # dates plus vieilles que N jours archivées ; vide = pas d'archivage
+ARCHIVE_DIR = '{}/databases/archive'.format(".")
+ARCHIVE_CACHE_MONTHS = int(os.environ.get("SCHEDULE_ARCHIVE_CACHE_MONTHS", 6)) # mois d'archive gardés décodés
+
+def archive_horizon():
+    """
+    Returns:
+        int or None: Day ordinal of the oldest date kept hot, None if archiving is disabled.
+    """
+    if not ARCHIVE_DAYS:
+        return None
+    return datetime.date.today().toordinal() - int(ARCHIVE_DAYS)
+
+class ScheduleArchive:
+    """
+    Append-only archive of the schedule of past dates, one gzip NDJSON file per month.
+
+    Each append adds one gzip member of {"date", "movies"} lines to
+    times.<YYYYMM>.ndjson.gz; the last line of a date wins, and "movies": null
+    is a tombstone (date brought back hot, or deleted). A month is decoded
+    only when a query needs it, and the ARCHIVE_CACHE_MONTHS last used months
+    stay decoded. The encoded dates of each month are kept for the full
+    listings until an append touches that month. times.movies lists the
+    months of each movie, so a search by movie only opens the months where
+    it was scheduled.
+
+    Args:
+        directory (str): Directory of the archive files.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.cache = OrderedDict() # mois -> {date: films}
+        self.encoded_months = {} # mois -> dates encodées, pour les listes complètes
+        self._movies = None # film -> mois archivés, lu au premier accès
+
+    def path(self, month):
+        return os.path.join(self.directory, "times.%d.ndjson.gz" % month)
+
+    def months(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[6:-10]) for n in names
+                      if n.startswith("times.") and n.endswith(".ndjson.gz") and n[6:-10].isdigit())
+
+    @property
+    def movies(self):
+        with self.lock:
+            if self._movies is None:
+                try:
+                    with open(os.path.join(self.directory, "times.movies"), "rb") as f:
+                        self._movies = marshal.load(f)
+                except (OSError, EOFError, ValueError, TypeError):
+                    # index absent ou illisible : reconstruit depuis les fichiers du mois
+                    self._movies = {}
+                    for month in self.months():
+                        for movie in {m for movies in self.decode(month).values() for m in movies}:
+                            self._movies[movie] = self._movies.get(movie, ()) + (month,)
+                    if self._movies:
+                        self.write_movies()
+            return self._movies
+
+    def write_movies(self):
+        with open(os.path.join(self.directory, "times.movies.tmp"), "wb") as f:
+            marshal.dump(self._movies, f)
+        os.replace(os.path.join(self.directory, "times.movies.tmp"), os.path.join(self.directory, "times.movies"))
+
+    @staticmethod
+    def apply(records, lines):
+        for r in lines:
+            if r["movies"] is None:
+                records.pop(r["date"], None)
+            else:
+                records[r["date"]] = r["movies"]
+
+    # décode un mois complet, sans passer par le cache
+    def decode(self, month):
+        records = {}
+        try:
+            with gzip.open(self.path(month), "rt") as f:
+                self.apply(records, map(json.loads, f))
+        except FileNotFoundError:
+            pass
+        return records
+
+    # un mois décodé, depuis le cache s'il y est, sans en évincer les mois des requêtes ciblées
+    def peek(self, month):
+        with self.lock:
+            records = self.cache.get(month)
+            return dict(records) if records is not None else self.decode(month)
+
+    def month(self, month):
+        with self.lock:
+            records = self.cache.get(month)
+            if records is None:
+                records = self.cache[month] = self.decode(month)
+                while len(self.cache) > ARCHIVE_CACHE_MONTHS:
+                    self.cache.popitem(last=False)
+            self.cache.move_to_end(month)
+            return records
+
+    def append(self, lines):
+        """
+        Append schedule lines (tombstones included), one gzip member per month touched.
+
+        Args:
+            lines (list of dict): {"date", "movies"} records, "movies" None for a tombstone.
+        """
+        by_month = {}
+        for r in lines:
+            by_month.setdefault(int(r["date"][:6]), []).append(r)
+        with self.lock:
+            movies = self.movies
+            os.makedirs(self.directory, exist_ok=True)
+            for month, records in sorted(by_month.items()):
+                with gzip.open(self.path(month), "ab") as f:
+                    f.write(b"".join(encode(r) + b"\n" for r in records))
+                if month in self.cache:
+                    self.apply(self.cache[month], records)
+                self.encoded_months.pop(month, None)
+                # l'index peut garder un mois vidé par des tombstones : une lecture inutile, jamais une perte
+                for movie in {m for r in records for m in r["movies"] or ()}:
+                    if month not in movies.get(movie, ()):
+                        movies[movie] = movies.get(movie, ()) + (month,)
+            self.write_movies()
+
+    def movies_for_date(self, date):
+        """
+        Returns:
+            list or None: The archived movies of that date, None if the date is not archived.
+        """
+        date = str(date)
+        if day_ordinal(date) is None:
+            return None # seules les dates du calendrier sont archivées
+        return self.month(int(date[:6])).get(date)
+
+    def dates_for_movie(self, movie_id):
+        with self.lock:
+            return [date for month in sorted(self.movies.get(movie_id, ()))
+                    for date, movies in self.month(month).items() if movie_id in movies]
+
+    def scan(self):
+        """
+        Yield every archived date as {"date", "movies"}, oldest month first.
+        """
+        for month in self.months():
+            for date, movies in self.peek(month).items():
+                yield {"date": date, "movies": movies}
+
+    def encoded(self):
+        """
+        Yield every archived date as encoded JSON, oldest month first; a month is encoded once per append to it.
+        """
+        for month in self.months():
+            with self.lock:
+                fragments = self.encoded_months.get(month)
+                if fragments is None:
+                    fragments = self.encoded_months[month] = [encode({"date": date, "movies": movies})
+                                                              for date, movies in self.peek(month).items()]
+            yield from fragments
+
+archive = ScheduleArchive(ARCHIVE_DIR)
+
+class JsonStore:
+    """
+    Schedule kept in memory and dumped to times.json on every mutation.
+
+    In memory each date is a ScheduleEntry (movie codes in an array); entries
+    are converted to and from dicts only when read or written as JSON. Dates
+    older than the archiving horizon move to the archive, which queries by
+    date or by movie read transparently; a mutation of an archived date
+    first brings it back in memory.
+
+    Args:
+        path (str): Path of the JSON file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.horizon = None # horizon du dernier archivage
+        self.snapshot_path = os.path.splitext(path)[0] + ".snap"
+        self.lock = threading.Lock()
+        # une mutation (et sa réécriture du fichier) à la fois ; réentrant : add_movie_to_date passe par add_date
+        self.write_lock = threading.RLock()
+        self.loaded = threading.Event()
+        self.codec = Codec()
+        self._schedule = None
+        self._index = None
+        self.fragments = FragmentCache()
+        self.version = 0 # incrémenté à chaque mutation
+        self.changes = ChangeLog(os.urandom(8).hex(), 0, CHANGELOG_SIZE) # nouvelle époque à chaque démarrage
+        self.listeners = [] # callbacks(key) appelés à chaque mutation (invalidation des caches)
+
+    def load(self):
+        """
+        Load the schedule (from the binary snapshot if up to date, from JSON otherwise).
+
+        Returns:
+            list of ScheduleEntry: The schedule.
+        """
+        with self.lock, gc_paused():
+            if self._schedule is None:
+                data = read_snapshot(self.snapshot_path, self.path, SNAPSHOT_MAGIC)
+                if data is not None:
+                    movies, others, rows = data
+                    self.codec = Codec(movies, others)
+                    schedule = [ScheduleEntry.unpack(row) for row in rows]
+                else:
+                    # charge le fichier JSON contenant le planning
+                    with open(self.path, "r") as jsf:
+                        schedule = ScheduleEntry.from_dicts(json.load(jsf)["schedule"], self.codec)
+                    self.write_snapshot(schedule)
+                self._schedule = schedule
+                self.loaded.set()
+        return self._schedule
+
+    @property
+    def schedule(self):
+        return self._schedule if self._schedule is not None else self.load()
+
+    @property
+    def index(self):
+        # index (code de date -> entrée) construit paresseusement au premier accès, puis maintenu à chaque mutation
+        if self._index is None:
+            self._index = {s.date: s for s in self.schedule}
+        return self._index
+
+    def entry(self, date):
+        code = self.codec.find_date(date)
+        return self.index.get(code) if code is not None else None
+
+    # sous write_lock, une fois la mutation certaine : une date archivée revient en mémoire
+    def promote(self, date, movies):
+        entry = ScheduleEntry(self.codec.date(date), array.array("I", map(self.codec.movie, movies)))
+        self.schedule.append(entry)
+        self.index[entry.date] = entry
+        archive.append([{"date": str(date), "movies": None}])
+        return entry
+
+    # sous write_lock : déplace vers l'archive les dates antérieures à l'horizon, une fois par jour
+    def move_past(self):
+        horizon = archive_horizon()
+        if horizon is None or horizon == self.horizon:
+            return 0
+        self.horizon = horizon
+        old = [s for s in self.schedule if 0 < s.date < horizon]
+        if not old:
+            return 0
+        # l'archive d'abord : un lecteur concurrent peut voir une date en double, jamais une date manquante
+        archive.append([s.to_dict(self.codec) for s in old])
+        self._schedule = [s for s in self.schedule if not 0 < s.date < horizon]
+        self._index = {s.date: s for s in self._schedule}
+        for s in old:
+            self.fragments.invalidate(self.codec.date_str(s.date))
+        # la liste complète change d'ordre : nouvelle version, et les suiveurs repartent de la liste complète
+        self.version += 1
+        self.changes.reset(self.version)
+        for listener in self.listeners:
+            listener(None)
+        return len(old)
+
+    def archive_past(self):
+        """
+        Move the schedule of dates before the archiving horizon to the archive.
+
+        Returns:
+            int: Number of dates archived.
+        """
+        with self.write_lock:
+            moved = self.move_past()
+            if moved:
+                self.write()
+            return moved
+
+    # marque un enregistrement comme modifié : nouvelle version des données, fragment invalidé
+    # event : (nom, delta) de la mutation, publié dans le journal et le flux d'événements
+    def touch(self, key, event=None):
+        self.version += 1
+        self.changes.append(self.version, key, self.record(key), event)
+        self.fragments.invalidate(key)
+        for listener in self.listeners:
+            listener(key)
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé)
+    def record(self, key):
+        movies = self.movies_for_date(key)
+        return {"date": key, "movies": movies} if movies is not None else None
+
+    # un seul processus : rien à rattraper
+    def sync(self):
+        pass
+
+    def write_snapshot(self, schedule):
+        write_snapshot(self.snapshot_path, self.path,
+                       (self.codec.movies, self.codec.others, [s.pack() for s in schedule]), SNAPSHOT_MAGIC)
+
+    # sauvegarde le planning dans le fichier, une date décodée à la fois
+    def write(self):
+        self.move_past() # premier passage du jour : les dates passées sortent du fichier avant sa réécriture
+        with span("store.write", backend="json"):
+            start = time.perf_counter()
+            with open(self.path, 'w') as f:
+                f.write('{"schedule": [')
+                for i, s in enumerate(self.schedule):
+                    f.write(", " if i else "")
+                    f.write(json.dumps(s.to_dict(self.codec)))
+                f.write("]}")
+            self.write_snapshot(self.schedule)
+            STORE_WRITE_SECONDS.observe(("json",), time.perf_counter() - start)
+
+    # le planning sous forme JSON (dicts), décodé au fil de l'itération
+    def all(self):
+        return (s.to_dict(self.codec) for s in self.schedule)
+
+    def archived(self):
+        return archive.scan()
+
+    # tailles du jeu de données pour /metrics ; vide tant que le chargement n'est pas fait
+    def sizes(self):
+        if self._schedule is None:
+            return {}
+        return {"dates": len(self._schedule), "entries": sum(len(s.movies) for s in self._schedule)}
+
+    # fragment JSON d'une date, décodé seulement s'il n'est pas en cache
+    def fragment(self, s):
+        key = self.codec.date_str(s.date)
+        fragment = self.fragments.fragments.get(key)
+        return fragment if fragment is not None else self.fragments.get(key, s.to_dict(self.codec))
+
+    # liste complète : dates archivées (encodées une fois par ajout au mois) puis planning en mémoire
+    def encoded_all(self):
+        return join_fragments(list(self.iter_encoded()))
+
+    def movies_for_date(self, date):
+        entry = self.entry(date)
+        if entry is None:
+            return archive.movies_for_date(date)
+        return [self.codec.movie_id(m) for m in entry.movies]
+
+    def dates_for_movie(self, movie_id):
+        archived = archive.dates_for_movie(movie_id) if movie_id in archive.movies else []
+        movie = self.codec.find_movie(movie_id)
+        if movie is None:
+            return archived
+        return archived + [self.codec.date_str(s.date) for s in self.schedule if movie in s.movies]
+
+    def add_date(self, date, movies):
+        with self.write_lock:
+            day = self.codec.date(date)
+            if day in self.index or archive.movies_for_date(date) is not None:
+                return False
+            entry = ScheduleEntry(day, array.array("I", [self.codec.movie(m) for m in movies]))
+            self.schedule.append(entry)
+            self.index[day] = entry
+            self.touch(str(date), ("date_added", {"movies": list(movies)}))
+            self.write()
+            return True
+
+    def add_movie_to_date(self, date, movie_id):
+        """
+        Returns:
+            str: "exists", "added" (existing date) or "created" (new date).
+        """
+        with self.write_lock:
+            entry = self.entry(date)
+            if entry is None:
+                archived = archive.movies_for_date(date)
+                if archived is None:
+                    self.add_date(date, [movie_id])
+                    return "created"
+                if movie_id in archived:
+                    return "exists"
+                entry = self.promote(date, archived)
+            movie = self.codec.movie(movie_id)
+            if movie in entry.movies:
+                return "exists"
+            entry.movies.append(movie)
+            self.touch(str(date), ("movie_added", {"movies": [movie_id]}))
+            self.write()
+            return "added"
+
+    def merge_many(self, entries):
+        """
+        Bulk import: create the missing dates and add the missing movies, one file write for the whole batch.
+
+        Args:
+            entries (dict): date -> list of movie ids.
+
+        Returns:
+            tuple: (dates created, movies added).
+        """
+        with self.write_lock:
+            created = added = 0
+            changed = {} # date -> (événement, films ajoutés)
+            for date, movies in entries.items():
+                day = self.codec.date(date)
+                entry = self.index.get(day)
+                if entry is None:
+                    archived = archive.movies_for_date(date)
+                    if archived is not None:
+                        if set(movies) <= set(archived):
+                            continue # rien à ajouter : la date reste archivée
+                        entry = self.promote(date, archived)
+                event = "movie_added"
+                if entry is None:
+                    entry = ScheduleEntry(day)
+                    self.schedule.append(entry)
+                    self.index[day] = entry
+                    created += 1
+                    event = "date_added"
+                present = set(entry.movies)
+                new = [m for m in dict.fromkeys(self.codec.movie(m) for m in movies) if m not in present]
+                entry.movies.extend(new)
+                added += len(new)
+                if new or event == "date_added":
+                    changed[date] = (event, {"movies": [self.codec.movie_id(m) for m in new]})
+            for date, event in changed.items():
+                self.touch(date, event)
+            if changed:
+                self.write()
+            return created, added
+
+    # export complet : dates archivées (encodées une fois par ajout au mois) puis planning en mémoire
+    def iter_encoded(self):
+        yield from archive.encoded()
+        for s in list(self.schedule):
+            yield self.fragment(s)
+
+    def delete_date(self, date):
+        with self.write_lock:
+            if self.entry(date) is None:
+                archived = archive.movies_for_date(date)
+                if archived is not None:
+                    self.promote(date, archived) # date connue : la suppression aura lieu
+            day = self.codec.find_date(date)
+            entry = self.index.pop(day, None) if day is not None else None
+            if entry is None:
+                return False
+            self._schedule = [s for s in self.schedule if s.date != day]
+            self.touch(str(date), ("date_deleted", {"movies": [self.codec.movie_id(m) for m in entry.movies]}))
+            self.write()
+            return True
+
+    def delete_movie_from_date(self, date, movie_id):
+        """
+        Returns:
+            bool or None: None if the date is unknown, False if the movie is not scheduled that day.
+        """
+        with self.write_lock:
+            entry = self.entry(date)
+            if entry is None:
+                archived = archive.movies_for_date(date)
+                if archived is None:
+                    return None
+                if movie_id not in archived:
+                    return False
+                entry = self.promote(date, archived)
+            movie = self.codec.find_movie(movie_id)
+            if movie is None or movie not in entry.movies:
+                return False
+            entry.movies.remove(movie)
+            self.touch(str(date), ("movie_removed", {"movies": [movie_id]}))
+            self.write()
+            return True
+
+    def delete_movie_everywhere(self, movie_id):
+        with self.write_lock:
+            # les dates archivées où le film est programmé reviennent d'abord en mémoire
+            for date in archive.dates_for_movie(movie_id) if movie_id in archive.movies else []:
+                archived = archive.movies_for_date(date) if self.entry(date) is None else None
+                if archived is not None:
+                    self.promote(date, archived)
+            movie = self.codec.find_movie(movie_id)
+            found = False
+            for s in self.schedule if movie is not None else []:
+                if movie in s.movies:
+                    s.movies.remove(movie)
+                    self.touch(self.codec.date_str(s.date), ("movie_removed", {"movies": [movie_id]}))
+                    found = True
+            if found:
+                self.write()
+            return found
+
+class SqliteStore:
+    """
+    Schedule stored in SQLite (WAL mode), one connection per thread.
+
+    Each route uses one of the SQL constants below; sqlite3 keeps them
+    compiled in its per-connection statement cache.
+
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dates (
+            seq  INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS schedule (
+            seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+            date  TEXT NOT NULL,
+            movie TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS schedule_date_movie ON schedule(date, movie);
+        CREATE INDEX IF NOT EXISTS schedule_movie ON schedule(movie);
+        CREATE TABLE IF NOT EXISTS changes (
+            seq   INTEGER PRIMARY KEY AUTOINCREMENT,
+            key   TEXT NOT NULL,
+            event TEXT
+        );
+    """
+    SQL_ALL = """SELECT d.date, s.movie FROM dates d LEFT JOIN schedule s ON s.date = d.date
+                 ORDER BY d.seq, s.seq"""
+    SQL_DATE_EXISTS = "SELECT 1 FROM dates WHERE date = ?"
+    SQL_MOVIES_FOR_DATE = "SELECT movie FROM schedule WHERE date = ? ORDER BY seq"
+    SQL_DATES_FOR_MOVIE = """SELECT s.date FROM schedule s JOIN dates d ON d.date = s.date
+                             WHERE s.movie = ? ORDER BY d.seq"""
+    SQL_MOVIE_SCHEDULED = "SELECT 1 FROM schedule WHERE date = ? AND movie = ?"
+    SQL_INSERT_DATE = "INSERT OR IGNORE INTO dates (date) VALUES (?)"
+    SQL_INSERT_MOVIE = "INSERT OR IGNORE INTO schedule (date, movie) VALUES (?, ?)"
+    SQL_DELETE_DATE = "DELETE FROM dates WHERE date = ?"
+    SQL_DELETE_DATE_MOVIES = "DELETE FROM schedule WHERE date = ?"
+    SQL_DELETE_MOVIE_FROM_DATE = "DELETE FROM schedule WHERE date = ? AND movie = ?"
+    SQL_DELETE_MOVIE = "DELETE FROM schedule WHERE movie = ?"
+    SQL_TOUCH = "INSERT INTO changes (key, event) VALUES (?, ?)"
+    SQL_CHANGES_SINCE = "SELECT seq, key, event FROM changes WHERE seq > ? ORDER BY seq"
+    SQL_CHANGES_COLUMNS = "PRAGMA table_info(changes)"
+    SQL_ADD_EVENT_COLUMN = "ALTER TABLE changes ADD COLUMN event TEXT"
+    SQL_LAST_CHANGE = "SELECT MAX(seq) FROM changes"
+    SQL_PRUNE_CHANGES = "DELETE FROM changes WHERE seq <= ?"
+    SQL_COUNT = "SELECT (SELECT COUNT(*) FROM dates), (SELECT COUNT(*) FROM schedule)"
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.sync_lock = threading.Lock()
+        self.conn().executescript(self.SCHEMA)
+        # journal créé avant les événements nommés : la colonne est ajoutée sur place
+        if "event" not in {row[1] for row in self.conn().execute(self.SQL_CHANGES_COLUMNS)}:
+            self.conn().execute(self.SQL_ADD_EVENT_COLUMN)
+        # après un fork, chaque worker ouvre ses propres connexions
+        os.register_at_fork(after_in_child=self.reset_connections)
+        self.loaded = threading.Event()
+        self.loaded.set()
+        self.fragments = FragmentCache()
+        # version = numéro de la dernière mutation du journal partagé déjà prise en compte
+        self.version = self.conn().execute(self.SQL_LAST_CHANGE).fetchone()[0] or 0
+        # la table changes est partagée et ses numéros ne reviennent jamais en arrière : époque fixe
+        self.changes = ChangeLog("sqlite", self.version, CHANGELOG_SIZE)
+        self.listeners = [] # callbacks(key) appelés à chaque mutation, key None = tout invalider
+
+    def load(self):
+        # rien à précharger : les requêtes passent directement par les index SQLite
+        pass
+
+    # marque un enregistrement comme modifié dans le journal partagé par tous les workers,
+    # avec l'événement (nom, delta) de la mutation : les autres workers le diffusent aussi
+    def touch(self, key, event=None):
+        self.touch_many([(key, event)])
+
+    # une seule transaction pour tout un lot (import en masse) de (clé, événement)
+    def touch_many(self, changes):
+        with self.conn() as conn:
+            for key, event in changes:
+                seq = conn.execute(self.SQL_TOUCH, (key, encode(event).decode() if event else None)).lastrowid
+                if seq % CHANGES_PRUNE_EVERY == 0:
+                    conn.execute(self.SQL_PRUNE_CHANGES, (seq - CHANGES_KEPT,))
+        self.sync()
+
+    def sync(self):
+        """
+        Catch up with the mutations recorded by every worker (this one included).
+
+        Invalidates the local caches for each changed key; if this worker fell
+        behind the pruned part of the journal, everything is invalidated.
+        """
+        # un seul rattrapage à la fois : deux threads appliqueraient les mêmes mutations deux fois
+        with self.sync_lock:
+            rows = self.conn().execute(self.SQL_CHANGES_SINCE, (self.version,)).fetchall()
+            if not rows:
+                return
+            if rows[0][0] != self.version + 1:
+                self.fragments.clear()
+                self.changes.reset(rows[0][0] - 1)
+                for listener in self.listeners:
+                    listener(None)
+            for seq, key, event in rows:
+                self.fragments.invalidate(key)
+                for listener in self.listeners:
+                    listener(key)
+                self.changes.append(seq, key, self.record(key), json.loads(event) if event else None)
+            self.version = rows[-1][0]
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé)
+    def record(self, key):
+        movies = self.movies_for_date(key)
+        return {"date": key, "movies": movies} if movies is not None else None
+
+    # transaction d'écriture chronométrée pour store_write_duration_seconds
+    @contextmanager
+    def transaction(self):
+        with span("store.write", backend="sqlite"):
+            start = time.perf_counter()
+            try:
+                with self.conn() as conn:
+                    yield conn
+            finally:
+                STORE_WRITE_SECONDS.observe(("sqlite",), time.perf_counter() - start)
+
+    def reset_connections(self):
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def all(self):
+        schedule = []
+        entry = None
+        for date, movie in self.conn().execute(self.SQL_ALL):
+            if entry is None or entry["date"] != date:
+                entry = {"date": date, "movies": []}
+                schedule.append(entry)
+            if movie is not None:
+                entry["movies"].append(movie)
+        return schedule
+
+    def sizes(self):
+        dates, entries = self.conn().execute(self.SQL_COUNT).fetchone()
+        return {"dates": dates, "entries": entries}
+
+    def encoded_all(self):
+        return join_fragments([self.fragments.get(s["date"], s) for s in self.all()])
+
+    def movies_for_date(self, date):
+        conn = self.conn()
+        if conn.execute(self.SQL_DATE_EXISTS, (str(date),)).fetchone() is None:
+            return None
+        return [movie for (movie,) in conn.execute(self.SQL_MOVIES_FOR_DATE, (str(date),))]
+
+    def dates_for_movie(self, movie_id):
+        return [date for (date,) in self.conn().execute(self.SQL_DATES_FOR_MOVIE, (movie_id,))]
+
+    def add_date(self, date, movies):
+        with self.transaction() as conn:
+            if conn.execute(self.SQL_INSERT_DATE, (str(date),)).rowcount == 0:
+                return False
+            conn.executemany(self.SQL_INSERT_MOVIE, [(str(date), m) for m in movies])
+        self.touch(str(date), ("date_added", {"movies": list(dict.fromkeys(movies))}))
+        return True
+
+    def add_movie_to_date(self, date, movie_id):
+        with self.transaction() as conn:
+            created = conn.execute(self.SQL_INSERT_DATE, (str(date),)).rowcount == 1
+            if conn.execute(self.SQL_INSERT_MOVIE, (str(date), movie_id)).rowcount == 0:
+                return "exists"
+        self.touch(str(date), ("date_added" if created else "movie_added", {"movies": [movie_id]}))
+        return "created" if created else "added"
+
+    def merge_many(self, entries):
+        created = added = 0
+        changed = []
+        with self.transaction() as conn:
+            for date, movies in entries.items():
+                new_date = conn.execute(self.SQL_INSERT_DATE, (date,)).rowcount
+                new_movies = [m for m in movies if conn.execute(self.SQL_INSERT_MOVIE, (date, m)).rowcount]
+                created += new_date
+                added += len(new_movies)
+                if new_date or new_movies:
+                    changed.append((date, ("date_added" if new_date else "movie_added", {"movies": new_movies})))
+        if changed:
+            self.touch_many(changed)
+        return created, added
+
+    def iter_encoded(self):
+        for s in self.all():
+            yield self.fragments.get(s["date"], s)
+
+    def delete_date(self, date):
+        with self.transaction() as conn:
+            if conn.execute(self.SQL_DELETE_DATE, (str(date),)).rowcount == 0:
+                return False
+            movies = [movie for (movie,) in conn.execute(self.SQL_MOVIES_FOR_DATE, (str(date),))]
+            conn.execute(self.SQL_DELETE_DATE_MOVIES, (str(date),))
+        self.touch(str(date), ("date_deleted", {"movies": movies}))
+        return True
+
+    def delete_movie_from_date(self, date, movie_id):
+        with self.transaction() as conn:
+            if conn.execute(self.SQL_DATE_EXISTS, (str(date),)).fetchone() is None:
+                return None
+            removed = conn.execute(self.SQL_DELETE_MOVIE_FROM_DATE, (str(date), movie_id)).rowcount > 0
+        if removed:
+            self.touch(str(date), ("movie_removed", {"movies": [movie_id]}))
+        return removed
+
+    def delete_movie_everywhere(self, movie_id):
+        with self.transaction() as conn:
+            dates = [date for (date,) in conn.execute(self.SQL_DATES_FOR_MOVIE, (movie_id,))]
+            conn.execute(self.SQL_DELETE_MOVIE, (movie_id,))
+        self.touch_many([(date, ("movie_removed", {"movies": [movie_id]})) for date in dates])
+        return len(dates) > 0
+
+    def migrate(self, json_path, archived=()):
+        """
+        One-shot import of an existing times.json (already present rows are skipped).
+
+        Args:
+            json_path (str): Path of the JSON file to import.
+            archived (iterable): Archived dates to import too ({"date", "movies"} records).
+
+        Returns:
+            int: Number of dates read from the file.
+        """
+        with open(json_path, "r") as jsf:
+            schedule = json.load(jsf)["schedule"]
+        count = len(schedule)
+        schedule += archived
+        with self.conn() as conn:
+            conn.executemany(self.SQL_INSERT_DATE, [(str(s["date"]),) for s in schedule])
+            conn.executemany(self.SQL_INSERT_MOVIE, [(str(s["date"]), m) for s in schedule for m in s["movies"]])
+        return count
+
+    # l'archive froide ne concerne que le backend JSON : une archive existante est importée par migrate
+    def archive_past(self):
+        return 0
+
+    def archived(self):
+        return ()
+
+def open_store():
+    # plusieurs workers : l'état doit être partagé -> SQLite, migré depuis le JSON au premier lancement
+    if WORKERS > 1:
+        if STORAGE != "sqlite":
+            # chaque worker forké réécrirait sa propre copie du JSON : le dernier écrivain gagne
+            sys.exit("SCHEDULE_WORKERS > 1 requires SCHEDULE_STORAGE=sqlite")
+        fresh = not os.path.exists(SQLITE_PATH)
+        sqlite_store = SqliteStore(SQLITE_PATH)
+        if fresh:
+            sqlite_store.migrate(JSON_PATH, archive.scan())
+        return sqlite_store
+    if STORAGE == "sqlite":
+        return SqliteStore(SQLITE_PATH)
+    return JsonStore(JSON_PATH)
+
+store = open_store()
+
+# chargement des données en arrière-plan : le port s'ouvre tout de suite, /ready passe à 200 une fois chargé
+def warm_up():
+    store.load()
+    store.archive_past()
+
+threading.Thread(target=warm_up, daemon=True).start()
+
+# en mode multi-process : rattrape les mutations des autres workers avant de servir la requête
+@app.before_request
+def sync_store():
+    store.sync()
+
+# réponses de liste complète : version et époque des données, point de départ du flux de changements
+@app.after_request
+def data_version_headers(response):
+    if "data_version" in g:
+        response.headers["X-Data-Version"] = str(g.data_version)
+        response.headers["X-Data-Epoch"] = store.changes.epoch
+    return response
+
+movie_client = ServiceClient("movie", MOVIE_URL)
+user_client = ServiceClient("user", USER_URL)
+clients = [movie_client, user_client]
+
+# réconciliation des références : films supprimés dans Movie mais encore programmés ici
+RECONCILE_AS = os.environ.get("SCHEDULE_RECONCILE_AS", "") # admin au nom duquel les listes sont lues ; vide = désactivée
+RECONCILE_REPAIR = os.environ.get("SCHEDULE_RECONCILE_REPAIR", "0") == "1" # 1 : retire les films orphelins du planning
+RECONCILE_SECONDS = float(os.environ.get("SCHEDULE_RECONCILE_SECONDS", 30)) # intervalle entre deux passes
+RECONCILE_TIMEOUT = 60 # secondes pour relire une liste complète
+RECONCILE_REPAIRED_TOTAL = Counter("reconcile_repaired_total", "Dangling schedule entries removed by the reconciler, per reference.",
+                                   ("kind",))
+
+class Reconciler:
+    """
+    Background check of the movie ids referenced by the schedule.
+
+    Each pass follows two change feeds: Movie's and the local store's. It
+    only looks at the dates changed locally and at the dates of the movies
+    deleted upstream. Those dates come from a reverse index (movie -> dates),
+    so a pass costs O(changes) instead of joining the whole schedule with the
+    catalogue. The first pass, or a pass after the local feed was missed,
+    scans everything once to rebuild that index.
+
+    With RECONCILE_REPAIR, the dangling movies are removed from their dates.
+    Otherwise they are only reported, by GET /<user_id>/schedule/reconcile
+    and /metrics.
+
+    Args:
+        source: Store whose schedule is checked.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.movies = IdFollower(movie_client, "movies", RECONCILE_AS, RECONCILE_TIMEOUT)
+        self.lock = threading.Lock()
+        self.scheduled = None # film -> dates où il est programmé ; peut garder des entrées périmées, revérifiées
+        self.version = None # version du store déjà vérifiée
+        self.epoch = None
+        self.dangling = {} # date -> films inconnus de Movie
+        self.last_pass = None
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        self.source.loaded.wait()
+        while True:
+            try:
+                self.reconcile()
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                self.last_pass = {"at": time.time(), "error": str(e)}
+            time.sleep(RECONCILE_SECONDS)
+
+    # références d'une date : index inverse complété, films orphelins notés
+    def check(self, entry):
+        date = str(entry["date"])
+        for movie in entry["movies"]:
+            self.scheduled.setdefault(movie, set()).add(date)
+        missing = set(entry["movies"]) - self.movies.ids
+        if missing:
+            self.dangling[date] = missing
+        else:
+            self.dangling.pop(date, None)
+
+    def reconcile(self):
+        with self.lock:
+            start = time.perf_counter()
+            self.source.sync()
+            new_movies, gone_movies = self.movies.poll()
+            changes = None
+            if self.scheduled is not None and self.epoch == self.source.changes.epoch:
+                version, changes = self.source.changes.since(self.version)
+            if changes is None:
+                # premier passage ou journal local dépassé : un parcours complet reconstruit l'index inverse
+                version = self.source.version
+                self.scheduled, self.dangling = {}, {}
+                checked = 0
+                for entry in itertools.chain(self.source.archived(), self.source.all()):
+                    self.check(entry)
+                    checked += 1
+            else:
+                dates = {str(json.loads(change)["key"]) for change in changes}
+                for movie in gone_movies or ():
+                    dates |= self.scheduled.get(movie, set())
+                # un film revenu : les dates signalées qui le programment sont revues
+                for movie in new_movies or ():
+                    dates |= self.scheduled.get(movie, set()) & self.dangling.keys()
+                checked = len(dates)
+                for date in dates:
+                    entry = self.source.record(date)
+                    if entry is None:
+                        self.dangling.pop(date, None)
+                    else:
+                        self.check(entry)
+            self.version, self.epoch = version, self.source.changes.epoch
+            repaired = self.repair() if RECONCILE_REPAIR else 0
+            self.last_pass = {"at": time.time(), "full": changes is None, "checked": checked, "repaired": repaired,
+                              "seconds": round(time.perf_counter() - start, 6)}
+
+    def repair(self):
+        """
+        Remove the dangling movies from their dates.
+
+        Returns:
+            int: Number of (date, movie) entries removed.
+        """
+        repaired = 0
+        for date, movies in list(self.dangling.items()):
+            del self.dangling[date]
+            for movie in movies:
+                if self.source.delete_movie_from_date(date, movie):
+                    RECONCILE_REPAIRED_TOTAL.inc(("movie",))
+                    repaired += 1
+        # ces suppressions sont revues au passage suivant, comme toute mutation du store
+        return repaired
+
+    def report(self):
+        """
+        Returns:
+            dict: {"movies", "last_pass"}: movie -> dates, for the scheduled movies unknown to Movie.
+        """
+        dangling = list(self.dangling.items()) # copie : une passe peut être en cours
+        movies = {}
+        for date, missing in dangling:
+            for movie in missing:
+                movies.setdefault(movie, []).append(date)
+        return {"movies": {movie: sorted(dates) for movie, dates in movies.items()}, "last_pass": self.last_pass}
+
+reconciler = Reconciler(store)
 
 # fonction utilitaire pour vérifier admin
 def verify_admin(user_id):
@@ -49,11 +1097,15 @@ def verify_admin(user_id):
     if user_id in user_admin_cache:
         cached = user_admin_cache[user_id]
         if now - cached["timestamp"] < CACHE_TTL:
+            ADMIN_CACHE_TOTAL.inc(("hit",))
             return cached["is_admin"], None
+        ADMIN_CACHE_TOTAL.inc(("expired",))
+    else:
+        ADMIN_CACHE_TOTAL.inc(("miss",))
 
     # sinon appelle le microservice User
     try:
-        r = requests.get(f"{USER_URL}/users/{user_id}/is_admin")
+        r = user_client.get(f"/users/{user_id}/is_admin", call="is_admin")
         if r.status_code == 200:
             data = r.json()
             is_admin = data.get("is_admin", False)
@@ -61,10 +1113,18 @@ def verify_admin(user_id):
             return is_admin, None
         else:
             return False, make_response(jsonify({"error": "Unable to verify user"}), 401)
+    except requests.exceptions.Timeout:
+        return False, make_response(jsonify({"error": "User service timed out"}), 504)
     except requests.exceptions.RequestException:
         return False, make_response(jsonify({"error": "User service unreachable"}), 503)
 
 
+# Server-Sent Events du journal des changements (common.events), sur un port dédié
+EVENTS_PORT = int(os.environ.get("SCHEDULE_EVENTS_PORT", 3212)) # 0 = pas de flux d'événements
+EVENTS_NAMES = {"upsert": "date", "delete": "date_deleted"} # nom des changements sans événement nommé par la mutation
+
+events = EventHub(app, store, verify_admin, r"^/([^/?]+)/schedule/events(?:\?(.*))?$", EVENTS_NAMES)
+
 # page d’accueil du service
 @app.route("/", methods=['GET'])
 def home():
@@ -77,6 +1137,49 @@ def home():
     """
    return "<h1 style='color:blue'>Welcome to the Schedule service!</h1>"
 
+# sonde de disponibilité : 200 seulement une fois les données chargées et interrogeables
+@app.route("/ready", methods=['GET'])
+def ready():
+    """
+    Readiness probe for the Schedule service.
+
+    Returns:
+        Response: 200 once the data is loaded and queryable, 503 while it is still loading.
+    """
+    if not store.loaded.is_set():
+        return make_response(jsonify({"ready": False}), 503)
+    return make_response(jsonify({"ready": True}), 200)
+
+
+# métriques au format texte Prometheus
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics of the service: request latencies per route, outbound
+    call latencies, user_admin_cache lookups, store write times, dataset sizes
+    and circuit breaker states (per worker in multi-process mode).
+
+    Returns:
+        Response: Metrics in Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += ["# HELP dataset_records Records currently held by the store.", "# TYPE dataset_records gauge"]
+    for kind, count in store.sizes().items():
+        lines.append('dataset_records{kind="%s"} %d' % (kind, count))
+    lines += ["# HELP events_subscribers Server-Sent Events subscribers streaming from this process.",
+              "# TYPE events_subscribers gauge", "events_subscribers %d" % events.subscribed()]
+    if RECONCILE_AS:
+        lines += ["# HELP reconcile_dangling References to deleted movies found by the last pass.",
+                  "# TYPE reconcile_dangling gauge",
+                  'reconcile_dangling{kind="movie"} %d' % sum(len(missing) for missing in list(reconciler.dangling.values()))]
+    lines += breaker_metrics(clients)
+    return app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# routes admin de profilage (common.profiling)
+profiling.install_routes(app, verify_admin)
+
 # retourne tout le planning en JSON brut
 @app.route("/<user_id>/schedule/json", methods=['GET'])
 def get_json(user_id):
@@ -94,9 +1197,159 @@ def get_json(user_id):
     if error:
         return error
 
-    res = make_response(jsonify(schedule), 200)
+    g.data_version = store.version # réponse versionnée : compressée une seule fois par version
+    res = json_response(store.encoded_all())
     return res
 
+# films supprimés dans Movie mais encore programmés, trouvés par la réconciliation
+@app.route("/<user_id>/schedule/reconcile", methods=['GET'])
+def get_reconcile_report(user_id):
+    """
+    Report of the last reconciliation passes.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Returns:
+        Response: JSON {"enabled", "repair", "movies", "last_pass"}: per movie
+                  unknown to Movie, the dates still scheduling it; or an
+                  unauthorized error.
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    return make_response(jsonify(dict(reconciler.report(), enabled=bool(RECONCILE_AS), repair=RECONCILE_REPAIR)), 200)
+
+# flux de changements : mutations depuis la version ?since=N, ou 410 s'il faut tout recharger
+@app.route("/<user_id>/schedule/changes", methods=['GET'])
+def get_schedule_changes(user_id):
+    """
+    Get the schedule changed since a version, from the in-memory change log.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Query Parameters:
+        since (int): Last version the caller has applied (X-Data-Version of the full list, then
+                     "version" of the previous answer).
+
+    Returns:
+        Response: JSON {"changes", "epoch", "version"} in version order, or 410
+                  "resync required" if the changes fell out of the log (reload
+                  the full list, then follow from its version).
+    """
+    _, error = verify_admin(user_id)
+    if error:
+        return error
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return make_response(jsonify({"error": "'since' must be a non-negative integer"}), 400)
+    version, changes = store.changes.since(int(since))
+    if changes is None:
+        return make_response(jsonify({"error": "resync required", "epoch": store.changes.epoch,
+                                      "version": version}), 410)
+    return json_response(b'{"changes":' + join_fragments(changes) + b',"epoch":' + encode(store.changes.epoch) +
+                         b',"version":' + str(version).encode() + b"}")
+
+# vérifie qu'une ligne d'import décrit une date du planning
+def schedule_error(entry):
+    if not isinstance(entry, dict):
+        return "expected a JSON object"
+    if not isinstance(entry.get("date"), str) or not entry["date"]:
+        return "missing or invalid 'date'"
+    movies = entry.get("movies", [])
+    if not isinstance(movies, list) or not all(isinstance(m, str) and m for m in movies):
+        return "'movies' must be a list of movie IDs"
+    return None
+
+# import en masse : corps NDJSON lu au fil de l'eau, fusionné et persisté par paquets de BULK_CHUNK lignes
+@app.route("/<user_id>/schedule/bulk", methods=['POST'])
+def import_schedule(user_id):
+    """
+    Import schedule dates from an NDJSON body (one {"date", "movies"} object per line).
+
+    Each line is merged into the schedule: the date is created if missing
+    and its movies not yet scheduled that date are added. Lines are applied
+    BULK_CHUNK at a time, with one write of the storage per chunk. Invalid
+    lines are skipped, the others are still imported.
+
+    Args:
+        user_id (str): ID of the requesting user (must be an admin).
+
+    Request Body:
+        NDJSON, one date per line ({"date": "20151130", "movies": [movie IDs]}), as
+        produced by GET /<user_id>/schedule/export.
+
+    Returns:
+        Response: JSON {"dates_created", "movies_added", "duplicates", "invalid", "errors"}
+                  where duplicates counts movies already scheduled on their date and
+                  errors lists the first BULK_MAX_ERRORS invalid lines ({"line", "error"}),
+                  or an error if user is not admin.
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+
+    # si pas admin -> accès interdit
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+
+    result = {"dates_created": 0, "movies_added": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    chunk = {} # date -> films, les lignes d'une même date sont fusionnées
+    submitted = lines = 0
+
+    def flush():
+        nonlocal submitted, lines
+        if chunk:
+            with span("schedule.bulk_chunk", size=lines):
+                created, added = store.merge_many(chunk)
+            result["dates_created"] += created
+            result["movies_added"] += added
+            result["duplicates"] += submitted - added
+            chunk.clear()
+            submitted = lines = 0
+
+    for number, entry in read_ndjson(request.stream):
+        message = "invalid JSON: %s" % entry if isinstance(entry, ValueError) else schedule_error(entry)
+        if message:
+            result["invalid"] += 1
+            if len(result["errors"]) < BULK_MAX_ERRORS:
+                result["errors"].append({"line": number, "error": message})
+            continue
+        movies = chunk.setdefault(entry["date"], [])
+        for movie_id in entry.get("movies", []):
+            submitted += 1
+            if movie_id not in movies:
+                movies.append(movie_id)
+        lines += 1
+        if lines >= BULK_CHUNK:
+            flush()
+    flush()
+    return make_response(jsonify(result), 200)
+
+# export en masse : une date par ligne, dans le format accepté par l'import
+@app.route("/<user_id>/schedule/export", methods=['GET'])
+def export_schedule(user_id):
+    """
+    Export the schedule as NDJSON, streamed date by date.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Returns:
+        Response: application/x-ndjson body, one {"date", "movies"} object per line (the
+                  input format of POST /<user_id>/schedule/bulk), or an error if user is
+                  not authorized.
+    """
+    _, error = verify_admin(user_id)
+    if error:
+        return error
+
+    g.data_version = store.version
+    return ndjson_response(store.iter_encoded())
+
 # récupère les films programmés pour une date précise
 @app.route("/<user_id>/schedule/<date>", methods=['GET'])
 def get_movies_by_date(user_id, date):
@@ -115,10 +1368,10 @@ def get_movies_by_date(user_id, date):
     if error:
         return error
 
-    for movies_date in schedule:
-        if str(movies_date["date"]) == str(date):
-            res = make_response(jsonify(movies_date["movies"]),200) # renvoi tous les movies direct suivant la date
-            return res
+    movies = store.movies_for_date(date)
+    if movies is not None:
+        res = make_response(jsonify(movies),200) # renvoi tous les movies direct suivant la date
+        return res
     return make_response(jsonify({"error":"No movies found with this date"}),500)
 
 # récupère les films programmés pour une date avec leurs détails
@@ -139,23 +1392,21 @@ def get_movies_by_date_details(user_id, date):
     if error:
         return error
 
-    for movies_date in schedule:
-        if str(movies_date["date"]) == str(date):
-            movies_detail = []
-            for movie_id in movies_date["movies"]:
-                try:
-                    r = requests.get(f"{MOVIE_URL}/{user_id}/movies/{movie_id}")
-                    if r.status_code == 200:
-                        movies_detail.append(r.json())
-                    else:
-                        movies_detail.append({"id": movie_id, "error": "movie not found"})
-                except requests.exceptions.RequestException:
-                    movies_detail.append({"id": movie_id, "error": "movie service unreachable"})
-
-            return make_response(jsonify({
-                "date": date,
-                "movies": movies_detail
-            }), 200)
+    movies = store.movies_for_date(date)
+    if movies is not None:
+        # on garde tels quels les octets JSON renvoyés par Movie, sans les décoder ni les réencoder
+        movies_detail = []
+        for movie_id in movies:
+            try:
+                r = movie_client.get(f"/{user_id}/movies/{movie_id}", call="movie_by_id")
+                if r.status_code == 200:
+                    movies_detail.append(r.content.strip())
+                else:
+                    movies_detail.append(encode({"id": movie_id, "error": "movie not found"}))
+            except requests.exceptions.RequestException:
+                movies_detail.append(encode({"id": movie_id, "error": "movie service unreachable"}))
+
+        return json_response(b'{"date":' + encode(date) + b',"movies":' + join_fragments(movies_detail) + b'}')
 
     return make_response(jsonify({"error": "date not found"}), 404)
 
@@ -185,7 +1436,7 @@ def get_schedule_by_movie_id(user_id):
         return make_response(jsonify({"error": "missing 'id' parameter"}), 400)
 
     # récupère toutes les dates où ce film apparaît
-    dates = [movies_date["date"] for movies_date in schedule if movie_id in movies_date["movies"]]
+    dates = store.dates_for_movie(movie_id)
 
     if not dates:
         return make_response(jsonify({"error": "no schedule found for this movie id"}), 404)
@@ -223,18 +1474,10 @@ def add_date_schedule(user_id, date_id):
 
     req = request.get_json()
 
-    # vérifie si la date existe déjà
-    for movies_date in schedule:
-        if str(movies_date["date"]) == str(date_id):
-            return make_response(jsonify({"error": "schedule date already exists"}), 500)
-
     # ajoute la nouvelle entrée (soit avec données du body, soit vide avec seulement l'ID)
-    new_entry = {
-        "date": date_id,
-        "movies": req.get("movies", []) # si pas fourni, on met []
-    }
-    schedule.append(new_entry)
-    write(schedule)
+    # échoue si la date existe déjà
+    if not store.add_date(date_id, req.get("movies", [])): # si pas fourni, on met []
+        return make_response(jsonify({"error": "schedule date already exists"}), 500)
 
     return make_response(jsonify({"message": "schedule date added"}), 200)
 
@@ -270,25 +1513,15 @@ def add_movie_to_date(user_id, date):
     if not movie_id:
         return make_response(jsonify({"error": "missing 'movie_id' in body"}), 400)
 
-    # cherche si la date existe déjà
-    for movies_date in schedule:
-        if str(movies_date["date"]) == str(date):
-            # si le film existe déjà dans la liste
-            if movie_id in movies_date["movies"]:
-                return make_response(jsonify({"error": "movie already scheduled for this date"}), 500)
-            
-            # sinon on ajoute
-            movies_date["movies"].append(movie_id)
-            write(schedule)
-            return make_response(jsonify({"message": "movie added to existing date"}), 200)
-
-    # si la date n'existe pas : on la crée
-    new_entry = {
-        "date": date,
-        "movies": [movie_id]
-    }
-    schedule.append(new_entry)
-    write(schedule)
+    # ajoute à la date existante, ou crée la date si elle n'existe pas
+    status = store.add_movie_to_date(date, movie_id)
+
+    # si le film existe déjà dans la liste
+    if status == "exists":
+        return make_response(jsonify({"error": "movie already scheduled for this date"}), 500)
+
+    if status == "added":
+        return make_response(jsonify({"message": "movie added to existing date"}), 200)
 
     return make_response(jsonify({"message": "new date created and movie added"}), 200)
 
@@ -313,14 +1546,9 @@ def delete_date(user_id, date_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    global schedule # variable faisant référence en dehors fonction
-    new_schedule = [s for s in schedule if str(s["date"]) != str(date_id)]
-
-    if len(new_schedule) == len(schedule):
+    if not store.delete_date(date_id):
         return make_response(jsonify({"error": "date not found"}), 404)
 
-    schedule = new_schedule
-    write(schedule)
     return make_response(jsonify({"message": f"date {date_id} deleted"}), 200)
 
 # supprime un film d’une date précise
@@ -345,14 +1573,12 @@ def delete_movie_from_date(user_id, date_id, movie_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for s in schedule:
-        if str(s["date"]) == str(date_id):
-            if movie_id in s["movies"]:
-                s["movies"].remove(movie_id)
-                write(schedule)
-                return make_response(jsonify({"message": f"movie {movie_id} removed from date {date_id}"}), 200)
-            return make_response(jsonify({"error": "movie not found in this date"}), 404)
-    
+    removed = store.delete_movie_from_date(date_id, movie_id)
+    if removed:
+        return make_response(jsonify({"message": f"movie {movie_id} removed from date {date_id}"}), 200)
+    if removed is False:
+        return make_response(jsonify({"error": "movie not found in this date"}), 404)
+
     return make_response(jsonify({"error": "date not found"}), 404)
 
 # supprime un film de toutes les dates
@@ -377,18 +1603,34 @@ def delete_movie_from_all_dates(user_id, movie_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    found = False
-    for s in schedule:
-        if movie_id in s["movies"]:
-            s["movies"].remove(movie_id)
-            found = True
-
-    if not found:
+    if not store.delete_movie_everywhere(movie_id):
         return make_response(jsonify({"error": "movie not found in any date"}), 404)
 
-    write(schedule)
     return make_response(jsonify({"message": f"movie {movie_id} removed from all dates"}), 200)
 
 if __name__ == "__main__":
+   # migration unique times.json -> SQLite : python schedule.py migrate
+   if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+      count = SqliteStore(SQLITE_PATH).migrate(JSON_PATH, archive.scan())
+      print("%d dates migrated to %s" % (count, SQLITE_PATH))
+      sys.exit(0)
    print("Server running in port %s"%(PORT))
-   app.run(host=HOST, port=PORT)
+   if RECONCILE_AS:
+      if WORKERS > 1:
+         # chaque worker suit les flux et répare de son côté : les suppressions déjà faites sont sans effet
+         os.register_at_fork(after_in_child=reconciler.start)
+      else:
+         reconciler.start()
+   if EVENTS_PORT:
+      events.listen(HOST, EVENTS_PORT)
+      print("Server-Sent Events on port %s" % EVENTS_PORT)
+      if WORKERS > 1:
+         # les threads ne survivent pas au fork : chaque worker lance son propre thread d'abonnés
+         os.register_at_fork(after_in_child=events.start)
+      else:
+         events.start()
+   if WORKERS > 1:
+      print("Serving with %d workers" % WORKERS)
+      serve_prefork(app, HOST, PORT, WORKERS)
+   else:
+      app.run(host=HOST, port=PORT)
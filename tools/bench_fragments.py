@@ -0,0 +1,57 @@
+"""
+Serialization benchmark: jsonify vs pre-encoded per-record fragments.
+
+Times the body of GET /<user_id>/movies/json on a throw-away copy of movie/
+filled with N synthetic movies:
+
+- jsonify: the previous implementation, every movie re-encoded on every call;
+- fragments (cold): first call, every fragment encoded and cached;
+- fragments (warm): following calls, cached fragments only joined.
+
+Usage: python tools/bench_fragments.py [1000 10000 100000]
+"""
+import importlib.util, json, os, shutil, sys, tempfile, time, timeit, uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # module common, importé par les services copiés hors du dépôt
+
+def load_movie_service(directory, n):
+    shutil.copytree(os.path.join(ROOT, "movie"), directory, dirs_exist_ok=True)
+    movies = [{"title": "Movie %d" % i, "rating": round(5 + (i % 50) / 10, 1),
+               "director": "Director %d" % (i % 997), "id": str(uuid.UUID(int=i))} for i in range(n)]
+    with open(os.path.join(directory, "databases", "movies.json"), "w") as f:
+        json.dump({"movies": movies}, f)
+    for name in os.listdir(os.path.join(directory, "databases")):
+        if name.endswith((".snap", ".db")):
+            os.remove(os.path.join(directory, "databases", name))
+    os.chdir(directory)
+    spec = importlib.util.spec_from_file_location("movie_bench_%d" % n, os.path.join(directory, "movie.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.store.load()
+    return module
+
+def best(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+def main(sizes):
+    cwd = os.getcwd()
+    print("%10s %14s %16s %16s %9s" % ("movies", "jsonify", "fragments cold", "fragments warm", "speedup"))
+    for n in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            movie = load_movie_service(directory, n)
+            number = max(1, 100000 // n)
+            with movie.app.app_context():
+                baseline = best(lambda: movie.jsonify(movie.store.all()).get_data(), number)
+                t0 = time.perf_counter()
+                movie.json_response(movie.store.encoded_all())
+                cold = time.perf_counter() - t0
+                warm = best(lambda: movie.json_response(movie.store.encoded_all()).get_data(), number)
+            print("%10d %12.2fms %14.2fms %14.2fms %8.1fx" % (n, baseline * 1e3, cold * 1e3, warm * 1e3, baseline / warm))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1000, 10000, 100000])
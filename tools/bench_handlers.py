@@ -0,0 +1,163 @@
+"""
+Handler microbenchmarks, in process, through each app's Flask test client.
+
+For each size, generates a dataset with gen_dataset.py, loads each service
+from a throw-away copy holding it, and times a few handlers per service:
+
+- user: is_admin, get_user_by_id
+- movie: get_movie_by_id, get_movie_by_title
+- schedule: get_schedule_by_movie_id (most and least popular movie), get_movies_by_date
+- booking: get_user_bookings, add_booking, get_user_booking_details
+
+No network: the ServiceClient of every service is stubbed with answers read
+from the generated dataset. Times include the test client's WSGI overhead
+(a few tens of microseconds), identical for every handler. Write handlers
+include the persistence of the chosen backend.
+
+Usage: python tools/bench_handlers.py [-n 1000 100000] [--storage json|sqlite] [--budget 0.5]
+"""
+import argparse, collections, importlib.util, json, os, shutil, sys, tempfile, time
+from gen_dataset import generate, FILES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # module common, importé par les services copiés hors du dépôt
+ADMIN = "user_0" # gen_dataset : un utilisateur sur 100 est admin, user_0 compris
+
+class StubResponse:
+    """
+    Minimal stand-in for requests.Response, built from a JSON value.
+
+    Args:
+        status_code (int): HTTP status.
+        data: JSON-serializable body.
+    """
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.content = json.dumps(data).encode() + b"\n"
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def iter_content(self, chunk_size=65536):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+def stub_targets(dataset):
+    """
+    Answers of the four services, read from the generated dataset.
+
+    Returns:
+        dict: target name -> function(path) returning a StubResponse.
+    """
+    data = {}
+    for service, (name, key) in FILES.items():
+        with open(os.path.join(dataset, service, "databases", name)) as f:
+            data[service] = json.load(f)[key]
+    users = {u["id"]: u for u in data["user"]}
+    movies = {m["id"]: m for m in data["movie"]}
+    schedule = {s["date"]: s["movies"] for s in data["schedule"]}
+
+    def user(path):
+        user_id = path.split("/")[2] # /users/<id>/is_admin
+        found = users.get(user_id)
+        return StubResponse(200, {"is_admin": found["is_admin"]}) if found else StubResponse(404, {})
+
+    def movie(path):
+        found = movies.get(path.rsplit("/", 1)[1])
+        return StubResponse(200, found) if found else StubResponse(500, {"error": "movie ID not found"})
+
+    def schedule_by_date(path):
+        found = schedule.get(path.rsplit("/", 1)[1])
+        return StubResponse(200, found) if found is not None else StubResponse(404, {})
+
+    def booking(path):
+        return StubResponse(200, data["booking"])
+
+    return {"user": user, "movie": movie, "schedule": schedule_by_date, "booking": booking}, data
+
+def load_service(service, dataset, directory, storage, targets):
+    shutil.copytree(os.path.join(ROOT, service), directory, dirs_exist_ok=True)
+    databases = os.path.join(directory, "databases")
+    for name in os.listdir(databases):
+        os.remove(os.path.join(databases, name))
+    shutil.copy(os.path.join(dataset, service, "databases", FILES[service][0]), databases)
+    os.environ[service.upper() + "_STORAGE"] = storage
+    os.chdir(directory)
+    spec = importlib.util.spec_from_file_location("%s_bench_%s" % (service, os.path.basename(directory)),
+                                                  os.path.join(directory, service + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if storage == "sqlite":
+        module.store.migrate(module.JSON_PATH)
+    module.store.load()
+    for client in module.clients:
+        client.get = lambda path, call="get", _answer=targets[client.name], **kwargs: _answer(path)
+    return module
+
+def measure(fn, budget):
+    """
+    Call fn until budget seconds are spent (at least 3 calls, after one warm-up call).
+
+    Returns:
+        tuple: (mean seconds per call, number of calls, status of the warm-up call)
+    """
+    status = fn(0).status_code
+    calls, start = 0, time.perf_counter()
+    while calls < 3 or time.perf_counter() - start < budget:
+        calls += 1
+        fn(calls)
+    return (time.perf_counter() - start) / calls, calls, status
+
+def cases(data):
+    scheduled = collections.Counter(m for s in data["schedule"] for m in s["movies"])
+    (popular, _), (rare, _) = scheduled.most_common(1)[0], scheduled.most_common()[-1]
+    some_user = data["user"][len(data["user"]) // 2]["id"]
+    some_movie = data["movie"][len(data["movie"]) // 2]
+    some_date = data["schedule"][len(data["schedule"]) // 2]
+    heavy = data["booking"][0]["userid"] # gen_dataset écrit les plus gros réserveurs en premier
+    return {
+        "user": [
+            ("is_admin", lambda c, i: c.get("/users/%s/is_admin" % some_user)),
+            ("get_user_by_id", lambda c, i: c.get("/%s/users/%s" % (ADMIN, some_user))),
+        ],
+        "movie": [
+            ("get_movie_by_id", lambda c, i: c.get("/%s/movies/%s" % (ADMIN, some_movie["id"]))),
+            ("get_movie_by_title", lambda c, i: c.get("/%s/movies/by_title" % ADMIN, query_string={"title": some_movie["title"]})),
+        ],
+        "schedule": [
+            ("get_schedule_by_movie_id (popular)", lambda c, i: c.get("/%s/schedule/by_movie" % ADMIN, query_string={"id": popular})),
+            ("get_schedule_by_movie_id (rare)", lambda c, i: c.get("/%s/schedule/by_movie" % ADMIN, query_string={"id": rare})),
+            ("get_movies_by_date", lambda c, i: c.get("/%s/schedule/%s" % (ADMIN, some_date["date"]))),
+        ],
+        "booking": [
+            ("get_user_bookings (heavy)", lambda c, i: c.get("/%s/bookings/%s" % (ADMIN, heavy))),
+            ("add_booking", lambda c, i: c.post("/%s/bookings/bench_%d" % (ADMIN, i),
+                                                json={"date": some_date["date"], "movie_id": some_date["movies"][0]})),
+            ("get_user_booking_details (heavy)", lambda c, i: c.get("/%s/bookings/%s/details" % (ADMIN, heavy))),
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--bookings", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds per handler")
+    args = parser.parse_args()
+    cwd = os.getcwd()
+    print("%10s %-9s %-36s %12s %8s %6s" % ("bookings", "service", "handler", "µs/call", "calls", "status"))
+    for n in args.bookings:
+        dataset = tempfile.mkdtemp()
+        generate(dataset, n)
+        targets, data = stub_targets(dataset)
+        for service, benches in cases(data).items():
+            module = load_service(service, dataset, tempfile.mkdtemp(), args.storage, targets)
+            client = module.app.test_client()
+            for name, bench in benches:
+                seconds, calls, status = measure(lambda i: bench(client, i), args.budget)
+                print("%10d %-9s %-36s %12.1f %8d %6d" % (n, service, name, seconds * 1e6, calls, status))
+            os.chdir(cwd)
+        shutil.rmtree(dataset)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Memory benchmark of the in-memory layout of the Booking and Schedule stores.
+
+For each size, generates a dataset with gen_dataset.py and measures, with
+tracemalloc, the memory kept by the data once loaded:
+
+- dicts: the previous layout, the JSON records as parsed (nested dicts and
+  lists of strings) plus the index by key;
+- compact: the JsonStore of the service (interned movie ids, day ordinals,
+  arrays in __slots__ objects) plus its index.
+
+Load times (measured without tracemalloc) are given from JSON and from the
+binary snapshot: marshal of the dicts for the previous layout, of the packed
+records for the compact one. The JSON load time of the compact layout stops
+once the store is ready, before its snapshot is written in the background.
+
+Usage: python tools/bench_memory.py [-n 100000 1000000] [--service booking schedule]
+"""
+import argparse, gc, importlib.util, json, marshal, os, shutil, sys, tempfile, time, tracemalloc
+from gen_dataset import generate, FILES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # module common, importé par les services copiés hors du dépôt
+KEYS = {"booking": "userid", "schedule": "date"}
+
+def measure(load):
+    """
+    Call load() under tracemalloc.
+
+    Returns:
+        tuple: (value returned, bytes still allocated once loaded)
+    """
+    gc.collect()
+    tracemalloc.start()
+    value = load()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+def timed(load):
+    start = time.perf_counter()
+    load()
+    return time.perf_counter() - start
+
+def load_module(service, dataset, directory):
+    shutil.copytree(os.path.join(ROOT, service), directory, dirs_exist_ok=True)
+    databases = os.path.join(directory, "databases")
+    for name in os.listdir(databases):
+        os.remove(os.path.join(databases, name))
+    shutil.copy(os.path.join(dataset, service, "databases", FILES[service][0]), databases)
+    os.environ[service.upper() + "_STORAGE"] = "json"
+    os.environ[service.upper() + "_SPAN_LOG"] = ""
+    os.chdir(directory)
+    spec = importlib.util.spec_from_file_location("%s_memory_%s" % (service, os.path.basename(directory)),
+                                                  os.path.join(directory, service + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.store.loaded.wait() # chargement de démarrage du service terminé : il ne fausse pas les mesures
+    wait_snapshot(module.store)
+    return module
+
+def dicts_layout(path, name, key):
+    with open(path) as f:
+        records = json.load(f)[name]
+    return records, {r[key]: r for r in records}
+
+def compact_layout(module):
+    # un store neuf, chargé depuis le JSON (le snapshot du démarrage est d'abord retiré)
+    store = module.JsonStore(module.JSON_PATH)
+    if os.path.exists(store.snapshot_path):
+        os.remove(store.snapshot_path)
+    store.load()
+    store.index
+    return store
+
+def wait_snapshot(store):
+    # Booking écrit son snapshot en arrière-plan, une fois prêt : hors du temps de chargement mesuré
+    while not os.path.exists(store.snapshot_path):
+        time.sleep(0.01)
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--bookings", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--service", choices=tuple(KEYS), nargs="+", default=list(KEYS))
+    args = parser.parse_args()
+    cwd = os.getcwd()
+    print("%10s %-9s %-8s %10s %10s %12s %12s %12s" % ("bookings", "service", "layout", "records", "MiB",
+                                                       "bytes/entry", "json load s", "snap load s"))
+    for n in args.bookings:
+        dataset = tempfile.mkdtemp()
+        generate(dataset, n)
+        for service in args.service:
+            name = FILES[service][1]
+            module = load_module(service, dataset, tempfile.mkdtemp())
+            path = module.JSON_PATH
+            dicts_json = timed(lambda: dicts_layout(path, name, KEYS[service]))
+            (records, _), dicts_size = measure(lambda: dicts_layout(path, name, KEYS[service]))
+            # entrées : réservations (un film à une date d'un utilisateur) ou films programmés à une date
+            entries = sum(len(d["movies"]) for r in records for d in r["dates"]) if service == "booking" \
+                else sum(len(s["movies"]) for s in records)
+            snapshot = marshal.dumps(records)
+            del records
+            dicts_snap = timed(lambda: marshal.loads(snapshot))
+            del snapshot
+            loaded = []
+            compact_json = timed(lambda: loaded.append(compact_layout(module)))
+            wait_snapshot(loaded.pop())
+            store, compact_size = measure(lambda: wait_snapshot(compact_layout(module)))
+            compact_snap = timed(lambda: module.JsonStore(path).load())
+            count = len(store.index)
+            del store
+            for layout, size, json_s, snap_s in (("dicts", dicts_size, dicts_json, dicts_snap),
+                                                 ("compact", compact_size, compact_json, compact_snap)):
+                print("%10d %-9s %-8s %10d %10.1f %12.1f %12.2f %12.2f" % (n, service, layout, count, size / 2**20,
+                                                                         size / max(1, entries), json_s, snap_s))
+            os.chdir(cwd)
+        shutil.rmtree(dataset)
+
+if __name__ == "__main__":
+    sys.exit(main())
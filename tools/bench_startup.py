@@ -0,0 +1,64 @@
+"""
+Startup-time measurements for the Movie service on large catalogues.
+
+For each size, a throw-away copy of movie/ is filled with N synthetic movies
+and each boot is run in a fresh interpreter:
+
+- json.load: what the service used to do at import before serving anything;
+- import: time until the module is importable, i.e. until the port can open;
+- cold ready: first boot, data parsed from JSON and the snapshot written;
+- warm ready: next boots, data read back from the mmap'ed binary snapshot.
+
+Usage: python tools/bench_startup.py [10000 100000 1000000]
+"""
+import json, os, shutil, subprocess, sys, tempfile, uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = r'''
+import json, sys, time
+t0 = time.perf_counter()
+if sys.argv[1] == "json.load":
+    with open("./databases/movies.json") as f:
+        json.load(f)["movies"]
+    print(time.perf_counter() - t0)
+    sys.exit(0)
+sys.path.insert(0, ".")
+import movie
+t1 = time.perf_counter()
+movie.store.loaded.wait()
+print(t1 - t0 if sys.argv[1] == "import" else time.perf_counter() - t0)
+'''
+
+def make_catalogue(directory, n):
+    movies = [{"title": "Movie %d" % i, "rating": round(5 + (i % 50) / 10, 1),
+               "director": "Director %d" % (i % 997), "id": str(uuid.UUID(int=i))} for i in range(n)]
+    with open(os.path.join(directory, "databases", "movies.json"), "w") as f:
+        json.dump({"movies": movies}, f)
+
+def boot(directory, mode):
+    # le service est copié seul : le module common est pris dans le dépôt
+    out = subprocess.run([sys.executable, "-c", BOOT, mode], cwd=directory, check=True,
+                         env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+def main(sizes):
+    print("%10s %12s %12s %12s %12s" % ("records", "json.load", "import", "cold ready", "warm ready"))
+    for n in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            shutil.copytree(os.path.join(ROOT, "movie"), directory, dirs_exist_ok=True)
+            for name in os.listdir(os.path.join(directory, "databases")):
+                if name.endswith((".snap", ".db")):
+                    os.remove(os.path.join(directory, "databases", name))
+            make_catalogue(directory, n)
+            baseline = boot(directory, "json.load")
+            cold = boot(directory, "ready")
+            warm = boot(directory, "ready")
+            ready_import = boot(directory, "import")
+            print("%10d %11.3fs %11.3fs %11.3fs %11.3fs" % (n, baseline, ready_import, cold, warm))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,47 @@
+"""
+Aggregated flame graph input of the slow requests of the four services.
+
+Fetches GET /<admin>/profiling/slow from each service (started with
+<SERVICE>_PROFILING=1) and merges the folded stacks into one file. Each
+stack starts with the service and the route, so the four apps show up as
+four towers of the same flame graph.
+
+Usage:
+    python tools/flamegraph.py <admin_user_id> [-o slow.folded] [--url http://host:port ...]
+
+Then: flamegraph.pl slow.folded > slow.svg, or open slow.folded in
+https://www.speedscope.app.
+"""
+import argparse, collections, sys
+import requests
+
+SERVICES = {"movie": "http://127.0.0.1:3200", "user": "http://127.0.0.1:3201",
+            "schedule": "http://127.0.0.1:3202", "booking": "http://127.0.0.1:3203"}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("admin", help="id of an admin user")
+    parser.add_argument("-o", "--output", default="slow.folded")
+    parser.add_argument("--url", action="append", help="base URL of a service (default: the four local services)")
+    args = parser.parse_args()
+    stacks = collections.Counter()
+    for url in args.url or SERVICES.values():
+        try:
+            r = requests.get("%s/%s/profiling/slow" % (url.rstrip("/"), args.admin), timeout=10)
+        except requests.exceptions.RequestException as e:
+            print("%s: unreachable (%s)" % (url, e), file=sys.stderr)
+            continue
+        if r.status_code != 200:
+            print("%s: %d %s" % (url, r.status_code, r.text.strip()), file=sys.stderr)
+            continue
+        for line in r.text.splitlines():
+            stack, _, count = line.rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    with open(args.output, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write("%s %d\n" % (stack, count))
+    print("%d stacks, %d samples -> %s" % (len(stacks), sum(stacks.values()), args.output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Synthetic dataset generator for the four services.
+
+Writes consistent users.json, movies.json, times.json and bookings.json in
+<output>/<service>/databases/, the layout of the repository:
+
+- every scheduled movie exists in movies.json;
+- every booking is on a scheduled date, for a movie scheduled that date,
+  by an existing user;
+- movie popularity is skewed (Zipf): popular movies are scheduled on many
+  more dates, hence booked more often;
+- bookings per user are skewed too: a few heavy bookers, a long tail of
+  users with one booking or none.
+
+-n is the number of bookings (1000 to 10 000 000); users, movies and dates
+scale from it unless given. Files are written record by record, so memory
+stays bounded by the movies and the schedule, not by the bookings.
+
+Usage:
+    python tools/gen_dataset.py -n 100000 [-o dataset] [--users U] [--movies M] [--dates D]
+                                [--seed 42] [--movie-skew 1.1] [--user-skew 0.6]
+                                [--keep-shipped]
+
+--keep-shipped also keeps the records shipped in the repository (the
+Insomnia collection refers to them). Use the result by copying
+<output>/<service>/databases/ over a service's databases/ (and removing
+its *.snap and *.db files).
+"""
+import argparse, bisect, datetime, itertools, json, os, random, sys, uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILES = {"user": ("users.json", "users"), "movie": ("movies.json", "movies"),
+         "schedule": ("times.json", "schedule"), "booking": ("bookings.json", "bookings")}
+FIRST_DATE = datetime.date(2020, 1, 1) # après les dates livrées, pas de collision
+MOVIES_PER_DATE = (5, 20)
+
+def zipf_cumulative(n, skew):
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+
+def shipped(service):
+    name, key = FILES[service]
+    with open(os.path.join(ROOT, service, "databases", name)) as f:
+        return json.load(f)[key]
+
+class ArrayWriter:
+    """
+    Streams {"<key>": [record, record, ...]} to a file, one record per line.
+
+    Args:
+        path (str): Path of the JSON file.
+        key (str): Top-level key of the array.
+    """
+    def __init__(self, path, key):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.f = open(path, "w")
+        self.f.write('{"%s": [\n' % key)
+        self.count = 0
+
+    def write(self, record):
+        if self.count:
+            self.f.write(",\n")
+        self.f.write(json.dumps(record))
+        self.count += 1
+
+    def close(self):
+        self.f.write("\n]}\n")
+        self.f.close()
+
+def writer(output, service):
+    name, key = FILES[service]
+    return ArrayWriter(os.path.join(output, service, "databases", name), key)
+
+def generate(output, bookings, users=None, movies=None, dates=None, seed=42, movie_skew=1.1, user_skew=0.6,
+             keep_shipped=False):
+    """
+    Generate a consistent dataset for the four services.
+
+    Args:
+        output (str): Directory receiving <service>/databases/<file>.json.
+        bookings (int): Number of bookings to generate.
+        users (int): Number of users (default bookings // 3).
+        movies (int): Number of movies (default bookings // 20).
+        dates (int): Number of schedule dates (default bookings // 50, at most 2 000 000).
+        seed (int): Seed of the random generator (same seed, same dataset).
+        movie_skew (float): Zipf exponent of movie popularity.
+        user_skew (float): Zipf exponent of bookings per user.
+        keep_shipped (bool): Also keep the records shipped in the repository.
+
+    Returns:
+        dict: Number of records written per kind (bookings: generated bookings, duplicates dropped).
+    """
+    rng = random.Random(seed)
+    users = max(1, users or bookings // 3)
+    movies = max(MOVIES_PER_DATE[1], movies or bookings // 20)
+    dates = max(1, min(2000000, dates or bookings // 50))
+
+    # films : identifiants uuid reproductibles, le rang donne la popularité
+    movie_ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(movies)]
+    out = writer(output, "movie")
+    for record in shipped("movie") if keep_shipped else []:
+        out.write(record)
+    for i, movie_id in enumerate(movie_ids):
+        out.write({"title": "Movie %d" % i, "rating": round(rng.triangular(1, 10, 7), 1),
+                   "director": "Director %d" % rng.randrange(max(1, movies // 4)), "id": movie_id})
+    out.close()
+    counts = {"movies": out.count}
+
+    out = writer(output, "user")
+    for record in shipped("user") if keep_shipped else []:
+        out.write(record)
+    for i in range(users):
+        out.write({"id": "user_%d" % i, "name": "User %d" % i,
+                   "last_active": 1600000000 + rng.randrange(100000000), "is_admin": i % 100 == 0})
+    out.close()
+    counts["users"] = out.count
+
+    # programme : chaque date tire ses films selon la popularité (sans doublon dans la date)
+    movie_weights = zipf_cumulative(movies, movie_skew)
+    schedule = []
+    out = writer(output, "schedule")
+    for record in shipped("schedule") if keep_shipped else []:
+        out.write(record)
+    for d in range(dates):
+        date = (FIRST_DATE + datetime.timedelta(days=d)).strftime("%Y%m%d")
+        wanted = rng.randint(*MOVIES_PER_DATE)
+        chosen = []
+        while len(chosen) < wanted:
+            movie_id = movie_ids[bisect.bisect_left(movie_weights, rng.random() * movie_weights[-1])]
+            if movie_id not in chosen:
+                chosen.append(movie_id)
+        schedule.append((date, chosen))
+        out.write({"date": date, "movies": chosen})
+    out.close()
+    counts["schedule"] = out.count
+
+    # réservations : part de chaque utilisateur selon une loi de Zipf (gros réserveurs en tête),
+    # le reste de la division est distribué un par un dans l'ordre
+    user_weights = zipf_cumulative(users, user_skew)
+    total_weight = user_weights[-1]
+    shares = [int(bookings * (user_weights[i] - (user_weights[i - 1] if i else 0)) / total_weight)
+              for i in range(users)]
+    for i in range(bookings - sum(shares)):
+        shares[i % users] += 1
+    out = writer(output, "booking")
+    for record in shipped("booking") if keep_shipped else []:
+        out.write(record)
+    written = 0
+    for i, share in enumerate(shares):
+        if not share:
+            continue
+        by_date = {}
+        for _ in range(share):
+            date, movies_of_date = schedule[rng.randrange(dates)]
+            booked = by_date.setdefault(date, [])
+            movie_id = rng.choice(movies_of_date)
+            if movie_id not in booked:
+                booked.append(movie_id)
+                written += 1
+        out.write({"userid": "user_%d" % i,
+                   "dates": [{"date": date, "movies": booked} for date, booked in sorted(by_date.items())]})
+    out.close()
+    counts["bookings"] = written
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--bookings", type=int, default=10000)
+    parser.add_argument("-o", "--output", default="dataset")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--movies", type=int)
+    parser.add_argument("--dates", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--movie-skew", type=float, default=1.1)
+    parser.add_argument("--user-skew", type=float, default=0.6)
+    parser.add_argument("--keep-shipped", action="store_true")
+    args = parser.parse_args()
+    counts = generate(args.output, args.bookings, args.users, args.movies, args.dates,
+                      args.seed, args.movie_skew, args.user_skew, args.keep_shipped)
+    print(" ".join("%s=%d" % item for item in counts.items()), "->", args.output)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Load test: replays the Insomnia collection against the four services.
+
+Copies user/, movie/, schedule/ and booking/ to a throw-away directory,
+replaces their databases with a dataset from gen_dataset.py (-n bookings,
+the shipped records are kept, the collection refers to them), starts the services on their configured
+ports and waits for /ready. Every request of Insomnia.yaml becomes an entry
+of the workload mix, reads weighing more than writes. C client threads
+then draw requests from the mix for D seconds.
+
+Reports, per Insomnia request: throughput, transport errors, response
+statuses and p50/p95/p99 latency. Statuses are only counted: the services
+answer some expected failures with a 500, as the collection documents. Results are saved as JSON; --compare prints the change
+against a previous run.
+
+Usage:
+    python tools/loadtest.py [-c 8] [-d 30] [-n 10000] [--write-weight 1]
+                             [-o loadtest.json] [--compare previous.json]
+
+Requires PyYAML (in requirements.txt). The services' own environment
+variables (MOVIE_STORAGE, BOOKING_WORKERS...) are passed through.
+"""
+import argparse, json, os, random, re, shutil, signal, subprocess, sys, tempfile, threading, time
+import requests
+from gen_dataset import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = {"user": 3201, "movie": 3200, "schedule": 3202, "booking": 3203}
+READ_WEIGHT = 10
+
+def start_services(directory):
+    processes = []
+    for service in SERVICES:
+        cwd = os.path.join(directory, service)
+        for name in os.listdir(os.path.join(cwd, "databases")):
+            if not name.endswith(".json"):
+                os.remove(os.path.join(cwd, "databases", name))
+        log = open(os.path.join(directory, service + ".log"), "w")
+        # nouvelle session : le reloader de user.py (debug=True) est arrêté avec son parent
+        processes.append(subprocess.Popen([sys.executable, service + ".py"], cwd=cwd, stdout=log,
+                                          stderr=subprocess.STDOUT, start_new_session=True))
+    deadline = time.time() + 60
+    for service, port in SERVICES.items():
+        while True:
+            try:
+                if requests.get("http://127.0.0.1:%d/ready" % port, timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.RequestException:
+                pass
+            if time.time() > deadline:
+                stop_services(processes)
+                sys.exit("%s service did not become ready, see %s" % (service, os.path.join(directory, service + ".log")))
+            time.sleep(0.2)
+    return processes
+
+def stop_services(processes):
+    for p in processes:
+        try:
+            os.killpg(p.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for p in processes:
+        p.wait()
+
+def load_mix(path, write_weight):
+    """
+    Turn the requests of an Insomnia collection into a weighted workload mix.
+
+    Args:
+        path (str): Path of the Insomnia YAML export.
+        write_weight (int): Weight of non-GET requests (GET requests weigh READ_WEIGHT).
+
+    Returns:
+        list of dict: Requests (name, method, url, params, headers, body, weight).
+    """
+    import yaml
+    with open(path) as f:
+        collection = yaml.safe_load(f)
+    env = (collection.get("environments") or {}).get("data") or {}
+    mix = []
+
+    def walk(items):
+        for item in items:
+            if "children" in item:
+                walk(item["children"])
+                continue
+            url = re.sub(r"\{\{\s*_\.(\w+)\s*\}\}", lambda m: env[m.group(1)], item["url"])
+            headers = {h["name"]: h["value"] for h in item.get("headers") or [] if h.get("name")}
+            params = [(p["name"], p["value"]) for p in item.get("parameters") or []
+                      if p.get("name") and not p.get("disabled")]
+            body = (item.get("body") or {}).get("text")
+            method = item.get("method", "GET")
+            mix.append({"name": item["name"], "method": method, "url": url, "params": params,
+                        "headers": headers, "body": body.encode() if body else None,
+                        "weight": READ_WEIGHT if method == "GET" else write_weight})
+
+    walk(collection["collection"])
+    return [r for r in mix if r["weight"] > 0]
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def run(mix, concurrency, duration):
+    """
+    Drive the mix with concurrent client threads.
+
+    Returns:
+        dict: Per request name, the latencies (seconds), the count of each
+        status and the count of transport errors.
+    """
+    samples = {r["name"]: {"latencies": [], "statuses": {}, "errors": 0} for r in mix}
+    weights = [r["weight"] for r in mix]
+    stop = time.perf_counter() + duration
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        local = {r["name"]: {"latencies": [], "statuses": {}, "errors": 0} for r in mix}
+        while time.perf_counter() < stop:
+            r = rng.choices(mix, weights)[0]
+            sample = local[r["name"]]
+            start = time.perf_counter()
+            try:
+                response = session.request(r["method"], r["url"], params=r["params"], headers=r["headers"],
+                                           data=r["body"], timeout=30)
+                status = str(response.status_code)
+                sample["statuses"][status] = sample["statuses"].get(status, 0) + 1
+            except requests.exceptions.RequestException:
+                sample["errors"] += 1
+            sample["latencies"].append(time.perf_counter() - start)
+        with lock:
+            for name, sample in local.items():
+                samples[name]["latencies"] += sample["latencies"]
+                samples[name]["errors"] += sample["errors"]
+                for status, count in sample["statuses"].items():
+                    samples[name]["statuses"][status] = samples[name]["statuses"].get(status, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+def summarize(samples, duration):
+    routes = {}
+    for name, s in sorted(samples.items()):
+        lat = s["latencies"]
+        if not lat:
+            continue
+        routes[name] = {"requests": len(lat), "rps": round(len(lat) / duration, 1), "errors": s["errors"],
+                        "statuses": dict(sorted(s["statuses"].items())), "p50_ms": round(percentile(lat, 50) * 1000, 2), "p95_ms": round(percentile(lat, 95) * 1000, 2),
+                        "p99_ms": round(percentile(lat, 99) * 1000, 2)}
+    every = [x for s in samples.values() for x in s["latencies"]]
+    total = {"requests": len(every), "rps": round(len(every) / duration, 1),
+             "errors": sum(s["errors"] for s in samples.values()),
+             "p50_ms": round((percentile(every, 50) or 0) * 1000, 2), "p95_ms": round((percentile(every, 95) or 0) * 1000, 2),
+             "p99_ms": round((percentile(every, 99) or 0) * 1000, 2)}
+    return routes, total
+
+def print_report(routes, total, previous=None):
+    header = "%-58s %8s %8s %6s %9s %9s %9s" % ("request", "count", "req/s", "errors", "p50 ms", "p95 ms", "p99 ms")
+    print(header + ("  %9s %9s" % ("Δ req/s", "Δ p95") if previous else ""))
+    for name, r in list(routes.items()) + [("TOTAL", total)]:
+        line = "%-58s %8d %8.1f %6d %9.2f %9.2f %9.2f" % (name[:58], r["requests"], r["rps"], r["errors"],
+                                                          r["p50_ms"], r["p95_ms"], r["p99_ms"])
+        before = previous and (previous["total"] if name == "TOTAL" else previous["routes"].get(name))
+        if before:
+            line += "  %+8.1f%% %+8.1f%%" % (100 * (r["rps"] / before["rps"] - 1) if before["rps"] else 0,
+                                             100 * (r["p95_ms"] / before["p95_ms"] - 1) if before["p95_ms"] else 0)
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-d", "--duration", type=float, default=30, help="seconds")
+    parser.add_argument("-n", "--records", type=int, default=10000, help="synthetic bookings (see gen_dataset.py)")
+    parser.add_argument("--write-weight", type=int, default=1, help="weight of non-GET requests, 0 for read-only")
+    parser.add_argument("--collection", default=os.path.join(ROOT, "Insomnia.yaml"))
+    parser.add_argument("-o", "--output", default="loadtest.json")
+    parser.add_argument("--compare", help="previous results to compare with")
+    args = parser.parse_args()
+
+    mix = load_mix(args.collection, args.write_weight)
+    directory = tempfile.mkdtemp(prefix="loadtest_")
+    for service in list(SERVICES) + ["common"]:
+        shutil.copytree(os.path.join(ROOT, service), os.path.join(directory, service))
+    generate(directory, args.records, keep_shipped=True)
+    processes = start_services(directory)
+    try:
+        samples = run(mix, args.concurrency, args.duration)
+    finally:
+        stop_services(processes)
+    routes, total = summarize(samples, args.duration)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(routes, total, previous)
+    result = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "concurrency": args.concurrency,
+              "duration": args.duration, "records": args.records, "write_weight": args.write_weight,
+              "routes": routes, "total": total}
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print("results saved to %s (services' logs in %s)" % (args.output, directory))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Offline rebalancer of the booking partitions (BOOKING_PARTITIONS).
+
+Reads the bookings of the current layout (bookings.json, or the
+bookings.<i>-of-<M>.json files of M partitions) and rewrites them into N
+partitions, each user going to partition crc32(userid) % N, the hash used
+by booking.py. Order is kept within each partition. Stop the Booking
+service first, then restart it with BOOKING_PARTITIONS=N.
+
+With --source sqlite, the bookings are read from the SQLite partitions
+(bookings.db or bookings.<i>-of-<M>.db); the new JSON partitions are then
+imported by "python booking.py migrate" (or by the first start with
+BOOKING_WORKERS > 1).
+
+Usage:
+    python tools/rebalance_bookings.py --partitions N [--from M] [--source json|sqlite]
+                                       [--directory booking/databases] [--remove-old]
+"""
+import argparse, glob, json, os, re, sqlite3, sys, zlib
+from gen_dataset import ArrayWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NAME = "bookings"
+
+def partition_of(userid, count):
+    return zlib.crc32(userid.encode()) % count
+
+def partition_path(path, index, count):
+    if count == 1:
+        return path
+    base, ext = os.path.splitext(path)
+    return "%s.%d-of-%d%s" % (base, index, count, ext)
+
+def current_layout(directory, ext):
+    counts = {int(m.group(1)) for m in (re.search(r"\.\d+-of-(\d+)\%s$" % ext, path)
+                                        for path in glob.glob(os.path.join(directory, NAME + ".*-of-*" + ext))) if m}
+    if len(counts) > 1:
+        sys.exit("several layouts in %s (%s partitions), choose one with --from" % (directory, sorted(counts)))
+    return counts.pop() if counts else 1
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)["bookings"]
+
+def read_sqlite(path):
+    # même regroupement que SqliteStore.all() de booking.py
+    bookings = []
+    b = d = None
+    query = """SELECT u.userid, d.date, b.movie FROM booking_users u
+               LEFT JOIN booking_dates d ON d.userid = u.userid
+               LEFT JOIN booking b ON b.userid = d.userid AND b.date = d.date
+               ORDER BY u.seq, d.seq, b.seq"""
+    conn = sqlite3.connect(path)
+    for userid, date, movie in conn.execute(query):
+        if b is None or b["userid"] != userid:
+            b = {"userid": userid, "dates": []}
+            bookings.append(b)
+            d = None
+        if date is not None and (d is None or d["date"] != date):
+            d = {"date": date, "movies": []}
+            b["dates"].append(d)
+        if movie is not None:
+            d["movies"].append(movie)
+    conn.close()
+    return bookings
+
+def derived_files(json_path):
+    base = os.path.splitext(json_path)[0]
+    return [base + ".snap", base + ".db", base + ".db-wal", base + ".db-shm"]
+
+def rebalance(directory, partitions, previous=None, source="json", remove_old=False):
+    """
+    Rewrite the bookings of one layout into another number of partitions.
+
+    Args:
+        directory (str): The booking service's databases/ directory.
+        partitions (int): Number of partitions wanted.
+        previous (int): Current number of partitions (default: detected from the files).
+        source (str): "json" or "sqlite", backend the current bookings are read from.
+        remove_old (bool): Remove the files of the previous layout.
+
+    Returns:
+        list of tuple: (path, users, bookings) of each written partition.
+    """
+    ext = ".db" if source == "sqlite" else ".json"
+    previous = previous or current_layout(directory, ext)
+    json_path = os.path.join(directory, NAME + ".json")
+    if previous == partitions:
+        return []
+    read = read_sqlite if source == "sqlite" else read_json
+    writers = [ArrayWriter(partition_path(json_path, i, partitions) + ".tmp", NAME) for i in range(partitions)]
+    booked = [0] * partitions
+    # une partition de l'ancien agencement en mémoire à la fois
+    for i in range(previous):
+        for b in read(partition_path(os.path.join(directory, NAME + ext), i, previous)):
+            index = partition_of(b["userid"], partitions)
+            writers[index].write(b)
+            booked[index] += sum(len(d["movies"]) for d in b["dates"])
+    written = []
+    for i, w in enumerate(writers):
+        w.close()
+        path = partition_path(json_path, i, partitions)
+        os.replace(path + ".tmp", path)
+        # snapshot et base SQLite de cette partition : dérivés d'un ancien contenu, à reconstruire
+        for derived in derived_files(path):
+            if os.path.exists(derived):
+                os.remove(derived)
+        written.append((path, w.count, booked[i]))
+    if remove_old:
+        for i in range(previous):
+            old = partition_path(json_path, i, previous)
+            for path in [old] + derived_files(old):
+                if os.path.exists(path):
+                    os.remove(path)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-p", "--partitions", type=int, required=True, help="number of partitions wanted")
+    parser.add_argument("--from", dest="previous", type=int, help="current number of partitions (default: detected)")
+    parser.add_argument("--source", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--directory", default=os.path.join(ROOT, "booking", "databases"))
+    parser.add_argument("--remove-old", action="store_true", help="remove the files of the previous layout")
+    args = parser.parse_args()
+    if args.partitions < 1:
+        parser.error("--partitions must be at least 1")
+    written = rebalance(args.directory, args.partitions, args.previous, args.source, args.remove_old)
+    if not written:
+        print("already %d partition(s), nothing to do" % args.partitions)
+        return 0
+    for path, users, bookings in written:
+        print("%-50s %8d users %10d bookings" % (os.path.relpath(path), users, bookings))
+    print("start the service with BOOKING_PARTITIONS=%d" % args.partitions)
+    if args.source == "sqlite":
+        print("then import the partitions: cd booking && BOOKING_PARTITIONS=%d python booking.py migrate" % args.partitions)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Cross-service waterfall of one request, rebuilt from the span logs.
+
+With <SERVICE>_SPAN_LOG=./spans.log (tracing is off by default), each
+service appends its spans to its own spans.log (one JSON object per line:
+trace, service, span, id, parent, start, duration). The spans of one
+X-Request-ID are linked through their parent ids: an outbound call is the
+parent of the handler span of the service it called.
+
+Usage:
+    python tools/waterfall.py <request_id> [span logs...]
+    python tools/waterfall.py --slowest [span logs...]
+
+Without span logs, reads */spans.log of the repository.
+"""
+import glob, json, os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WIDTH = 50
+
+def read_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    return spans
+
+def slowest_trace(spans):
+    roots = [s for s in spans if s["parent"] is None]
+    return max(roots, key=lambda s: s["duration"])["trace"] if roots else None
+
+def render(spans):
+    """
+    Render the spans of one trace as an indented waterfall.
+
+    Args:
+        spans (list of dict): Spans of a single trace.
+
+    Returns:
+        list of str: Lines of the waterfall.
+    """
+    ids = {s["id"] for s in spans}
+    children = {}
+    for s in spans:
+        # parent absent des journaux lus (service non fourni) : le span devient une racine
+        parent = s["parent"] if s["parent"] in ids else None
+        children.setdefault(parent, []).append(s)
+    for siblings in children.values():
+        siblings.sort(key=lambda s: s["start"])
+    origin = min(s["start"] for s in spans)
+    total = max(s["start"] + s["duration"] for s in spans) - origin or 1e-9
+    lines = []
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            offset = s["start"] - origin
+            left = int(offset / total * WIDTH)
+            bar = max(1, int(round(s["duration"] / total * WIDTH)))
+            extra = " ".join("%s=%s" % (k, s[k]) for k in ("status", "backend") if k in s)
+            label = "%s%-9s %s" % ("  " * depth, s["service"], s["span"])
+            lines.append("%-60s %8.1fms %8.1fms |%s%s%s| %s" % (
+                label[:60], offset * 1000, s["duration"] * 1000,
+                " " * left, "#" * bar, " " * max(0, WIDTH - left - bar), extra))
+            walk(s["id"], depth + 1)
+
+    walk(None, 0)
+    return lines
+
+def main(args):
+    if not args:
+        print(__doc__.strip())
+        return 1
+    target, paths = args[0], args[1:] or sorted(glob.glob(os.path.join(ROOT, "*", "spans.log")))
+    spans = read_spans(paths)
+    if target == "--slowest":
+        target = slowest_trace(spans)
+    trace = [s for s in spans if s["trace"] == target]
+    if not trace:
+        print("no span for request %s" % target)
+        return 1
+    print("request %s: %d spans" % (target, len(trace)))
+    print("%-60s %10s %10s" % ("span", "start", "duration"))
+    for line in render(trace):
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
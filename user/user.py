@@ -1,8 +1,20 @@
-from flask import Flask, render_template, request, jsonify, make_response
-import json, time
+from flask import Flask, render_template, request, jsonify, make_response, g
+import json, time, codecs, os, sys, sqlite3, threading, bisect, atexit
 import requests
+from contextlib import contextmanager
 from flask_cors import CORS
 
+# module commun aux services (common/), à côté des dossiers des services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import common
+from common import profiling
+from common.metrics import METRICS, Counter, ADMIN_CACHE_TOTAL, STORE_WRITE_SECONDS
+from common.tracing import span
+from common.fragments import encode, json_response, join_fragments, FragmentCache, ChangeLog
+from common.snapshot import write_snapshot, read_snapshot
+from common.client import ServiceClient, breaker_metrics
+from common.server import serve_prefork
+
 app = Flask(__name__)
 
 CORS(app)
@@ -11,7 +23,6 @@ PORT = 3201
 HOST = '0.0.0.0'
 
 BOOKING_URL = "http://localhost:3203" # service Booking
-USER_URL  = "http://localhost:3201" # microservice User
 
 CACHE_TTL = 60 # secondes de validité du cache pour is_admin
 
@@ -19,14 +30,548 @@ CACHE_TTL = 60 # secondes de validité du cache pour is_admin
 # format : { "user_id": {"is_admin": True/False, "timestamp": 123456789} }
 user_admin_cache = {}
 
-# charge le fichier JSON contenant les utilisateurs
-with open('./databases/users.json', "r") as jsf:
-    users = json.load(jsf)["users"]
+# infrastructure commune (common/) : métriques, traçage, profilage, contrôle d'admission,
+# compression des réponses et délais de bout en bout
+common.install(app, "user", rate_limits={"get_users_from_booking": (5, 10)}, deadlines={"get_users_from_booking": 10})
+
+WORKERS = int(os.environ.get("USER_WORKERS", 1)) # > 1 : mode production multi-process (état partagé en SQLite)
+# backend de stockage : "json" (défaut, dev) ou "sqlite" (WAL, indexé, seul accepté avec plusieurs workers)
+STORAGE = os.environ.get("USER_STORAGE", "sqlite" if WORKERS > 1 else "json")
+JSON_PATH = './databases/users.json'
+CHANGES_KEPT = 10000 # mutations gardées dans le journal partagé entre workers
+CHANGES_PRUNE_EVERY = 1000
+SQLITE_PATH = os.environ.get("USER_SQLITE_PATH", './databases/users.db')
+
+# taille du journal en mémoire des dernières mutations, servi par /<user_id>/users/changes?since=N
+CHANGELOG_SIZE = int(os.environ.get("USER_CHANGELOG_SIZE", 10000))
+
+# format des snapshots binaires (common.snapshot) écrits à côté du fichier JSON
+SNAPSHOT_MAGIC = b"SNAP"
+
+class JsonStore:
+    """
+    Users kept in memory and dumped to users.json on every mutation.
+
+    Args:
+        path (str): Path of the JSON file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.snapshot_path = os.path.splitext(path)[0] + ".snap"
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock() # une mutation (et sa réécriture du fichier) à la fois
+        self.loaded = threading.Event()
+        self._users = None
+        self._index = None
+        self._active = None
+        self.fragments = FragmentCache()
+        self.version = 0 # incrémenté à chaque mutation
+        self.activity_version = 0 # incrémenté à chaque écriture d'activités, hors journal des changements
+        self.changes = ChangeLog(os.urandom(8).hex(), 0, CHANGELOG_SIZE) # nouvelle époque à chaque démarrage
+        self.listeners = [] # callbacks(key) appelés à chaque mutation (invalidation des caches)
+
+    def load(self):
+        """
+        Load the users (from the binary snapshot if up to date, from JSON otherwise).
+
+        Returns:
+            list: The users.
+        """
+        with self.lock:
+            if self._users is None:
+                data = read_snapshot(self.snapshot_path, self.path, SNAPSHOT_MAGIC)
+                if data is None:
+                    # charge le fichier JSON contenant les utilisateurs
+                    with open(self.path, "r") as jsf:
+                        data = json.load(jsf)["users"]
+                    write_snapshot(self.snapshot_path, self.path, data, SNAPSHOT_MAGIC)
+                self._users = data
+                self.loaded.set()
+        return self._users
+
+    @property
+    def users(self):
+        return self._users if self._users is not None else self.load()
+
+    @property
+    def index(self):
+        # index construit paresseusement au premier accès, puis maintenu à chaque mutation
+        if self._index is None:
+            self._index = {str(user["id"]): user for user in self.users}
+        return self._index
+
+    @property
+    def active(self):
+        # index temporel : liste triée de (last_active, userid), du plus ancien au plus récent
+        if self._active is None:
+            self._active = sorted((u["last_active"], str(u["id"])) for u in self.users
+                                  if isinstance(u.get("last_active"), (int, float)))
+        return self._active
+
+    # déplace un utilisateur dans l'index temporel : retrait de son ancienne position, insertion à sa place
+    def note_active(self, user_id, old, timestamp):
+        if self._active is None:
+            return
+        if isinstance(old, (int, float)):
+            i = bisect.bisect_left(self._active, (old, user_id))
+            if i < len(self._active) and self._active[i] == (old, user_id):
+                del self._active[i]
+        if isinstance(timestamp, (int, float)):
+            bisect.insort(self._active, (timestamp, user_id))
+
+    # marque un enregistrement comme modifié : nouvelle version des données, fragment invalidé
+    def touch(self, key):
+        self.version += 1
+        self.changes.append(self.version, key, self.record(key))
+        self.fragments.invalidate(key)
+        for listener in self.listeners:
+            listener(key)
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé)
+    def record(self, key):
+        return self.get(key)
+
+    # un seul processus : rien à rattraper
+    def sync(self):
+        pass
+
+    # sauvegarde les utilisateurs dans le fichier
+    def write(self):
+        with span("store.write", backend="json"):
+            start = time.perf_counter()
+            with open(self.path, 'w') as f:
+                json.dump({"users": self.users}, f)
+            write_snapshot(self.snapshot_path, self.path, self.users, SNAPSHOT_MAGIC)
+            STORE_WRITE_SECONDS.observe(("json",), time.perf_counter() - start)
+
+    def all(self):
+        return self.users
+
+    # tailles du jeu de données pour /metrics ; vide tant que le chargement n'est pas fait
+    def sizes(self):
+        if self._users is None:
+            return {}
+        return {"users": len(self._users)}
+
+    def get(self, user_id):
+        return self.index.get(str(user_id))
+
+    def encoded_all(self):
+        return join_fragments([self.fragments.get(str(u["id"]), u) for u in self.users])
+
+    def encoded(self, user):
+        return self.fragments.get(str(user["id"]), user)
+
+    def find_by_name(self, name):
+        return next((u for u in reversed(self.users) if str(u["name"]) == str(name)), None)
+
+    def add(self, user):
+        with self.write_lock:
+            self.users.append(user)
+            self.index[str(user["id"])] = user
+            self.note_active(str(user["id"]), None, user.get("last_active"))
+            self.touch(str(user["id"]))
+            self.write()
+
+    def update_name(self, user_id, name):
+        with self.write_lock:
+            user = self.index.get(str(user_id))
+            if user is not None:
+                user["name"] = name
+                self.touch(str(user_id))
+                self.write()
+            return user
+
+    def delete(self, user_id):
+        with self.write_lock:
+            user = self.index.pop(str(user_id), None)
+            if user is not None:
+                self.users.remove(user)
+                self.note_active(str(user_id), user.get("last_active"), None)
+                self.touch(str(user_id))
+                self.write()
+            return user
+
+    def set_last_active(self, timestamps):
+        """
+        Store a batch of activity timestamps, with a single rewrite of the file.
+
+        Args:
+            timestamps (dict): user id -> last activity (epoch seconds); unknown ids are ignored.
+
+        Returns:
+            int: Number of users updated.
+        """
+        with self.write_lock:
+            updated = 0
+            for user_id, timestamp in timestamps.items():
+                user = self.index.get(user_id)
+                if user is None:
+                    continue
+                self.note_active(user_id, user.get("last_active"), timestamp)
+                user["last_active"] = timestamp
+                # activité, pas une mutation : hors journal des changements, seul le fragment est invalidé
+                self.fragments.invalidate(user_id)
+                updated += 1
+            if updated:
+                self.activity_version += 1
+                self.write()
+            return updated
+
+    def active_since(self, since):
+        """
+        Returns:
+            list of tuple: (user id, last_active) of the users active since that time, most recent first.
+        """
+        with self.write_lock:
+            first = bisect.bisect_left(self.active, (since,))
+            return [(user_id, timestamp) for timestamp, user_id in reversed(self.active[first:])]
+
+class SqliteStore:
+    """
+    Users stored in SQLite (WAL mode), one connection per thread.
+
+    Each route uses one of the SQL constants below; sqlite3 keeps them
+    compiled in its per-connection statement cache.
 
-# sauvegarde les utilisateurs dans le fichier
-def write(users):
-    with open('./databases/users.json', 'w') as f:
-        json.dump({"users": users}, f)
+    Args:
+        path (str): Path of the SQLite database file.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            seq  INTEGER PRIMARY KEY AUTOINCREMENT,
+            id   TEXT NOT NULL UNIQUE,
+            name TEXT,
+            doc  TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS users_name ON users(name);
+        CREATE INDEX IF NOT EXISTS users_last_active ON users(json_extract(doc, '$.last_active'));
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS activity (
+            id      INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO activity (id, version) VALUES (1, 0);
+    """
+    SQL_ALL = "SELECT doc FROM users ORDER BY seq"
+    SQL_GET = "SELECT doc FROM users WHERE id = ?"
+    SQL_BY_NAME = "SELECT doc FROM users WHERE name = ? ORDER BY seq DESC LIMIT 1"
+    SQL_INSERT = "INSERT OR IGNORE INTO users (id, name, doc) VALUES (?, ?, ?)"
+    SQL_UPDATE = "UPDATE users SET name = ?, doc = ? WHERE id = ?"
+    SQL_DELETE = "DELETE FROM users WHERE id = ?"
+    SQL_SET_DOC = "UPDATE users SET doc = ? WHERE id = ?"
+    SQL_ACTIVE_SINCE = """SELECT id, json_extract(doc, '$.last_active') FROM users
+                          WHERE json_extract(doc, '$.last_active') >= ?
+                          ORDER BY json_extract(doc, '$.last_active') DESC"""
+    SQL_TOUCH = "INSERT INTO changes (key) VALUES (?)"
+    SQL_CHANGES_SINCE = "SELECT seq, key FROM changes WHERE seq > ? ORDER BY seq"
+    SQL_LAST_CHANGE = "SELECT MAX(seq) FROM changes"
+    SQL_PRUNE_CHANGES = "DELETE FROM changes WHERE seq <= ?"
+    SQL_COUNT = "SELECT COUNT(*) FROM users"
+    # compteur partagé des écritures d'activités, pour les caches des réponses de tous les workers
+    SQL_ACTIVITY_VERSION = "SELECT version FROM activity"
+    SQL_BUMP_ACTIVITY = "UPDATE activity SET version = version + 1"
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.sync_lock = threading.Lock()
+        self.conn().executescript(self.SCHEMA)
+        # après un fork, chaque worker ouvre ses propres connexions
+        os.register_at_fork(after_in_child=self.reset_connections)
+        self.loaded = threading.Event()
+        self.loaded.set()
+        # version = numéro de la dernière mutation du journal partagé déjà prise en compte
+        self.version = self.conn().execute(self.SQL_LAST_CHANGE).fetchone()[0] or 0
+        # la table changes est partagée et ses numéros ne reviennent jamais en arrière : époque fixe
+        self.changes = ChangeLog("sqlite", self.version, CHANGELOG_SIZE)
+        self.listeners = [] # callbacks(key) appelés à chaque mutation, key None = tout invalider
+
+    def load(self):
+        # rien à précharger : les requêtes passent directement par les index SQLite
+        pass
+
+    # marque un enregistrement comme modifié dans le journal partagé par tous les workers
+    def touch(self, key):
+        with self.conn() as conn:
+            seq = conn.execute(self.SQL_TOUCH, (key,)).lastrowid
+            if seq % CHANGES_PRUNE_EVERY == 0:
+                conn.execute(self.SQL_PRUNE_CHANGES, (seq - CHANGES_KEPT,))
+        self.sync()
+
+    def sync(self):
+        """
+        Catch up with the mutations recorded by every worker (this one included).
+
+        Invalidates the local caches for each changed key; if this worker fell
+        behind the pruned part of the journal, everything is invalidated.
+        """
+        # un seul rattrapage à la fois : deux threads appliqueraient les mêmes mutations deux fois
+        with self.sync_lock:
+            rows = self.conn().execute(self.SQL_CHANGES_SINCE, (self.version,)).fetchall()
+            if not rows:
+                return
+            if rows[0][0] != self.version + 1:
+                self.changes.reset(rows[0][0] - 1)
+                for listener in self.listeners:
+                    listener(None)
+            for seq, key in rows:
+                for listener in self.listeners:
+                    listener(key)
+                self.changes.append(seq, key, self.record(key))
+            self.version = rows[-1][0]
+
+    # valeur courante d'un enregistrement pour le flux de changements (None : supprimé)
+    def record(self, key):
+        return self.get(key)
+
+    # transaction d'écriture chronométrée pour store_write_duration_seconds
+    @contextmanager
+    def transaction(self):
+        with span("store.write", backend="sqlite"):
+            start = time.perf_counter()
+            try:
+                with self.conn() as conn:
+                    yield conn
+            finally:
+                STORE_WRITE_SECONDS.observe(("sqlite",), time.perf_counter() - start)
+
+    def reset_connections(self):
+        self.local = threading.local()
+
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def all(self):
+        return [json.loads(doc) for (doc,) in self.conn().execute(self.SQL_ALL)]
+
+    def sizes(self):
+        return {"users": self.conn().execute(self.SQL_COUNT).fetchone()[0]}
+
+    def get(self, user_id):
+        row = self.conn().execute(self.SQL_GET, (str(user_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # la colonne doc est déjà l'encodage canonique de l'utilisateur : c'est le fragment
+    def encoded_all(self):
+        return join_fragments([doc.encode() for (doc,) in self.conn().execute(self.SQL_ALL)])
+
+    def encoded(self, user):
+        return encode(user)
+
+    def find_by_name(self, name):
+        row = self.conn().execute(self.SQL_BY_NAME, (str(name),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, user):
+        with self.transaction() as conn:
+            conn.execute(self.SQL_INSERT, (str(user["id"]), user.get("name"), encode(user).decode()))
+        self.touch(str(user["id"]))
+
+    def update_name(self, user_id, name):
+        with self.transaction() as conn:
+            row = conn.execute(self.SQL_GET, (str(user_id),)).fetchone()
+            if row is None:
+                return None
+            user = json.loads(row[0])
+            user["name"] = name
+            conn.execute(self.SQL_UPDATE, (name, encode(user).decode(), str(user_id)))
+        self.touch(str(user_id))
+        return user
+
+    def delete(self, user_id):
+        with self.transaction() as conn:
+            row = conn.execute(self.SQL_GET, (str(user_id),)).fetchone()
+            if row is None:
+                return None
+            conn.execute(self.SQL_DELETE, (str(user_id),))
+        self.touch(str(user_id))
+        return json.loads(row[0])
+
+    def set_last_active(self, timestamps):
+        """
+        Store a batch of activity timestamps in one transaction.
+
+        Args:
+            timestamps (dict): user id -> last activity (epoch seconds); unknown ids are ignored.
+
+        Returns:
+            int: Number of users updated.
+        """
+        updated = 0
+        with self.transaction() as conn:
+            for user_id, timestamp in timestamps.items():
+                row = conn.execute(self.SQL_GET, (user_id,)).fetchone()
+                if row is None:
+                    continue
+                user = json.loads(row[0])
+                user["last_active"] = timestamp
+                conn.execute(self.SQL_SET_DOC, (encode(user).decode(), user_id))
+                updated += 1
+            if updated:
+                conn.execute(self.SQL_BUMP_ACTIVITY)
+        # activité, pas une mutation : rien dans le journal des changements partagé
+        return updated
+
+    @property
+    def activity_version(self):
+        return self.conn().execute(self.SQL_ACTIVITY_VERSION).fetchone()[0]
+
+    # index SQL sur last_active : parcours du plus récent au plus ancien, sans scan de la table
+    def active_since(self, since):
+        return self.conn().execute(self.SQL_ACTIVE_SINCE, (since,)).fetchall()
+
+    def migrate(self, json_path):
+        """
+        One-shot import of an existing users.json (already present ids are skipped).
+
+        Args:
+            json_path (str): Path of the JSON file to import.
+
+        Returns:
+            int: Number of users read from the file.
+        """
+        with open(json_path, "r") as jsf:
+            users = json.load(jsf)["users"]
+        with self.conn() as conn:
+            conn.executemany(self.SQL_INSERT, [(str(u["id"]), u.get("name"), encode(u).decode()) for u in users])
+        return len(users)
+
+def open_store():
+    # plusieurs workers : l'état doit être partagé -> SQLite, migré depuis le JSON au premier lancement
+    if WORKERS > 1:
+        if STORAGE != "sqlite":
+            # chaque worker forké réécrirait sa propre copie du JSON : le dernier écrivain gagne
+            sys.exit("USER_WORKERS > 1 requires USER_STORAGE=sqlite")
+        fresh = not os.path.exists(SQLITE_PATH)
+        sqlite_store = SqliteStore(SQLITE_PATH)
+        if fresh:
+            sqlite_store.migrate(JSON_PATH)
+        return sqlite_store
+    if STORAGE == "sqlite":
+        return SqliteStore(SQLITE_PATH)
+    return JsonStore(JSON_PATH)
+
+store = open_store()
+
+# chargement des données en arrière-plan : le port s'ouvre tout de suite, /ready passe à 200 une fois chargé
+threading.Thread(target=store.load, daemon=True).start()
+
+# toute mutation d'un utilisateur (dans ce worker ou un autre) invalide son statut admin en cache
+def forget_admin(key):
+    if key is None:
+        user_admin_cache.clear()
+    else:
+        user_admin_cache.pop(key, None)
+
+store.listeners.append(forget_admin)
+
+# activité des utilisateurs : horodatages gardés en mémoire, écrits par lots (jamais une réécriture par requête)
+ACTIVITY_FLUSH_SECONDS = float(os.environ.get("USER_ACTIVITY_FLUSH_SECONDS", 30))
+ACTIVITY_FLUSH_DIRTY = int(os.environ.get("USER_ACTIVITY_FLUSH_DIRTY", 1000)) # utilisateurs en attente avant écriture anticipée
+ACTIVITY_FLUSH_TOTAL = Counter("user_activity_flush_total", "Batched writes of last_active, per outcome.", ("outcome",))
+
+class ActivityTracker:
+    """
+    Write-coalesced last_active tracking.
+
+    record() only updates a dict in memory; a background thread flushes the
+    pending timestamps to the store in one batch every ACTIVITY_FLUSH_SECONDS,
+    or as soon as ACTIVITY_FLUSH_DIRTY users are pending. A user active many
+    times between two flushes costs one write.
+
+    Args:
+        store (JsonStore or SqliteStore): Store the timestamps are written to.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.pending = {} # userid -> dernière activité pas encore écrite
+        self.wake = threading.Event()
+        self.start()
+        # après un fork, chaque worker a ses propres horodatages en attente et son thread d'écriture
+        os.register_at_fork(after_in_child=self.restart)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def restart(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.wake = threading.Event()
+        self.start()
+
+    def record(self, user_id):
+        with self.lock:
+            self.pending[str(user_id)] = int(time.time())
+            full = len(self.pending) >= ACTIVITY_FLUSH_DIRTY
+        if full:
+            self.wake.set()
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        try:
+            self.store.set_last_active(batch)
+        except (OSError, sqlite3.Error):
+            # écriture ratée : le lot revient en attente, sans écraser une activité plus récente
+            with self.lock:
+                for user_id, timestamp in batch.items():
+                    self.pending.setdefault(user_id, timestamp)
+            ACTIVITY_FLUSH_TOTAL.inc(("error",))
+            return
+        ACTIVITY_FLUSH_TOTAL.inc(("ok",))
+
+    def run(self):
+        self.store.loaded.wait()
+        while True:
+            self.wake.wait(ACTIVITY_FLUSH_SECONDS)
+            self.wake.clear()
+            self.flush()
+
+    def active_since(self, since):
+        """
+        Users active since a time: flushed timestamps from the store's time index, plus the pending ones.
+
+        Returns:
+            list of tuple: (user id, last_active), most recent first.
+        """
+        with self.lock:
+            pending = [(user_id, t) for user_id, t in self.pending.items() if t >= since]
+        active = dict(self.store.active_since(since))
+        # un utilisateur supprimé depuis son activité n'est plus listé
+        active.update((user_id, t) for user_id, t in pending if self.store.get(user_id) is not None)
+        return sorted(active.items(), key=lambda item: item[1], reverse=True)
+
+activity = ActivityTracker(store)
+atexit.register(activity.flush)
+
+# en mode multi-process : rattrape les mutations des autres workers avant de servir la requête
+@app.before_request
+def sync_store():
+    store.sync()
+
+# réponses de liste complète : version et époque des données, point de départ du flux de changements
+@app.after_request
+def data_version_headers(response):
+    if "data_version" in g:
+        response.headers["X-Data-Version"] = str(g.data_version)
+        response.headers["X-Data-Epoch"] = store.changes.epoch
+    return response
+
+booking_client = ServiceClient("booking", BOOKING_URL)
+clients = [booking_client]
 
 # fonction utilitaire pour vérifier admin
 def verify_admin(user_id):
@@ -47,20 +592,55 @@ def verify_admin(user_id):
     if user_id in user_admin_cache:
         cached = user_admin_cache[user_id]
         if now - cached["timestamp"] < CACHE_TTL:
+            ADMIN_CACHE_TOTAL.inc(("hit",))
+            activity.record(user_id)
             return cached["is_admin"], None
+        ADMIN_CACHE_TOTAL.inc(("expired",))
+    else:
+        ADMIN_CACHE_TOTAL.inc(("miss",))
 
-    # sinon appelle le microservice User
-    try:
-        r = requests.get(f"{USER_URL}/users/{user_id}/is_admin")
-        if r.status_code == 200:
-            data = r.json()
-            is_admin = data.get("is_admin", False)
-            user_admin_cache[user_id] = {"is_admin": is_admin, "timestamp": now}
-            return is_admin, None
-        else:
-            return False, make_response(jsonify({"error": "Unable to verify user"}), 401)
-    except requests.exceptions.RequestException:
-        return False, make_response(jsonify({"error": "User service unreachable"}), 503)
+    # on est dans le microservice User : lecture directe dans le store, pas d'appel HTTP en boucle
+    user = store.get(user_id)
+    if user is None:
+        return False, make_response(jsonify({"error": "Unable to verify user"}), 401)
+
+    is_admin = user.get("is_admin", False)
+    user_admin_cache[user_id] = {"is_admin": is_admin, "timestamp": now}
+    activity.record(user_id)
+    return is_admin, None
+
+# parse un tableau JSON reçu en flux, élément par élément (mémoire constante)
+def iter_json_array(chunks):
+    """
+    Incrementally decode the elements of a JSON array received in chunks.
+
+    Args:
+        chunks (iterable of bytes): Raw body chunks (e.g. Response.iter_content()).
+
+    Yields:
+        object: Each decoded element of the top-level array, as soon as it is complete.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    started = False
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        pos = 0
+        while True:
+            # saute les blancs, le '[' d'ouverture et les séparateurs
+            while pos < len(buf) and (buf[pos] in " \t\r\n," or (buf[pos] == "[" and not started)):
+                started = started or buf[pos] == "["
+                pos += 1
+            if pos >= len(buf) or buf[pos] == "]":
+                break
+            try:
+                obj, pos_end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                break # élément incomplet : on attend le chunk suivant
+            pos = pos_end
+            yield obj
+        buf = buf[pos:]
 
 # vérifie si un utilisateur est admin à partir de son ID
 @app.route("/users/<user_id>/is_admin", methods=['GET'])
@@ -75,13 +655,14 @@ def is_admin(user_id):
         Response: JSON response with user's ID and admin status,
                   or error if the user is not found.
     """
-    for user in users:
-        if str(user["id"]) == str(user_id):
-            print("user trouvé dans microservice User")
-            return jsonify({
-                "id": user["id"],
-                "is_admin": user["is_admin"]
-            }), 200
+    user = store.get(user_id)
+    if user is not None:
+        # les autres services vérifient l'admin à chaque appel d'un utilisateur (cache CACHE_TTL) : c'est son activité
+        activity.record(user_id)
+        return jsonify({
+            "id": user["id"],
+            "is_admin": user["is_admin"]
+        }), 200
 
     return jsonify({"error": "User ID not found"}), 404
 
@@ -96,6 +677,43 @@ def home():
     """
     return "<h1 style='color:blue'>Welcome to the User service!</h1>"
 
+# sonde de disponibilité : 200 seulement une fois les données chargées et interrogeables
+@app.route("/ready", methods=['GET'])
+def ready():
+    """
+    Readiness probe for the User service.
+
+    Returns:
+        Response: 200 once the data is loaded and queryable, 503 while it is still loading.
+    """
+    if not store.loaded.is_set():
+        return make_response(jsonify({"ready": False}), 503)
+    return make_response(jsonify({"ready": True}), 200)
+
+
+# métriques au format texte Prometheus
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics of the service: request latencies per route, outbound
+    call latencies, user_admin_cache lookups, store write times, dataset sizes
+    and circuit breaker states (per worker in multi-process mode).
+
+    Returns:
+        Response: Metrics in Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += ["# HELP dataset_records Records currently held by the store.", "# TYPE dataset_records gauge"]
+    for kind, count in store.sizes().items():
+        lines.append('dataset_records{kind="%s"} %d' % (kind, count))
+    lines += breaker_metrics(clients)
+    return app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+# routes admin de profilage (common.profiling)
+profiling.install_routes(app, verify_admin)
+
 # retourne tous les utilisateurs en JSON brut
 @app.route("/<user_id>/users/json", methods=['GET'])
 def get_json(user_id):
@@ -117,7 +735,72 @@ def get_json(user_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    return jsonify(users)
+    g.data_version = store.version # réponse versionnée : compressée une seule fois par version
+    g.cache_generation = store.activity_version # les last_active écrits depuis périment aussi la réponse compressée
+    return json_response(store.encoded_all())
+
+# flux de changements : mutations depuis la version ?since=N, ou 410 s'il faut tout recharger
+@app.route("/<user_id>/users/changes", methods=['GET'])
+def get_users_changes(user_id):
+    """
+    Get the users changed since a version, from the in-memory change log.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Query Parameters:
+        since (int): Last version the caller has applied (X-Data-Version of the full list, then
+                     "version" of the previous answer).
+
+    Returns:
+        Response: JSON {"changes", "epoch", "version"} in version order, or 410
+                  "resync required" if the changes fell out of the log (reload
+                  the full list, then follow from its version).
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return make_response(jsonify({"error": "'since' must be a non-negative integer"}), 400)
+    version, changes = store.changes.since(int(since))
+    if changes is None:
+        return make_response(jsonify({"error": "resync required", "epoch": store.changes.epoch,
+                                      "version": version}), 410)
+    return json_response(b'{"changes":' + join_fragments(changes) + b',"epoch":' + encode(store.changes.epoch) +
+                         b',"version":' + str(version).encode() + b"}")
+
+# utilisateurs actifs dans les N dernières minutes, via l'index temporel (sans parcourir tous les utilisateurs)
+@app.route("/<user_id>/users/active", methods=['GET'])
+def get_active_users(user_id):
+    """
+    List the users active in the last N minutes, most recent first.
+
+    Args:
+        user_id (str): ID of the requesting user.
+
+    Query Parameters:
+        minutes (int): Size of the window, in minutes (default 15).
+
+    Returns:
+        Response: JSON {"since", "users": [{"id", "last_active"}]} if the requester is admin,
+                  otherwise an unauthorized error.
+    """
+    is_admin, error = verify_admin(user_id)
+    if error:
+        return error
+    if not is_admin:
+        return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
+    minutes = request.args.get("minutes", "15")
+    if not minutes.isdigit():
+        return make_response(jsonify({"error": "'minutes' must be a non-negative integer"}), 400)
+    since = int(time.time()) - int(minutes) * 60
+    return make_response(jsonify({
+        "since": since,
+        "users": [{"id": u, "last_active": t} for u, t in activity.active_since(since)]
+    }), 200)
 
 # retourne un utilisateur à partir de son ID
 @app.route("/<user_id>/users/<user_id_wanted>", methods=['GET'])
@@ -141,9 +824,9 @@ def get_user_by_id(user_id, user_id_wanted):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for user in users:
-        if str(user["id"]) == str(user_id_wanted):
-            return jsonify(user), 200
+    user = store.get(user_id_wanted)
+    if user is not None:
+        return json_response(store.encoded(user))
     return jsonify({"error": "User ID not found"}), 404
 
 # retourne un utilisateur à partir de son nom
@@ -172,15 +855,12 @@ def get_user_by_name(user_id):
 
     json_res = ""
     if request.args:
-        req = request.args
-        for user in users:
-            if str(user["name"]) == str(req["name"]):
-                json_res = user
+        json_res = store.find_by_name(request.args["name"])
 
     if not json_res:
         res = make_response(jsonify({"error": "User name not found"}), 500)
     else:
-        res = make_response(jsonify(json_res), 200)
+        res = json_response(store.encoded(json_res))
     return res
 
 # récupère les noms des utilisateurs qui ont une réservation d'un film pour une certaine date
@@ -192,11 +872,10 @@ def get_users_from_booking(user_id):
     Args:
         user_id (str): ID of the requesting user.
 
-    Request Body:
-        {
-            "date": "YYYY-MM-DD",
-            "movie": "movie_id"
-        }
+    Query Parameters:
+        date (str): Date of the booking (YYYYMMDD).
+        movie (str): ID of the booked movie.
+        (the former JSON body {"date": ..., "movie": ...} is still accepted)
 
     Returns:
         Response: JSON list of user names who booked the movie,
@@ -210,22 +889,33 @@ def get_users_from_booking(user_id):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    req = request.get_json()
-    date = req.get("date")
-    movie_id = req.get("movie")
+    # filtre en query params (cachable), le body JSON reste accepté pour compatibilité
+    req = request.get_json(silent=True) or {}
+    date = request.args.get("date", req.get("date"))
+    movie_id = request.args.get("movie", req.get("movie"))
+    if not date or not movie_id:
+        return make_response(jsonify({"error": "missing 'date' or 'movie' parameter"}), 400)
+
     user_list = []
-    r = requests.get(f"{BOOKING_URL}/{user_id}/bookings") # appele microservice de Booking
-    data = r.json()
-    
-    for b in data:
-        for d in b["dates"]:
-            if d["date"] == date:
-                for m in d["movies"]:
-                    if m == movie_id:
-                        name = next((u["name"] for u in users if u["id"] == b["userid"]), None)
-                        if name is None:
-                          return make_response(jsonify({"error": "The user does not exist"}), 404)
-                        user_list.append(name)
+    try:
+        r = booking_client.get(f"/{user_id}/bookings", call="all_bookings", stream=True) # appele microservice de Booking
+    except requests.exceptions.Timeout:
+        return make_response(jsonify({"error": "Booking service timed out"}), 504)
+    except requests.exceptions.RequestException:
+        return make_response(jsonify({"error": "Booking service unreachable"}), 503)
+    if r.status_code != 200:
+        r.close()
+        return make_response(jsonify({"error": "Unable to retrieve bookings"}), r.status_code)
+
+    # jointure par hachage : on filtre (date, movie) au fil du parsing et on résout le nom via l'index
+    with r:
+        for b in iter_json_array(r.iter_content(chunk_size=65536)):
+            for d in b["dates"]:
+                if d["date"] == date and movie_id in d["movies"]:
+                    user = store.get(b["userid"])
+                    if user is None:
+                        return make_response(jsonify({"error": "The user does not exist"}), 404)
+                    user_list.append(user["name"])
     return make_response(jsonify({
         "users": user_list
     }), 200)
@@ -257,12 +947,10 @@ def add_user(user_id, user_id_wanted):
 
     req = request.get_json()
 
-    for user in users:
-        if str(user["id"]) == str(user_id_wanted):
-            return make_response(jsonify({"error": "User ID already exists"}), 500)
+    if store.get(user_id_wanted) is not None:
+        return make_response(jsonify({"error": "User ID already exists"}), 500)
 
-    users.append(req)
-    write(users)
+    store.add(req)
     return make_response(jsonify({"message": "User added"}), 200)
 
 # modifie le nom de l'utilisateur à partir de son ID
@@ -288,11 +976,9 @@ def update_user_name(user_id, user_id_wanted, name):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for user in users:
-        if str(user["id"]) == str(user_id_wanted):
-            user["name"] = name
-            write(users)
-            return make_response(jsonify(user), 200)
+    user = store.update_name(user_id_wanted, name)
+    if user is not None:
+        return make_response(jsonify(user), 200)
 
     return make_response(jsonify({"error": "user ID not found"}), 500)
 
@@ -318,13 +1004,20 @@ def delete_user(user_id, user_id_wanted):
     if not is_admin:
         return make_response(jsonify({"error": "Unauthorized: admin access required"}), 403)
 
-    for user in users:
-        if str(user["id"]) == str(user_id_wanted):
-            users.remove(user)
-            write(users)
-            return make_response(jsonify(user), 200)
+    user = store.delete(user_id_wanted)
+    if user is not None:
+        return make_response(jsonify(user), 200)
 
     return make_response(jsonify({"error": "user ID not found"}), 500)
 
 if __name__ == "__main__":
-    app.run(host=HOST, port=PORT, debug=True)
+    # migration unique users.json -> SQLite : python user.py migrate
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        count = SqliteStore(SQLITE_PATH).migrate(JSON_PATH)
+        print("%d users migrated to %s" % (count, SQLITE_PATH))
+        sys.exit(0)
+    if WORKERS > 1:
+        print("Serving with %d workers" % WORKERS)
+        serve_prefork(app, HOST, PORT, WORKERS)
+    else:
+        app.run(host=HOST, port=PORT, debug=True)